@@ -0,0 +1,318 @@
+import codecs
+import queue
+import threading
+
+try:
+    import llama_cpp
+except ImportError:
+    llama_cpp = None
+
+# Sequence ids reserved for shared prompt prefixes; generations use the ids after them
+PREFIX_SLOTS = 4
+
+_END = object()
+
+
+def _kv_seq_rm(ctx, seq_id):
+    if hasattr(llama_cpp, 'llama_memory_seq_rm'):
+        llama_cpp.llama_memory_seq_rm(llama_cpp.llama_get_memory(ctx), seq_id, -1, -1)
+    elif hasattr(llama_cpp, 'llama_kv_self_seq_rm'):
+        llama_cpp.llama_kv_self_seq_rm(ctx, seq_id, -1, -1)
+    else:
+        llama_cpp.llama_kv_cache_seq_rm(ctx, seq_id, -1, -1)
+
+
+def _kv_seq_cp(ctx, source, destination):
+    if hasattr(llama_cpp, 'llama_memory_seq_cp'):
+        llama_cpp.llama_memory_seq_cp(llama_cpp.llama_get_memory(ctx), source, destination, -1, -1)
+    elif hasattr(llama_cpp, 'llama_kv_self_seq_cp'):
+        llama_cpp.llama_kv_self_seq_cp(ctx, source, destination, -1, -1)
+    else:
+        llama_cpp.llama_kv_cache_seq_cp(ctx, source, destination, -1, -1)
+
+
+class _Sequence:
+    """One generation running inside the shared context."""
+
+    def __init__(self, prefix, suffix, max_tokens, temperature, top_p, stop, grammar):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.stop = [s for s in (stop or []) if s]
+        self.grammar = grammar
+        self.seq_id = None
+        self.sampler = None
+        self.pending = []  # prompt tokens not evaluated yet
+        self.n_past = 0
+        self.next_token = None
+        self.generated = 0
+        self.text = ''
+        self.emitted = 0
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self.chunks = queue.Queue()
+        self.cancelled = threading.Event()
+        self.error = None
+
+
+class BatchedEngine:
+    """
+    Continuous batching for concurrent local generations.
+
+    All generations share one llama.cpp context, each as its own sequence.
+    A single engine thread builds one batch per step with the next token of
+    every sequence that is decoding plus prompt tokens of sequences that just
+    joined, so one llama_decode call advances all of them together. Finished
+    sequences are evicted from the KV cache right away and waiting requests
+    take their place mid-flight.
+
+    Prompt prefixes (the static instructions) are evaluated once into a
+    reserved sequence and copied to each new sequence, which costs no extra
+    KV memory.
+    """
+
+    def __init__(self, llm, max_sequences, n_ctx_per_sequence, n_threads, n_batch=512):
+        self.llm = llm
+        self.max_sequences = max_sequences
+        self.n_ctx_per_sequence = n_ctx_per_sequence
+        self.n_batch = n_batch
+        self._model = llm._model.model
+        self._vocab = llm._model.vocab
+
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx_per_sequence * max_sequences
+        params.n_batch = n_batch
+        params.n_ubatch = n_batch
+        params.n_seq_max = max_sequences + PREFIX_SLOTS
+        params.n_threads = n_threads
+        params.n_threads_batch = n_threads
+        if hasattr(params, 'kv_unified'):
+            # Prefix sharing copies cells between sequences, which needs one shared cache
+            params.kv_unified = True
+        init_context = getattr(llama_cpp, 'llama_init_from_model', None) or llama_cpp.llama_new_context_with_model
+        self._ctx = init_context(self._model, params)
+        if self._ctx is None:
+            raise RuntimeError("Failed to create the batched llama.cpp context")
+        self._batch = llama_cpp.llama_batch_init(n_batch, 0, 1)
+
+        self._prefixes = {}  # prefix text -> (slot, token count)
+        self._free_ids = list(range(PREFIX_SLOTS, PREFIX_SLOTS + max_sequences))
+        self._active = []
+        self._waiting = queue.Queue()
+        self._closed = False
+        self._retiring = False
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='local-batching', daemon=True)
+        self._thread.start()
+
+    def generate(self, prefix, suffix, max_tokens=None, temperature=0.7, top_p=0.9, stop=None, grammar=None, echo=False):
+        """
+        Yield the completion of prefix + suffix piece by piece, one item per
+        sampled token (possibly '' while a multi-byte character is incomplete).
+        Accepts the same keyword arguments as Llama.__call__ uses here.
+        """
+        sequence = _Sequence(prefix, suffix, max_tokens, temperature, top_p, stop, grammar)
+        self._waiting.put(sequence)
+        self._wakeup.set()
+        try:
+            while True:
+                item = sequence.chunks.get()
+                if item is _END:
+                    break
+                yield item
+            if sequence.error:
+                raise RuntimeError(sequence.error)
+        finally:
+            sequence.cancelled.set()
+            self._wakeup.set()
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        for sequence in self._active:
+            self._finish(sequence, error="Model unloaded")
+        self._release()
+
+    def retire(self):
+        """Let the generations already submitted finish, then free the context."""
+        self._retiring = True
+        self._wakeup.set()
+
+    def _release(self):
+        llama_cpp.llama_batch_free(self._batch)
+        llama_cpp.llama_free(self._ctx)
+
+    def _loop(self):
+        while not self._closed:
+            self._admit()
+            self._active = [s for s in self._active if not self._evict_cancelled(s)]
+            if self._retiring and not self._active and self._waiting.empty():
+                self._closed = True
+                self._release()
+                return
+            if not self._active:
+                self._wakeup.wait(timeout=1)
+                self._wakeup.clear()
+                continue
+            try:
+                self._step()
+            except Exception as e:
+                for sequence in self._active:
+                    self._finish(sequence, error=str(e))
+                self._active = []
+
+    def _admit(self):
+        while self._free_ids:
+            try:
+                sequence = self._waiting.get_nowait()
+            except queue.Empty:
+                return
+            if sequence.cancelled.is_set():
+                continue
+            try:
+                self._start(sequence, self._free_ids.pop(0))
+                self._active.append(sequence)
+            except Exception as e:
+                self._finish(sequence, error=str(e))
+
+    def _start(self, sequence, seq_id):
+        sequence.seq_id = seq_id
+        sequence.sampler = self._make_sampler(sequence)
+
+        shared = self._shared_prefix(sequence.prefix)
+        if shared:
+            slot, n_prefix = shared
+            _kv_seq_cp(self._ctx, slot, seq_id)
+            sequence.n_past = n_prefix
+            sequence.pending = self.llm.tokenize(sequence.suffix.encode('utf-8'), add_bos=False)
+        else:
+            sequence.pending = self.llm.tokenize((sequence.prefix + sequence.suffix).encode('utf-8'))
+        if sequence.n_past + len(sequence.pending) >= self.n_ctx_per_sequence:
+            raise ValueError("Prompt does not fit in the context window")
+
+    def _shared_prefix(self, prefix):
+        if prefix in self._prefixes:
+            return self._prefixes[prefix]
+        if not prefix or len(self._prefixes) >= PREFIX_SLOTS:
+            return None
+
+        slot = len(self._prefixes)
+        tokens = self.llm.tokenize(prefix.encode('utf-8'))
+        for start in range(0, len(tokens), self.n_batch):
+            self._batch.n_tokens = 0
+            for offset, token in enumerate(tokens[start:start + self.n_batch]):
+                self._add(token, start + offset, slot, False)
+            if llama_cpp.llama_decode(self._ctx, self._batch) != 0:
+                _kv_seq_rm(self._ctx, slot)
+                return None
+        self._prefixes[prefix] = (slot, len(tokens))
+        return self._prefixes[prefix]
+
+    def _make_sampler(self, sequence):
+        sampler = llama_cpp.llama_sampler_chain_init(llama_cpp.llama_sampler_chain_default_params())
+        if sequence.grammar is not None:
+            llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_grammar(
+                self._vocab, sequence.grammar._grammar.encode('utf-8'), sequence.grammar._root.encode('utf-8')
+            ))
+        llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_top_p(sequence.top_p, 1))
+        llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_temp(sequence.temperature))
+        llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_dist(llama_cpp.LLAMA_DEFAULT_SEED))
+        return sampler
+
+    def _add(self, token, pos, seq_id, logits):
+        i = self._batch.n_tokens
+        self._batch.token[i] = token
+        self._batch.pos[i] = pos
+        self._batch.n_seq_id[i] = 1
+        self._batch.seq_id[i][0] = seq_id
+        self._batch.logits[i] = logits
+        self._batch.n_tokens += 1
+
+    def _step(self):
+        self._batch.n_tokens = 0
+        sampled = []
+
+        # Sequences already generating contribute one token each
+        for sequence in self._active:
+            if sequence.next_token is not None:
+                sampled.append((sequence, self._batch.n_tokens))
+                self._add(sequence.next_token, sequence.n_past, sequence.seq_id, True)
+                sequence.n_past += 1
+                sequence.next_token = None
+
+        # The rest of the batch goes to prompts of sequences that joined
+        for sequence in self._active:
+            budget = self.n_batch - self._batch.n_tokens
+            if not sequence.pending or budget <= 0:
+                continue
+            chunk, sequence.pending = sequence.pending[:budget], sequence.pending[budget:]
+            for offset, token in enumerate(chunk):
+                last = not sequence.pending and offset == len(chunk) - 1
+                if last:
+                    sampled.append((sequence, self._batch.n_tokens))
+                self._add(token, sequence.n_past + offset, sequence.seq_id, last)
+            sequence.n_past += len(chunk)
+
+        if llama_cpp.llama_decode(self._ctx, self._batch) != 0:
+            raise RuntimeError("llama_decode failed, the batched context is full")
+
+        for sequence, index in sampled:
+            token = llama_cpp.llama_sampler_sample(sequence.sampler, self._ctx, index)
+            self._accept(sequence, token)
+
+        self._active = [s for s in self._active if s.seq_id is not None]
+
+    def _accept(self, sequence, token):
+        if self._is_end_of_generation(token):
+            self._finish(sequence)
+            return
+
+        sequence.generated += 1
+        piece = sequence.decoder.decode(self.llm.detokenize([token]))
+        sequence.text += piece
+
+        for stop in sequence.stop:
+            position = sequence.text.find(stop)
+            if position != -1:
+                sequence.text = sequence.text[:position]
+                self._finish(sequence)
+                return
+
+        # Hold back text that could still turn out to be the start of a stop sequence
+        holdback = max((len(s) - 1 for s in sequence.stop), default=0)
+        ready = max(sequence.emitted, len(sequence.text) - holdback)
+        sequence.chunks.put(sequence.text[sequence.emitted:ready])
+        sequence.emitted = ready
+
+        out_of_tokens = sequence.max_tokens is not None and sequence.generated >= sequence.max_tokens
+        if out_of_tokens or sequence.n_past + 1 >= self.n_ctx_per_sequence:
+            self._finish(sequence)
+        else:
+            sequence.next_token = token
+
+    def _is_end_of_generation(self, token):
+        if hasattr(llama_cpp, 'llama_vocab_is_eog'):
+            return llama_cpp.llama_vocab_is_eog(self._vocab, token)
+        return token == self.llm.token_eos()
+
+    def _evict_cancelled(self, sequence):
+        if sequence.cancelled.is_set():
+            self._finish(sequence)
+            return True
+        return False
+
+    def _finish(self, sequence, error=None):
+        if sequence.seq_id is not None:
+            _kv_seq_rm(self._ctx, sequence.seq_id)
+            self._free_ids.append(sequence.seq_id)
+            sequence.seq_id = None
+        if sequence.sampler is not None:
+            llama_cpp.llama_sampler_free(sequence.sampler)
+            sequence.sampler = None
+        if sequence.emitted < len(sequence.text):
+            sequence.chunks.put(sequence.text[sequence.emitted:])
+            sequence.emitted = len(sequence.text)
+        sequence.error = error
+        sequence.chunks.put(_END)
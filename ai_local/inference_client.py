@@ -0,0 +1,141 @@
+import json
+import socket
+
+from rest import telemetry
+
+from .scheduler import InferenceQueueFull, INTERACTIVE
+
+
+class InferenceServerError(Exception):
+    """Raised when the inference server can't be reached or a request fails there."""
+
+
+class RemoteLocalModel:
+    """
+    Talks to the inference server (run_inference_server) over its Unix socket.
+
+    It has the same generation methods as LocalModel, so get_local_model() can
+    return it when LOCAL_INFERENCE_SOCKET is set and the web workers don't each
+    keep their own copy of the model. Requests carry a scheduler priority,
+    which the server uses to order work coming from all the workers.
+    """
+
+    def __init__(self, socket_path, priority=INTERACTIVE):
+        self.socket_path = socket_path
+        self.model_path = socket_path
+        self.priority = priority
+        self.last_latency = None
+        self.last_model_version = None
+
+    def with_priority(self, priority):
+        return RemoteLocalModel(self.socket_path, priority)
+
+    @property
+    def model(self):
+        """Truthy when the server has a model it can generate with, like LocalModel.model."""
+        try:
+            return self if self.status().get('model_available') else None
+        except InferenceServerError:
+            return None
+
+    @property
+    def model_version(self):
+        """Version of the model the server has loaded, None if none is"""
+        status = self.status()
+        return status['lifecycle']['model_version'] if status['model_loaded'] else None
+
+    @property
+    def generation_model_version(self):
+        """The model version behind the last result this client received"""
+        return self.last_model_version
+
+    def _connect(self):
+        try:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.connect(self.socket_path)
+        except OSError as e:
+            raise InferenceServerError(f"Inference server not reachable at {self.socket_path}: {e}")
+        return connection
+
+    def _messages(self, payload):
+        """Send one request and yield each JSON line the server answers with."""
+        payload.setdefault('priority', self.priority)
+        with self._connect() as connection, connection.makefile('rwb') as stream:
+            stream.write(json.dumps(payload).encode() + b'\n')
+            stream.flush()
+            for line in stream:
+                message = json.loads(line)
+                if 'error' in message:
+                    if message.get('error_type') == 'queue_full':
+                        raise InferenceQueueFull(message['retry_after'])
+                    if message.get('error_type') == 'invalid_model_path':
+                        raise ValueError(message['error'])
+                    raise InferenceServerError(message['error'])
+                if 'result' in message or message.get('done'):
+                    self.last_latency = message.get('latency')
+                    self.last_model_version = message.get('model_version')
+                    # Token counts from the server count towards this process's generation
+                    telemetry.add_usage(**message.get('usage') or {})
+                    yield message
+                    return
+                yield message
+        raise InferenceServerError("Inference server closed the connection without a result")
+
+    def request(self, method, **params):
+        for message in self._messages(dict(params, method=method)):
+            if 'result' in message:
+                return message['result']
+
+    def generate_plan(self, prompt, fallback=True):
+        try:
+            return self.request('generate_plan', prompt=prompt, fallback=fallback)
+        except InferenceServerError as e:
+            if not fallback:
+                raise
+            print(f"Error generating plan with the inference server: {e}")
+            from .services import generate_fallback_plan
+            return generate_fallback_plan()
+
+    def generate_json(self, prompt, schema):
+        # Schemas are sent by name and looked up in rest.schemas on the server
+        return self.request('generate_json', prompt=prompt, schema=schema.__name__)
+
+    def stream_plan(self, prompt):
+        for message in self._messages({'method': 'stream_plan', 'prompt': prompt}):
+            if 'chunk' in message:
+                yield message['chunk']
+
+    def status(self):
+        return self.request('status')
+
+    def reload(self, model_path=None):
+        return self.request('reload', model_path=model_path)
+
+
+class RemoteScheduler:
+    """
+    Stands in for InferenceScheduler in the web workers when the inference
+    server is used. Queueing happens in the server, so this just hands each
+    call a RemoteLocalModel that sends the requested priority along.
+    """
+
+    def __init__(self, socket_path):
+        self.model = RemoteLocalModel(socket_path)
+
+    def run(self, fn, priority=INTERACTIVE, timeout=None):
+        return fn(self.model.with_priority(priority))
+
+    def stream(self, fn, priority=INTERACTIVE):
+        return fn(self.model.with_priority(priority))
+
+    def retry_after(self):
+        return self.stats().get('retry_after', 1)
+
+    def is_full(self):
+        try:
+            return self.stats().get('queue_full', False)
+        except InferenceServerError:
+            return False
+
+    def stats(self):
+        return self.model.status()['scheduler']
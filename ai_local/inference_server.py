@@ -0,0 +1,167 @@
+import json
+import os
+import socketserver
+import time
+from collections import deque
+
+from rest import schemas
+from rest.telemetry import collect_usage
+
+from .scheduler import InferenceQueueFull, PRIORITY_NAMES, INTERACTIVE
+from .services import LocalModel, build_local_scheduler, local_model_status, resolve_model_path
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Owns the local model on behalf of every web worker.
+
+    Each worker connects over a Unix socket and sends one JSON request per
+    connection (see RemoteLocalModel). Requests from all workers go into the
+    same priority scheduler, so the model is loaded once and its replicas are
+    kept busy however many workers there are. Every response carries the
+    request's queue wait and run time.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, socket_path, model_path):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _InferenceHandler)
+        self.socket_path = socket_path
+        self.model = LocalModel(model_path)
+        self.scheduler = build_local_scheduler(self.model)
+        self._latencies = {}
+        self.started_at = time.time()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def record(self, method, priority, latency):
+        self._latencies.setdefault(method, deque(maxlen=200)).append(latency)
+        print(
+            f"[inference] {method} priority={PRIORITY_NAMES.get(priority, priority)} "
+            f"wait={latency['wait_seconds']:.3f}s run={latency['run_seconds']:.3f}s"
+        )
+
+    def reload(self, model_name=None):
+        """Hot-swap the model of every replica, see ModelLifecycle.reload() and resolve_model_path()"""
+        model_path = resolve_model_path(model_name)
+        replicas = {id(replica): replica for replica in self.scheduler.replicas}
+        return any([replica.reload(model_path) for replica in replicas.values()])
+
+    def status(self):
+        status = local_model_status(self.model, self.scheduler)
+        status['server'] = {
+            'socket': self.socket_path,
+            'uptime_seconds': round(time.time() - self.started_at),
+            'latency': {method: _summarize(list(samples)) for method, samples in self._latencies.items()},
+        }
+        return status
+
+
+def _summarize(samples):
+    totals = sorted(sample['total_seconds'] for sample in samples)
+    return {
+        'requests': len(samples),
+        'avg_wait_seconds': round(sum(s['wait_seconds'] for s in samples) / len(samples), 3),
+        'avg_run_seconds': round(sum(s['run_seconds'] for s in samples) / len(samples), 3),
+        'p50_total_seconds': round(totals[len(totals) // 2], 3),
+        'p95_total_seconds': round(totals[min(len(totals) - 1, int(len(totals) * 0.95))], 3),
+    }
+
+
+def _usage_message(usage):
+    return {
+        'prompt_tokens': usage.prompt_tokens,
+        'output_tokens': usage.output_tokens,
+        'time_to_first_token': usage.time_to_first_token,
+    }
+
+
+class _InferenceHandler(socketserver.StreamRequestHandler):
+
+    def _send(self, message):
+        self.wfile.write(json.dumps(message).encode() + b'\n')
+        self.wfile.flush()
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            self._send({'error': 'Invalid request', 'error_type': 'error'})
+            return
+
+        method = request.get('method')
+        priority = request.get('priority', INTERACTIVE)
+        try:
+            if method == 'status':
+                self._send({'result': self.server.status()})
+            elif method == 'reload':
+                try:
+                    self._send({'result': self.server.reload(request.get('model_path'))})
+                except ValueError as e:
+                    self._send({'error': str(e), 'error_type': 'invalid_model_path'})
+            elif method == 'generate_plan':
+                prompt, fallback = request['prompt'], request.get('fallback', True)
+                self._run(method, priority, lambda model: model.generate_plan(prompt, fallback=fallback))
+            elif method == 'generate_json':
+                prompt, schema = request['prompt'], getattr(schemas, request['schema'])
+                self._run(method, priority, lambda model: model.generate_json(prompt, schema))
+            elif method == 'stream_plan':
+                self._stream(priority, request['prompt'])
+            else:
+                self._send({'error': f'Unknown method {method}', 'error_type': 'error'})
+        except InferenceQueueFull as e:
+            self._send({'error': str(e), 'error_type': 'queue_full', 'retry_after': e.retry_after})
+        except Exception as e:
+            self._send({'error': str(e), 'error_type': 'error'})
+
+    def _run(self, method, priority, fn):
+        queued = time.monotonic()
+        timing = {}
+
+        def job(model):
+            timing['started'] = time.monotonic()
+            with collect_usage() as usage:
+                result = fn(model)
+            # Read on the worker thread, where the generation ran
+            return result, model.generation_model_version, usage
+
+        result, model_version, usage = self.server.scheduler.run(job, priority)
+        finished = time.monotonic()
+        latency = {
+            'wait_seconds': timing['started'] - queued,
+            'run_seconds': finished - timing['started'],
+            'total_seconds': finished - queued,
+        }
+        self.server.record(method, priority, latency)
+        self._send({
+            'result': result, 'latency': latency, 'model_version': model_version, 'usage': _usage_message(usage),
+        })
+
+    def _stream(self, priority, prompt):
+        queued = time.monotonic()
+        first_chunk = None
+        with collect_usage() as usage:
+            # The scheduler runs the stream in this context, so its usage is collected here
+            chunks = self.server.scheduler.stream(lambda model: model.stream_plan(prompt), priority)
+        for chunk in chunks:
+            if first_chunk is None:
+                first_chunk = time.monotonic()
+            self._send({'chunk': chunk})
+        finished = time.monotonic()
+        # For streams, the wait is the time until the first chunk arrived
+        first_chunk = first_chunk or finished
+        latency = {
+            'wait_seconds': first_chunk - queued,
+            'run_seconds': finished - first_chunk,
+            'total_seconds': finished - queued,
+        }
+        self.server.record('stream_plan', priority, latency)
+        self._send({
+            'done': True, 'latency': latency, 'model_version': self.server.model.model_version or 'fallback',
+            'usage': _usage_message(usage),
+        })
@@ -0,0 +1,272 @@
+import gc
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from llama_cpp import Llama
+except ImportError:
+    Llama = None
+
+
+def default_thread_count(replicas=1):
+    """Split the CPUs this process may run on between the model replicas."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(1, cpus // max(1, replicas))
+
+
+def resident_memory_bytes():
+    """Current resident set size of this process, or None if it can't be read."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS, but the best available outside Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+def model_file_version(model_path):
+    """A short identifier for the GGUF file currently at `model_path`."""
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return None
+    digest = hashlib.sha1(f'{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()[:10]
+    return f'{os.path.basename(model_path)}@{digest}'
+
+
+class ModelLifecycle:
+    """
+    Owns one llama.cpp model and decides when it is in memory.
+
+    The GGUF file is only loaded on first use and is memory-mapped, so several
+    processes (or replicas) serving the same file share the page cache instead
+    of each holding a private copy. When `idle_unload_seconds` is set, a
+    background thread drops the model once nothing has used it for that long;
+    the next request loads it again.
+
+    reload() swaps in new weights without a restart: the new model is loaded
+    and warmed up in the background and then replaces the current one, while
+    generations that already hold the old model finish on it.
+    """
+
+    PROBE_PROMPT = "Reply with OK."
+
+    def __init__(self, model_path, idle_unload_seconds=0, n_ctx=4096, n_threads=None, on_unload=None,
+                 draft_model=None, on_swap=None):
+        self.model_path = model_path
+        self.draft_model = draft_model
+        self.on_swap = on_swap
+        self.model_version = None
+        self.idle_unload_seconds = idle_unload_seconds
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads or default_thread_count()
+        self.on_unload = on_unload
+        self._model = None
+        self._lock = threading.RLock()
+        self._in_use = 0
+        self._watcher = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.last_used_at = None
+        self.load_error = None
+        self.unload_count = 0
+        self._reload_lock = threading.Lock()
+        self.reloading = False
+        self.last_reload = None
+        self._file_watcher = None
+
+    @property
+    def is_loaded(self):
+        return self._model is not None
+
+    def get(self):
+        """Return the model, loading it first if needed. None if it can't be loaded."""
+        with self._lock:
+            if self._model is None:
+                self._load()
+            self.last_used_at = time.time()
+            return self._model
+
+    @contextmanager
+    def use(self):
+        """Hold the model for the duration of a generation so it isn't unloaded mid-request."""
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield self.get()
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                self.last_used_at = time.time()
+
+    def _load(self):
+        if Llama is None:
+            return
+        if not os.path.exists(self.model_path):
+            print(f"Model file not found at {self.model_path}")
+            print("Please place your GGUF model file (e.g. DeepSeek_R1_Distill_Qwen_1_5B.gguf) there")
+            return
+
+        try:
+            started = time.perf_counter()
+            self._model = self._create(self.model_path)
+            self.model_version = self._model.model_version
+            self.load_seconds = time.perf_counter() - started
+            self.loaded_at = time.time()
+            self.load_error = None
+            print(f"Model loaded successfully in {self.load_seconds:.1f}s")
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            self.load_error = str(e)
+            self._model = None
+            return
+
+        if self.idle_unload_seconds and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_idle, name='local-model-idle', daemon=True)
+            self._watcher.start()
+
+    def _create(self, model_path):
+        print(f"Loading model from {model_path}")
+        model = Llama(
+            model_path=model_path,
+            n_ctx=self.n_ctx,  # Context window size
+            n_threads=self.n_threads,
+            n_gpu_layers=-1,  # Use GPU if available, -1 for all layers
+            use_mmap=True,  # Share the weights through the page cache
+            draft_model=self.draft_model,  # Speculative decoding, see ai_local/speculative.py
+            verbose=False
+        )
+        # Generations record this so plans can be traced back to the weights that made them
+        model.model_version = model_file_version(model_path)
+        return model
+
+    def reload(self, model_path=None):
+        """
+        Start loading `model_path` (default: the current path, e.g. after the
+        file was replaced) in the background. Returns False if a reload is
+        already running.
+        """
+        if Llama is None or not self._reload_lock.acquire(blocking=False):
+            return False
+        self.reloading = True
+        threading.Thread(
+            target=self._reload, args=(model_path or self.model_path,), name='local-model-reload', daemon=True
+        ).start()
+        return True
+
+    def _reload(self, model_path):
+        started = time.perf_counter()
+        try:
+            new_model = self._create(model_path)
+            # Pay the first-request costs now rather than on a user's request
+            new_model(self.PROBE_PROMPT, max_tokens=4)
+        except Exception as e:
+            print(f"Error reloading model from {model_path}: {e}")
+            self.last_reload = {'model_path': model_path, 'ok': False, 'error': str(e), 'at': time.time()}
+            self.reloading = False
+            self._reload_lock.release()
+            return
+
+        with self._lock:
+            old_model, self._model = self._model, new_model
+            self.model_path = model_path
+            self.model_version = new_model.model_version
+            self.load_seconds = time.perf_counter() - started
+            self.loaded_at = self.last_used_at = time.time()
+            self.load_error = None
+            if self.on_swap:
+                self.on_swap(old_model, new_model)
+        # Generations still using the old model keep it alive until they finish
+        del old_model
+        print(f"Swapped in model {self.model_version} after {self.load_seconds:.1f}s")
+        self.last_reload = {'model_path': model_path, 'ok': True, 'model_version': self.model_version, 'at': time.time()}
+        self.reloading = False
+        self._reload_lock.release()
+
+        if self.idle_unload_seconds and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_idle, name='local-model-idle', daemon=True)
+            self._watcher.start()
+
+    def watch_file(self, interval):
+        """Reload whenever the model file changes, checking every `interval` seconds."""
+        if self._file_watcher is None:
+            self._file_watcher = threading.Thread(
+                target=self._watch_file, args=(interval,), name='local-model-watch', daemon=True
+            )
+            self._file_watcher.start()
+
+    def _watch_file(self, interval):
+        seen = model_file_version(self.model_path)
+        while True:
+            time.sleep(interval)
+            current = model_file_version(self.model_path)
+            if current == seen:
+                continue
+            # Wait until the file stops changing so a copy in progress isn't loaded
+            time.sleep(interval)
+            if model_file_version(self.model_path) != current:
+                continue
+            seen = current
+            # A model that was never loaded will simply load the new file on first use
+            if self.is_loaded and current != self.model_version:
+                print(f"Model file {self.model_path} changed, reloading")
+                self.reload()
+
+    def unload(self):
+        """Release the model now. Returns False if a generation is still using it."""
+        with self._lock:
+            if self._model is None or self._in_use:
+                return False
+            model, self._model = self._model, None
+            self.loaded_at = None
+            self.unload_count += 1
+            if self.on_unload:
+                self.on_unload()
+        if hasattr(model, 'close'):
+            model.close()
+        del model
+        gc.collect()
+        print(f"Unloaded idle model {self.model_path}")
+        return True
+
+    def _watch_idle(self):
+        interval = max(1, min(60, self.idle_unload_seconds / 4))
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                idle = self._model is not None and not self._in_use and \
+                    time.time() - (self.last_used_at or 0) >= self.idle_unload_seconds
+            if idle:
+                self.unload()
+
+    def status(self):
+        return {
+            'loaded': self.is_loaded,
+            'in_use': self._in_use,
+            'load_seconds': round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            'loaded_at': self.loaded_at,
+            'last_used_at': self.last_used_at,
+            'idle_unload_seconds': self.idle_unload_seconds,
+            'unload_count': self.unload_count,
+            'n_ctx': self.n_ctx,
+            'n_threads': self.n_threads,
+            'resident_memory_bytes': resident_memory_bytes(),
+            'load_error': self.load_error,
+            'model_path': self.model_path,
+            'model_version': self.model_version,
+            'reloading': self.reloading,
+            'last_reload': self.last_reload,
+        }
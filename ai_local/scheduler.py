@@ -0,0 +1,185 @@
+import contextvars
+import itertools
+import queue
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
+
+# Priority classes, lowest value runs first
+INTERACTIVE = 0  # a user waiting on me_plans
+BATCH = 1        # background pre-generation
+TEST = 2         # the ai_local test_generation endpoint
+
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch', TEST: 'test'}
+
+_STREAM_END = object()
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the scheduler can't accept more work."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Local inference queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferenceScheduler:
+    """
+    Serializes access to local model replicas.
+
+    A llama.cpp context can only run one generation at a time, so every call
+    goes through a bounded priority queue. Each replica has its own worker
+    thread that takes the most urgent job and runs it against its model.
+    When the queue is full, submit() fails immediately with InferenceQueueFull
+    instead of letting the request wait indefinitely.
+    """
+
+    def __init__(self, replicas, max_queue):
+        """`replicas` is a list of models, one worker thread is started for each."""
+        self.replicas = list(replicas)
+        self.max_queue = max_queue
+        self._queue = queue.PriorityQueue(maxsize=max_queue)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._depth = {priority: 0 for priority in PRIORITY_NAMES}
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_times = {priority: deque(maxlen=200) for priority in PRIORITY_NAMES}
+        self._service_times = deque(maxlen=200)
+
+        for index, model in enumerate(self.replicas):
+            threading.Thread(
+                target=self._worker, args=(model,), name=f'local-inference-{index}', daemon=True
+            ).start()
+
+    def submit(self, fn, priority=INTERACTIVE):
+        """
+        Queues `fn(model)` to run on the next free replica and returns a Future.
+        Raises InferenceQueueFull if the queue is at capacity.
+        """
+        future = Future()
+        with self._lock:
+            self._depth[priority] += 1
+        try:
+            # The job runs in the caller's context, e.g. so it reports to the caller's telemetry
+            context = contextvars.copy_context()
+            self._queue.put_nowait((priority, next(self._sequence), time.monotonic(), context, fn, future))
+        except queue.Full:
+            with self._lock:
+                self._depth[priority] -= 1
+                self._rejected += 1
+            raise InferenceQueueFull(self.retry_after())
+        return future
+
+    def run(self, fn, priority=INTERACTIVE, timeout=None):
+        """Queues `fn(model)` and waits for its result."""
+        return self.submit(fn, priority).result(timeout=timeout)
+
+    def stream(self, fn, priority=INTERACTIVE):
+        """
+        Queues a generator function `fn(model)` and yields its items as the
+        worker produces them. Closing the returned generator stops the work,
+        and so does dropping it, even before it was first iterated (e.g. a
+        client that disconnected before the response body was sent).
+        """
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+
+        def produce(model):
+            if cancelled.is_set():
+                return
+            generator = fn(model)
+            try:
+                for chunk in generator:
+                    if cancelled.is_set():
+                        break
+                    chunks.put(chunk)
+            finally:
+                chunks.put(_STREAM_END)
+                if hasattr(generator, 'close'):
+                    generator.close()
+
+        future = self.submit(produce, priority)
+
+        def cancel():
+            cancelled.set()
+            # Still queued: the worker skips it
+            future.cancel()
+
+        def consume():
+            try:
+                while True:
+                    chunk = chunks.get()
+                    if chunk is _STREAM_END:
+                        break
+                    yield chunk
+                # Surface any error raised while generating
+                future.result()
+            finally:
+                cancel()
+
+        # A generator that is never started doesn't run its finally, so the
+        # cancel is also tied to the generator object being garbage collected
+        stream = consume()
+        weakref.finalize(stream, cancel)
+        return stream
+
+    def _worker(self, model):
+        while True:
+            priority, _, queued_at, context, fn, future = self._queue.get()
+            with self._lock:
+                self._depth[priority] -= 1
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            started = time.monotonic()
+            with self._lock:
+                self._running += 1
+                self._wait_times[priority].append(started - queued_at)
+            try:
+                future.set_result(context.run(fn, model))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._service_times.append(time.monotonic() - started)
+
+    def retry_after(self):
+        """Rough number of seconds until the queue has room again."""
+        with self._lock:
+            service_times = list(self._service_times)
+        average = sum(service_times) / len(service_times) if service_times else 30
+        return max(1, int(average * max(1, self._queue.qsize()) / max(1, len(self.replicas))))
+
+    def is_full(self):
+        return self._queue.full()
+
+    def stats(self):
+        with self._lock:
+            wait_times = {PRIORITY_NAMES[p]: list(times) for p, times in self._wait_times.items()}
+            depth = {PRIORITY_NAMES[p]: d for p, d in self._depth.items()}
+            stats = {
+                'replicas': len(self.replicas),
+                'max_queue': self.max_queue,
+                'queue_depth': sum(depth.values()),
+                'queue_depth_by_priority': depth,
+                'running': self._running,
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+        stats['queue_full'] = self.is_full()
+        stats['retry_after'] = self.retry_after()
+        stats['wait_seconds'] = {
+            name: {
+                'samples': len(times),
+                'avg': round(sum(times) / len(times), 3) if times else None,
+                'max': round(max(times), 3) if times else None,
+            }
+            for name, times in wait_times.items()
+        }
+        return stats
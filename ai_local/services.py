@@ -1,13 +1,27 @@
 import os
 import json
+import threading
+import time
+from collections import deque
 from datetime import date, timedelta
+from functools import lru_cache
 from django.conf import settings
-from django.db import transaction
-from rest.models import Profile, FitnessPlan, WorkoutDay, Exercise, NutritionDay, Meal
-from rest.schemas import GeneratedPlanSchema
+from rest.models import Profile
+from rest.plan_fanout import generate_plan_fanout
+from rest.plan_persistence import save_generated_plan
+from rest.plan_recovery import load_plan_text
+from rest.plan_wire import use_compact_schema, expand_plan_text
+from rest.rule_engine import generate_rule_plan, RULE_ENGINE_VERSION
+from rest import telemetry
+from rest.schemas import GeneratedPlanSchema, CompactPlanSchema
+from .batching import BatchedEngine
+from .inference_client import InferenceServerError, RemoteLocalModel, RemoteScheduler
+from .lifecycle import ModelLifecycle, default_thread_count
+from .scheduler import InferenceScheduler, INTERACTIVE
+from .speculative import PlanLookupDecoding, SmallModelDraft
 
 try:
-    from llama_cpp import Llama
+    from llama_cpp import LlamaGrammar
     LLAMA_CPP_AVAILABLE = True
 except ImportError:
     LLAMA_CPP_AVAILABLE = False
@@ -15,65 +29,29 @@ except ImportError:
     print("Install with: pip install llama-cpp-python")
 
 
-class LocalModel:
-    def __init__(self, model_path):
-        self.model_path = model_path
-        self.model = None
-        if LLAMA_CPP_AVAILABLE:
-            self.load_model()
-
-    def load_model(self):
-        """Load the GGUF model using llama-cpp-python"""
-        if not os.path.exists(self.model_path):
-            print(f"Model file not found at {self.model_path}")
-            print("Please place your DeepSeek_R1_Distill_Qwen_1_5B.gguf model file in the base directory")
-            return
-        
-        try:
-            print(f"Loading model from {self.model_path}")
-            self.model = Llama(
-                model_path=self.model_path,
-                n_ctx=4096,  # Context window size
-                n_threads=4,  # Number of threads to use
-                n_gpu_layers=-1,  # Use GPU if available, -1 for all layers
-                verbose=False
-            )
-            print("Model loaded successfully")
-        except Exception as e:
-            print(f"Error loading model: {e}")
-            self.model = None
-
-    def generate_plan(self, prompt):
-        """Generate a fitness plan using the local model"""
-        if not self.model:
-            print("Model not loaded. Using fallback plan generation.")
-            return self._generate_fallback_plan()
-        
-        try:
-            # Create a structured prompt for JSON output
-            full_prompt = f"""{prompt}
-
-Please respond with a valid JSON object following this exact structure:
-{{
+# Static instructions shared by every plan request. They come before the
+# user-specific text so the evaluated prefix can be reused between requests.
+PLAN_PROMPT_PREFIX = """Please respond with a valid JSON object following this exact structure:
+{
     "workout_days": [
-        {{
+        {
             "day_of_week": 1,
             "title": "Upper Body Strength",
             "is_rest_day": false,
             "description": "Focus on upper body exercises",
             "exercises": [
-                {{
+                {
                     "name": "Push-ups",
                     "sets": 3,
                     "reps": "10-15",
                     "rest_period_seconds": 60,
                     "notes": "Keep your body straight"
-                }}
+                }
             ]
-        }}
+        }
     ],
     "nutrition_days": [
-        {{
+        {
             "day_of_week": 1,
             "target_calories": 2000,
             "target_protein_grams": 120,
@@ -81,7 +59,7 @@ Please respond with a valid JSON object following this exact structure:
             "target_fats_grams": 70,
             "notes": "Stay hydrated",
             "meals": [
-                {{
+                {
                     "meal_type": "breakfast",
                     "description": "Oatmeal with banana",
                     "calories": 400,
@@ -89,43 +67,312 @@ Please respond with a valid JSON object following this exact structure:
                     "carbs_grams": 60.0,
                     "fats_grams": 8.0,
                     "portion_size": "1 bowl"
-                }}
+                }
             ]
-        }}
+        }
     ]
-}}
+}
+"""
 
-JSON Response:"""
-            
-            # Generate response
-            response = self.model(
-                full_prompt,
-                max_tokens=2048,
-                temperature=0.7,
-                top_p=0.9,
-                echo=False,
-                stop=["\n\n", "Human:", "Assistant:"],
-            )
-            
-            response_text = response['choices'][0]['text'].strip()
+# The same instructions for PLAN_WIRE_SCHEMA = 'compact' (see rest/plan_wire.py).
+# Rest days are only {"d": N, "rd": true}, meal types are b/l/d/s.
+COMPACT_PLAN_PROMPT_PREFIX = """Please respond with a valid JSON object following this exact structure:
+{"w":[{"d":1,"rd":false,"t":"Upper Body Strength","ds":"Focus on upper body exercises","ex":[{"n":"Push-ups","s":3,"r":"10-15","rp":60,"no":"Keep your body straight"}]},{"d":2,"rd":true}],
+"n":[{"d":1,"c":2000,"p":120,"cb":200,"f":70,"no":"Stay hydrated","ml":[{"m":"b","ds":"Oatmeal with banana","c":400,"p":15.0,"cb":60.0,"f":8.0,"ps":"1 bowl"}]}]}
+Keys: w workout days, n nutrition days, d day of week (1 Monday to 7 Sunday), rd rest day, t title,
+ds description, ex exercises (n name, s sets, r reps, rp rest seconds, no notes), c calories,
+p protein g, cb carbs g, f fats g, w water litres, no notes, ml meals (m meal type: b breakfast,
+l lunch, d dinner, s snack; ps portion size). A rest day is only {"d":N,"rd":true}.
+"""
+
+
+class LocalModel:
+    def __init__(self, model_path):
+        self.model_path = model_path
+        # Saved llama.cpp states keyed by model version and the prompt prefix they were evaluated from
+        self._prefix_states = {}
+        self.prefix_eval_seconds = None
+        self._ttft = {'cached': deque(maxlen=50), 'uncached': deque(maxlen=50)}
+        # GBNF grammars compiled from Pydantic schemas, keyed by schema class
+        self._grammars = {}
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        # Which model version produced the latest generation, and how many tokens it had, on each thread.
+        # In batched mode one instance serves several concurrent generations, each on its own thread.
+        self._generation = threading.local()
+        self.draft = build_draft_model()
+        self.lifecycle = ModelLifecycle(
+            model_path,
+            idle_unload_seconds=settings.LOCAL_MODEL_IDLE_UNLOAD_SECONDS,
+            n_ctx=settings.LOCAL_MODEL_CONTEXT,
+            n_threads=settings.LOCAL_MODEL_THREADS or default_thread_count(settings.LOCAL_MODEL_REPLICAS),
+            on_unload=self._on_unload,
+            draft_model=self.draft,
+            on_swap=self._on_swap,
+        )
+        if settings.LOCAL_MODEL_WATCH_SECONDS:
+            self.lifecycle.watch_file(settings.LOCAL_MODEL_WATCH_SECONDS)
+
+    @property
+    def model(self):
+        """The llama.cpp model, loaded on first use. None if it isn't available."""
+        return self.lifecycle.get()
+
+    def load_model(self):
+        """Load the GGUF model now instead of on the first request"""
+        return self.lifecycle.get() is not None
+
+    def reload(self, model_path=None):
+        """Swap in a new GGUF file (or the replaced current one) in the background"""
+        return self.lifecycle.reload(model_path)
+
+    @property
+    def model_version(self):
+        """Version of the model currently loaded, None if none is"""
+        return self.lifecycle.model_version if self.lifecycle.is_loaded else None
+
+    @property
+    def generation_model_version(self):
+        """The model version behind the last plan generated on this thread ('fallback' for the fallback plan)"""
+        return getattr(self._generation, 'model_version', None)
+
+    @property
+    def last_completion_tokens(self):
+        """Tokens sampled by the last completion on this thread"""
+        return getattr(self._generation, 'completion_tokens', 0)
+
+    def generate_plan(self, prompt, fallback=True):
+        """
+        Generate a fitness plan using the local model. When `fallback` is False,
+        failures raise instead of returning the fallback plan.
+        """
+        if not self.model:
+            if not fallback:
+                raise RuntimeError("Model not loaded")
+            print("Model not loaded. Using fallback plan generation.")
+            return self._fallback()
+        
+        try:
+            # Generate response, reusing the evaluated instruction prefix
+            prefix, schema = (COMPACT_PLAN_PROMPT_PREFIX, CompactPlanSchema) if use_compact_schema() \
+                else (PLAN_PROMPT_PREFIX, GeneratedPlanSchema)
+            response_text = ''.join(self._complete(
+                prefix, self._build_prompt_suffix(prompt), **self._json_kwargs(schema)
+            )).strip()
             
             # Try to extract JSON from response
             json_start = response_text.find('{')
             json_end = response_text.rfind('}') + 1
+            if json_end <= json_start:
+                # Cut off before any object closed; the caller can still continue it
+                json_end = len(response_text)
             
-            if json_start != -1 and json_end != -1:
-                json_text = response_text[json_start:json_end]
+            if json_start != -1:
+                # A compact plan is expanded here so callers only see GeneratedPlanSchema
+                json_text = expand_plan_text(response_text[json_start:json_end])
                 return json_text
             else:
+                if not fallback:
+                    raise ValueError("Could not find JSON in model response")
                 print("Could not find JSON in model response, using fallback")
-                return self._generate_fallback_plan()
+                return self._fallback()
                 
         except Exception as e:
+            if not fallback:
+                raise
             print(f"Error generating plan with local model: {e}")
-            return self._generate_fallback_plan()
+            return self._fallback()
+
+    def _build_full_prompt(self, prompt):
+        """The static JSON structure instructions followed by the user's prompt"""
+        return PLAN_PROMPT_PREFIX + self._build_prompt_suffix(prompt)
+
+    @staticmethod
+    def _build_prompt_suffix(prompt):
+        """The per-request part of the prompt, evaluated after the cached prefix"""
+        return f"""
+Request:
+{prompt}
+
+JSON Response:"""
+
+    def _completion_kwargs(self):
+        """Sampling settings shared by blocking and streaming generation"""
+        return dict(
+            max_tokens=2048,
+            temperature=0.7,
+            top_p=0.9,
+            echo=False,
+            stop=["\n\n", "Human:", "Assistant:"],
+        )
+
+    def _json_kwargs(self, schema):
+        """
+        Completion overrides that constrain sampling to JSON matching `schema`.
+        With the grammar every token keeps the output valid, so the blank-line
+        stop sequence is dropped and the rest of the context window is available
+        instead of cutting the object off at max_tokens.
+        """
+        if not settings.LOCAL_JSON_GRAMMAR:
+            return {}
+        grammar = self._grammars.get(schema)
+        if grammar is None:
+            grammar = LlamaGrammar.from_json_schema(json.dumps(schema.model_json_schema()), verbose=False)
+            self._grammars[schema] = grammar
+        return dict(grammar=grammar, stop=[], max_tokens=None)
+
+    def _complete(self, prefix, suffix, **overrides):
+        """
+        Stream a completion for prefix + suffix, yielding text as it is generated.
+
+        The state after evaluating `prefix` is saved the first time it is seen
+        and restored before every later request. llama.cpp then finds the prefix
+        tokens already in its context and only evaluates `suffix`.
+        """
+        kwargs = self._completion_kwargs()
+        kwargs.update(overrides)
+
+        with self.lifecycle.use() as model:
+            if model is None:
+                raise RuntimeError("Model not loaded")
+            self._generation.model_version = model.model_version
+
+            started = time.perf_counter()
+            if settings.LOCAL_INFERENCE_MODE == 'batched':
+                # The batching engine shares the evaluated prefix between sequences itself
+                use_cache = True
+                texts = self._get_engine(model).generate(prefix, suffix, **kwargs)
+            else:
+                use_cache = settings.LOCAL_PROMPT_CACHE
+                if use_cache:
+                    state = self._prefix_states.get((model.model_version, prefix))
+                    if state is None:
+                        state = self._prime_prefix(model, prefix)
+                    model.load_state(state)
+                texts = (chunk['choices'][0]['text'] for chunk in model(prefix + suffix, stream=True, **kwargs))
+
+            first_token = True
+            completion_tokens = 0
+            pieces = []
+            for text in texts:
+                # Each streamed chunk is one sampled token
+                completion_tokens += 1
+                if first_token:
+                    self._ttft['cached' if use_cache else 'uncached'].append(time.perf_counter() - started)
+                    telemetry.first_token()
+                    first_token = False
+                if text:
+                    pieces.append(text)
+                    yield text
+
+            self._generation.completion_tokens = completion_tokens
+            telemetry.add_usage(
+                prompt_tokens=len(model.tokenize((prefix + suffix).encode('utf-8'))),
+                output_tokens=completion_tokens,
+            )
+            if self.draft is not None:
+                # Later generations can draft from what this one produced
+                self.draft.remember(model.tokenize(''.join(pieces).encode('utf-8'), add_bos=False))
+
+    def _get_engine(self, model):
+        """The continuous batching engine for the currently loaded model"""
+        with self._engine_lock:
+            if self._engine is None or self._engine.llm is not model:
+                self._engine = BatchedEngine(
+                    model,
+                    max_sequences=settings.LOCAL_BATCH_MAX_SEQUENCES,
+                    n_ctx_per_sequence=settings.LOCAL_MODEL_CONTEXT,
+                    n_threads=self.lifecycle.n_threads,
+                )
+            return self._engine
+
+    def _on_swap(self, old_model, new_model):
+        # Saved states don't apply to the new weights. The old batching engine
+        # finishes the sequences it already has, new ones go to a new engine.
+        self._prefix_states = {
+            key: state for key, state in self._prefix_states.items() if key[0] == new_model.model_version
+        }
+        with self._engine_lock:
+            if self._engine is not None:
+                self._engine.retire()
+                self._engine = None
+
+    def _on_unload(self):
+        # Saved states and the batching context belong to the model being unloaded
+        self._prefix_states.clear()
+        with self._engine_lock:
+            if self._engine is not None:
+                self._engine.close()
+                self._engine = None
+
+    def _prime_prefix(self, model, prefix):
+        """Evaluate `prefix` from an empty context and save the resulting state"""
+        tokens = model.tokenize(prefix.encode('utf-8'))
+        started = time.perf_counter()
+        model.reset()
+        model.eval(tokens)
+        state = model.save_state()
+        self._prefix_states[(model.model_version, prefix)] = state
+        self.prefix_eval_seconds = time.perf_counter() - started
+        print(f"Cached {len(tokens)} prompt prefix tokens in {self.prefix_eval_seconds:.2f}s")
+        return state
+
+    def ttft_stats(self):
+        """Average time to first token with and without the prompt prefix cache"""
+        stats = {
+            'prompt_cache_enabled': settings.LOCAL_PROMPT_CACHE,
+            'cached_prefixes': len(self._prefix_states),
+            'prefix_eval_seconds': round(self.prefix_eval_seconds, 3) if self.prefix_eval_seconds is not None else None,
+        }
+        for name, samples in self._ttft.items():
+            samples = list(samples)
+            stats[f'ttft_{name}_seconds'] = round(sum(samples) / len(samples), 3) if samples else None
+            stats[f'ttft_{name}_samples'] = len(samples)
+        return stats
+
+    def generate_json(self, prompt, schema):
+        """
+        Generate a JSON object matching a Pydantic schema. Unlike generate_plan
+        this raises instead of falling back, so callers can retry or give up.
+        """
+        if not self.model:
+            raise RuntimeError("Model not loaded")
+
+        # The schema block comes first so it is cached once per schema
+        prefix = f"""Please respond with a valid JSON object that matches this JSON schema:
+{json.dumps(schema.model_json_schema())}
+"""
+        kwargs = dict(max_tokens=1024)
+        kwargs.update(self._json_kwargs(schema))
+        response_text = ''.join(self._complete(prefix, self._build_prompt_suffix(prompt), **kwargs)).strip()
+
+        json_start = response_text.find('{')
+        json_end = response_text.rfind('}') + 1
+        if json_start == -1 or json_end == 0:
+            raise ValueError("Could not find JSON in model response")
+        return response_text[json_start:json_end]
 
-    def _generate_fallback_plan(self):
-        """Generate a basic fallback plan when the model fails"""
+    def stream_plan(self, prompt):
+        """Yield the generated plan text token by token"""
+        if not self.model:
+            print("Model not loaded. Using fallback plan generation.")
+            yield self._fallback()
+            return
+
+        yield from self._complete(PLAN_PROMPT_PREFIX, self._build_prompt_suffix(prompt), **self._json_kwargs(GeneratedPlanSchema))
+
+    def _fallback(self):
+        self._generation.model_version = 'fallback'
+        return self._generate_fallback_plan()
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _generate_fallback_plan():
+        """
+        Generate a basic fallback plan when the model fails. It doesn't depend
+        on the request, so it is built and serialized once. Callers that have the
+        profile use the personalised rule-based plan instead (rest/rule_engine.py).
+        """
         fallback_plan = {
             "workout_days": [
                 {
@@ -566,28 +813,149 @@ JSON Response:"""
         return json.dumps(fallback_plan)
 
 
+def build_draft_model():
+    """The speculative decoding draft model selected by LOCAL_SPECULATIVE, if any"""
+    mode = settings.LOCAL_SPECULATIVE
+    if not mode or not LLAMA_CPP_AVAILABLE:
+        return None
+    if mode == 'lookup':
+        return PlanLookupDecoding(num_pred_tokens=settings.LOCAL_SPECULATIVE_TOKENS)
+    if mode == 'draft':
+        if not os.path.exists(settings.LOCAL_DRAFT_MODEL_PATH):
+            print(f"Draft model not found at {settings.LOCAL_DRAFT_MODEL_PATH}, speculative decoding disabled")
+            return None
+        return SmallModelDraft(
+            settings.LOCAL_DRAFT_MODEL_PATH,
+            num_pred_tokens=settings.LOCAL_SPECULATIVE_TOKENS,
+            n_ctx=settings.LOCAL_MODEL_CONTEXT,
+            n_threads=settings.LOCAL_MODEL_THREADS or default_thread_count(settings.LOCAL_MODEL_REPLICAS),
+        )
+    print(f"Unknown LOCAL_SPECULATIVE mode '{mode}', speculative decoding disabled")
+    return None
+
+
+def generate_fallback_plan():
+    """The fallback plan as JSON text, available without loading a model"""
+    return LocalModel._generate_fallback_plan()
+
+
 # Global model instance
 _local_model = None
 
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
 def get_local_model():
-    """Get or create the local model instance"""
+    """
+    Get or create the local model instance. When LOCAL_INFERENCE_SOCKET is set
+    this is a client for the shared inference server instead of a model
+    loaded into this process.
+    """
     global _local_model
     if _local_model is None:
-        model_path = os.path.join(settings.BASE_DIR, 'model.gguf')
-        _local_model = LocalModel(model_path)
+        if settings.LOCAL_INFERENCE_SOCKET:
+            _local_model = RemoteLocalModel(settings.LOCAL_INFERENCE_SOCKET)
+        else:
+            model_path = os.path.join(settings.BASE_DIR, 'model.gguf')
+            _local_model = LocalModel(model_path)
     return _local_model
 
 
-def generate_and_save_local_plan_for_user(user_profile: Profile, start_date: date, end_date: date):
+def get_inference_scheduler():
     """
-    Generates a new fitness and nutrition plan using the local model
-    and saves it to the database for a specific date range.
+    Get or create the scheduler that every local generation goes through.
+    With the inference server, the server does the scheduling for all workers.
     """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            if settings.LOCAL_INFERENCE_SOCKET:
+                _scheduler = RemoteScheduler(settings.LOCAL_INFERENCE_SOCKET)
+            else:
+                _scheduler = build_local_scheduler(get_local_model())
+    return _scheduler
 
-    print(f"Generating plan for user: {user_profile.user.username} from {start_date} to {end_date}")
 
-    # Construct a detailed prompt from the user's profile
-    prompt = f"""
+def resolve_model_path(model_name):
+    """
+    The path of `model_name`, a .gguf file name in LOCAL_MODELS_DIR, or None
+    for the current model file. Raises ValueError for anything else, so a
+    reload request can't point the model loader at an arbitrary file.
+    """
+    if not model_name:
+        return None
+    models_dir = os.path.realpath(settings.LOCAL_MODELS_DIR)
+    model_path = os.path.realpath(os.path.join(models_dir, model_name))
+    if (os.path.basename(model_name) != model_name or os.path.dirname(model_path) != models_dir
+            or not model_path.endswith('.gguf')):
+        raise ValueError(f"model_path must be the name of a .gguf file in {settings.LOCAL_MODELS_DIR}")
+    if not os.path.isfile(model_path):
+        raise ValueError(f"Model file {model_name} not found")
+    return model_path
+
+
+def reload_local_models(model_name=None):
+    """
+    Hot-swap the local model of this process (every replica), or of the
+    inference server when LOCAL_INFERENCE_SOCKET is set, to `model_name` (see
+    resolve_model_path) or the replaced current file. Returns False if a
+    reload was already in progress.
+    """
+    model = get_local_model()
+    if isinstance(model, RemoteLocalModel):
+        # The server resolves the name against its own LOCAL_MODELS_DIR
+        return model.reload(model_name)
+    model_path = resolve_model_path(model_name)
+    replicas = {id(replica): replica for replica in get_inference_scheduler().replicas}
+    replicas.setdefault(id(model), model)
+    started = [replica.reload(model_path) for replica in replicas.values()]
+    return any(started)
+
+
+def build_local_scheduler(model):
+    """
+    A scheduler over `model` plus any extra replicas (LOCAL_MODEL_REPLICAS),
+    which memory-map the same weights but have their own context.
+    In batched mode there is a single model and the scheduler lets up to
+    LOCAL_BATCH_MAX_SEQUENCES requests into its batching engine at once.
+    """
+    if settings.LOCAL_INFERENCE_MODE == 'batched':
+        return InferenceScheduler([model] * settings.LOCAL_BATCH_MAX_SEQUENCES, max_queue=settings.LOCAL_INFERENCE_QUEUE_SIZE)
+
+    replicas = [model]
+    for _ in range(settings.LOCAL_MODEL_REPLICAS - 1):
+        replicas.append(LocalModel(model.model_path))
+    return InferenceScheduler(replicas, max_queue=settings.LOCAL_INFERENCE_QUEUE_SIZE)
+
+
+def local_model_status(model, scheduler):
+    """Status of an in-process model and its scheduler, without loading the model"""
+    model_file_exists = os.path.exists(model.model_path)
+    model_loaded = model.lifecycle.is_loaded
+    if model_loaded:
+        model_status = 'ready'
+    elif LLAMA_CPP_AVAILABLE and model_file_exists:
+        model_status = 'not_loaded'
+    else:
+        model_status = 'fallback_only'
+
+    return {
+        'model_loaded': model_loaded,
+        'model_available': LLAMA_CPP_AVAILABLE and model_file_exists,
+        'model_path': model.model_path,
+        'model_file_exists': model_file_exists,
+        'llama_cpp_available': LLAMA_CPP_AVAILABLE,
+        'status': model_status,
+        'lifecycle': model.lifecycle.status(),
+        'scheduler': scheduler.stats(),
+        'prompt_cache': model.ttft_stats(),
+        'speculative': model.draft.stats() if model.draft is not None else None,
+    }
+
+
+def build_local_prompt(user_profile: Profile):
+    """Construct a detailed prompt from the user's profile"""
+    return f"""
     Generate a comprehensive 7-day fitness and nutrition plan for a user in Ghana.
     The response MUST be a valid JSON object that adheres to the provided schema.
 
@@ -606,11 +974,84 @@ def generate_and_save_local_plan_for_user(user_profile: Profile, start_date: dat
     - Ensure all fields in the schema are populated accurately. For rest days, the 'exercises' list should be empty.
     """
 
+
+def stream_local_plan_text(prompt, priority=INTERACTIVE):
+    """Yield the plan text from the local model as it is generated"""
+    return get_inference_scheduler().stream(lambda model: model.stream_plan(prompt), priority)
+
+
+def current_local_model_version():
+    """The version new local generations run on, 'fallback' when there is no model to run them"""
+    try:
+        return get_local_model().model_version or 'fallback'
+    except InferenceServerError:
+        return 'fallback'
+
+
+def _scheduled_generate_json(priority, versions):
+    """
+    A generate_json(prompt, schema) for fan-out that runs through the scheduler
+    and adds the model version of each generation to the `versions` set.
+    """
+    scheduler = get_inference_scheduler()
+
+    def generate_json(model, prompt, schema):
+        result = model.generate_json(prompt, schema)
+        versions.add(model.generation_model_version or '')
+        return result
+
+    return lambda prompt, schema: scheduler.run(lambda model: generate_json(model, prompt, schema), priority)
+
+
+def _generate_local_plan(prompt, priority, fallback):
+    """Run one plan generation through the scheduler, returns (plan_data, model_version)"""
+    scheduler = get_inference_scheduler()
+    if settings.PLAN_GENERATION_MODE == 'fanout' and get_local_model().model:
+        # One request per day keeps each generation well inside max_tokens.
+        # A hot swap during fan-out can mix versions, all of them are recorded.
+        versions = set()
+        plan_data = generate_plan_fanout(prompt, _scheduled_generate_json(priority, versions), max_workers=settings.LOCAL_FANOUT_WORKERS)
+        return plan_data, ','.join(sorted(versions))
+    response_text, model_version = scheduler.run(
+        lambda model: (model.generate_plan(prompt, fallback=fallback), model.generation_model_version), priority
+    )
+    # A plan cut off by max_tokens or a stop sequence keeps its complete days
+    versions = {model_version or ''}
+    plan_data = load_plan_text(prompt, response_text, _scheduled_generate_json(priority, versions))
+    return plan_data, ','.join(sorted(versions))
+
+
+def generate_local_plan_data(user_profile: Profile, priority=INTERACTIVE):
+    """
+    Generate plan data with the local model without saving it.
+    Returns (prompt, plan_data, model_version) and raises if the model can't
+    produce a plan, so callers such as the backend router can decide what to do instead.
+    """
+    prompt = build_local_prompt(user_profile)
+    plan_data, model_version = _generate_local_plan(prompt, priority, fallback=False)
+    return prompt, plan_data, model_version
+
+
+def generate_and_save_local_plan_for_user(user_profile: Profile, start_date: date, end_date: date):
+    """
+    Generates a new fitness and nutrition plan using the local model
+    and saves it to the database for a specific date range.
+    """
+
+    print(f"Generating plan for user: {user_profile.user.username} from {start_date} to {end_date}")
+
+    # Construct a detailed prompt from the user's profile
+    prompt = build_local_prompt(user_profile)
+
     # Call the local model
     try:
-        local_model = get_local_model()
-        response_text = local_model.generate_plan(prompt)
-        plan_data = json.loads(response_text)
+        with telemetry.track_generation('local') as metrics:
+            plan_data, model_version = _generate_local_plan(prompt, INTERACTIVE, fallback=True)
+            if model_version == 'fallback':
+                # The model couldn't answer; the rule-based plan is at least personalised
+                plan_data, model_version = generate_rule_plan(user_profile), RULE_ENGINE_VERSION
+                metrics.used_fallback = True
+            metrics.model_version = model_version
     except Exception as e:
         print(f"Error calling local model: {e}")
         return None
@@ -618,57 +1059,14 @@ def generate_and_save_local_plan_for_user(user_profile: Profile, start_date: dat
     # Save to database
     print(f"Generated plan data: {plan_data}")
     try:
-        with transaction.atomic():
-            new_plan = FitnessPlan.objects.create(
-                profile=user_profile,
-                start_date=start_date,
-                end_date=end_date,
-                goal_at_creation=user_profile.goal,
-                ai_prompt_text=prompt,
-                ai_response_raw=plan_data
-            )
-
-            # Create Workout Days and Exercises
-            for wd_data in plan_data['workout_days']:
-                workout_day = WorkoutDay.objects.create(
-                    plan=new_plan,
-                    day_of_week=wd_data['day_of_week'],
-                    title=wd_data['title'],
-                    description=wd_data['description'],
-                    is_rest_day=wd_data['is_rest_day']
-                )
-                for ex_data in wd_data['exercises']:
-                    Exercise.objects.create(
-                        workout_day=workout_day,
-                        name=ex_data['name'],
-                        sets=ex_data['sets'],
-                        reps=ex_data['reps'],
-                        rest_period_seconds=ex_data['rest_period_seconds'],
-                        notes=ex_data['notes']
-                    )
-
-            # Create Nutrition Days and Meals
-            for nd_data in plan_data['nutrition_days']:
-                nutrition_day = NutritionDay.objects.create(
-                    plan=new_plan,
-                    day_of_week=nd_data['day_of_week'],
-                    notes=nd_data['notes'],
-                    target_calories=nd_data['target_calories'],
-                    target_protein_grams=nd_data['target_protein_grams'],
-                    target_carbs_grams=nd_data['target_carbs_grams'],
-                    target_fats_grams=nd_data['target_fats_grams']
-                )
-                for meal_data in nd_data['meals']:
-                    Meal.objects.create(
-                        nutrition_day=nutrition_day,
-                        meal_type=meal_data['meal_type'],
-                        description=meal_data['description'],
-                        calories=meal_data['calories'],
-                        protein_grams=meal_data['protein_grams'],
-                        carbs_grams=meal_data['carbs_grams'],
-                        fats_grams=meal_data['fats_grams'],
-                        portion_size=meal_data['portion_size']
-                    )
+        new_plan = save_generated_plan(
+            user_profile,
+            plan_data,
+            start_date=start_date,
+            end_date=end_date,
+            prompt=prompt,
+            model_version=model_version
+        )
         print(f"Plan successfully generated and saved for user: {user_profile.user.username}")
         return new_plan
     except Exception as e:
@@ -0,0 +1,157 @@
+from collections import deque
+
+try:
+    import numpy as np
+    from llama_cpp import Llama
+    from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+except ImportError:
+    LlamaDraftModel = object
+    LlamaPromptLookupDecoding = None
+
+
+class _AcceptanceTracker:
+    """
+    Infers how many drafted tokens the main model accepted.
+
+    Llama only tells the draft model the tokens that are in the context when it
+    asks for the next proposal, so each proposal is compared against what was
+    actually generated after it at the next call.
+    """
+
+    def __init__(self):
+        self.proposed = 0
+        self.accepted = 0
+        self.calls = 0
+        self._proposal = None
+        self._proposed_at = 0
+
+    def observe(self, input_ids):
+        if self._proposal is not None and len(self._proposal):
+            actual = input_ids[self._proposed_at:self._proposed_at + len(self._proposal)]
+            matched = 0
+            for drafted, real in zip(self._proposal, actual):
+                if drafted != real:
+                    break
+                matched += 1
+            self.accepted += matched
+        self._proposal = None
+
+    def propose(self, input_ids, draft):
+        self.calls += 1
+        self.proposed += len(draft)
+        self._proposal = [int(token) for token in draft]
+        self._proposed_at = len(input_ids)
+        return draft
+
+    def stats(self):
+        return {
+            'draft_calls': self.calls,
+            'proposed_tokens': self.proposed,
+            'accepted_tokens': self.accepted,
+            'acceptance_rate': round(self.accepted / self.proposed, 3) if self.proposed else None,
+        }
+
+
+class PlanLookupDecoding(LlamaDraftModel):
+    """
+    Prompt-lookup drafting tuned for plan JSON.
+
+    Proposes the tokens that followed the most recent n-gram earlier in the
+    context (the JSON template in the prompt and the plan so far) and, failing
+    that, in previously generated plans, which repeat field names, dish names
+    and numbers across users.
+    """
+
+    def __init__(self, max_ngram_size=3, num_pred_tokens=10, remembered_plans=20):
+        self.max_ngram_size = max_ngram_size
+        self.num_pred_tokens = num_pred_tokens
+        self._plans = deque(maxlen=remembered_plans)
+        self._index = {}
+        self.tracker = _AcceptanceTracker()
+
+    def remember(self, tokens):
+        """Add the tokens of a finished plan to the lookup corpus."""
+        self._plans.append(list(tokens))
+        # Rebuild so n-grams of plans that fell out of the deque are dropped
+        index = {}
+        for plan in self._plans:
+            for n in range(1, self.max_ngram_size + 1):
+                for end in range(n, len(plan)):
+                    index[(n, tuple(plan[end - n:end]))] = (plan, end)
+        self._index = index
+
+    def _from_previous_plans(self, input_ids):
+        for n in range(min(self.max_ngram_size, len(input_ids)), 0, -1):
+            match = self._index.get((n, tuple(int(t) for t in input_ids[-n:])))
+            if match:
+                plan, end = match
+                return np.array(plan[end:end + self.num_pred_tokens], dtype=np.intc)
+        return np.array([], dtype=np.intc)
+
+    def __call__(self, input_ids, /, **kwargs):
+        self.tracker.observe(input_ids)
+        draft = LlamaPromptLookupDecoding.find_candidate_pred_tokens(
+            input_ids=input_ids,
+            max_ngram_size=self.max_ngram_size,
+            num_pred_tokens=self.num_pred_tokens,
+        )
+        if not len(draft) and self._index:
+            draft = self._from_previous_plans(input_ids)
+        return self.tracker.propose(input_ids, draft)
+
+    def stats(self):
+        stats = self.tracker.stats()
+        stats.update(mode='lookup', remembered_plans=len(self._plans))
+        return stats
+
+
+class SmallModelDraft(LlamaDraftModel):
+    """
+    Drafts with a small GGUF model that shares the main model's tokenizer,
+    greedily generating `num_pred_tokens` tokens for the main model to verify.
+    The draft model is loaded the first time it is asked for a proposal.
+    """
+
+    def __init__(self, model_path, num_pred_tokens=8, n_ctx=4096, n_threads=None):
+        self.model_path = model_path
+        self.num_pred_tokens = num_pred_tokens
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self._draft_llm = None
+        self.tracker = _AcceptanceTracker()
+
+    @property
+    def draft_llm(self):
+        if self._draft_llm is None:
+            self._draft_llm = Llama(
+                model_path=self.model_path,
+                n_ctx=self.n_ctx,
+                n_threads=self.n_threads,
+                use_mmap=True,
+                verbose=False,
+            )
+        return self._draft_llm
+
+    def remember(self, tokens):
+        pass
+
+    def __call__(self, input_ids, /, **kwargs):
+        self.tracker.observe(input_ids)
+        draft = []
+        # generate() reuses the longest matching prefix already in the draft context
+        generator = self.draft_llm.generate([int(t) for t in input_ids], temp=0.0, reset=True)
+        try:
+            for token in generator:
+                if token == self.draft_llm.token_eos():
+                    break
+                draft.append(token)
+                if len(draft) >= self.num_pred_tokens:
+                    break
+        finally:
+            generator.close()
+        return self.tracker.propose(input_ids, np.array(draft, dtype=np.intc))
+
+    def stats(self):
+        stats = self.tracker.stats()
+        stats['mode'] = 'draft'
+        return stats
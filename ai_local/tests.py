@@ -1,3 +1,103 @@
-from django.test import TestCase
+import gc
+import os
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from .scheduler import BATCH, INTERACTIVE, InferenceQueueFull, InferenceScheduler
+from .services import resolve_model_path
+
+
+class InferenceSchedulerTests(SimpleTestCase):
+    def block(self, scheduler):
+        """Occupies the scheduler's only replica until the returned event is set."""
+        release = threading.Event()
+        started = threading.Event()
+
+        def hold(model):
+            started.set()
+            release.wait(5)
+        scheduler.submit(hold)
+        started.wait(5)
+        self.addCleanup(release.set)
+        return release
+
+    def test_urgent_work_runs_first(self):
+        scheduler = InferenceScheduler([object()], max_queue=4)
+        release = self.block(scheduler)
+        order = []
+        batch = scheduler.submit(lambda model: order.append('batch'), BATCH)
+        interactive = scheduler.submit(lambda model: order.append('interactive'), INTERACTIVE)
+        release.set()
+        batch.result(5)
+        interactive.result(5)
+        self.assertEqual(order, ['interactive', 'batch'])
+
+    def test_full_queue_rejects_work(self):
+        scheduler = InferenceScheduler([object()], max_queue=1)
+        self.block(scheduler)
+        scheduler.submit(lambda model: None)
+        with self.assertRaises(InferenceQueueFull):
+            scheduler.submit(lambda model: None)
+        self.assertEqual(scheduler.stats()['rejected'], 1)
+
+    def test_stream_yields_the_items(self):
+        scheduler = InferenceScheduler([object()], max_queue=4)
+        self.assertEqual(list(scheduler.stream(lambda model: iter(range(5)))), [0, 1, 2, 3, 4])
+
+    def test_dropped_stream_is_cancelled_before_it_starts(self):
+        scheduler = InferenceScheduler([object()], max_queue=4)
+        release = self.block(scheduler)
+        produced = []
+
+        def generate(model):
+            for i in range(100):
+                produced.append(i)
+                yield i
+        stream = scheduler.stream(generate)
+        del stream
+        gc.collect()
+        release.set()
+        scheduler.submit(lambda model: None).result(5)
+        self.assertEqual(produced, [])
+
+    def test_dropped_stream_stops_generating(self):
+        scheduler = InferenceScheduler([object()], max_queue=4)
+        produced = []
+
+        def generate(model):
+            for i in range(100):
+                time.sleep(0.01)
+                produced.append(i)
+                yield i
+        stream = scheduler.stream(generate)
+        next(stream)
+        del stream
+        gc.collect()
+        scheduler.submit(lambda model: None).result(5)
+        self.assertLess(len(produced), 100)
+
+
+class ResolveModelPathTests(SimpleTestCase):
+    def setUp(self):
+        models_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(models_dir.cleanup)
+        self.models_dir = models_dir.name
+        for name in ('model.gguf', 'notes.txt'):
+            open(os.path.join(self.models_dir, name), 'w').close()
+        settings_override = override_settings(LOCAL_MODELS_DIR=self.models_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_model_in_the_models_dir(self):
+        self.assertEqual(resolve_model_path('model.gguf'), os.path.join(os.path.realpath(self.models_dir), 'model.gguf'))
+
+    def test_no_name_keeps_the_current_model(self):
+        self.assertIsNone(resolve_model_path(''))
+
+    def test_other_paths_are_rejected(self):
+        for name in ('../model.gguf', '/etc/passwd', 'sub/model.gguf', 'notes.txt', 'missing.gguf'):
+            with self.subTest(name=name), self.assertRaises(ValueError):
+                resolve_model_path(name)
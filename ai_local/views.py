@@ -3,7 +3,9 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
-from .services import get_local_model
+from .inference_client import RemoteLocalModel
+from .services import get_local_model, get_inference_scheduler, local_model_status
+from .scheduler import InferenceQueueFull, TEST
 import os
 from django.conf import settings
 
@@ -15,16 +17,11 @@ def model_status(request):
     """
     try:
         model = get_local_model()
-        model_file_exists = os.path.exists(model.model_path)
-        
-        status = {
-            'model_loaded': model.model is not None,
-            'model_path': model.model_path,
-            'model_file_exists': model_file_exists,
-            'llama_cpp_available': hasattr(model, 'model') and model.model is not None,
-            'status': 'ready' if model.model else 'fallback_only',
-            'expected_model_path': os.path.join(settings.BASE_DIR, 'DeepSeek_R1_Distill_Qwen_1_5B.gguf')
-        }
+        if isinstance(model, RemoteLocalModel):
+            # The inference server reports on the model it owns
+            status = model.status()
+        else:
+            status = local_model_status(model, get_inference_scheduler())
         return JsonResponse(status)
     except Exception as e:
         return JsonResponse({
@@ -49,13 +46,20 @@ def test_generation(request):
         Please respond with valid JSON.
         """
         
-        response_text = model.generate_plan(test_prompt)
+        response_text = get_inference_scheduler().run(lambda m: m.generate_plan(test_prompt), TEST)
         
         return JsonResponse({
             'success': True,
             'using_model': model.model is not None,
             'response_preview': response_text[:500] + '...' if len(response_text) > 500 else response_text
         })
+    except InferenceQueueFull as e:
+        response = JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=503)
+        response['Retry-After'] = str(e.retry_after)
+        return response
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -225,3 +225,106 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Plan generation jobs
+# 'thread' runs jobs in an in-process pool, 'worker' leaves them for `manage.py run_plan_jobs`.
+PLAN_JOB_BACKEND = getenv('PLAN_JOB_BACKEND', 'thread')
+PLAN_JOB_WORKERS = int(getenv('PLAN_JOB_WORKERS', 4))
+# A job still running after this long is taken to have died with its worker and is marked failed
+PLAN_JOB_TIMEOUT_SECONDS = int(getenv('PLAN_JOB_TIMEOUT_SECONDS', 900))
+
+# Plan template cache
+# Profiles with the same fingerprint (see rest/plan_cache.py) share one generated plan.
+PLAN_CACHE_ENABLED = getenv('PLAN_CACHE_ENABLED', 'True') == 'True'
+PLAN_CACHE_TTL_SECONDS = int(getenv('PLAN_CACHE_TTL_SECONDS', 7 * 24 * 60 * 60))
+PLAN_CACHE_MAX_ENTRIES = int(getenv('PLAN_CACHE_MAX_ENTRIES', 500))
+
+# Backend used by the streaming plan endpoint: 'gemini' or 'local'
+PLAN_STREAM_BACKEND = getenv('PLAN_STREAM_BACKEND', 'gemini')
+
+# 'single' asks for the whole week in one request, 'fanout' plans the week first
+# and then generates every day with its own concurrent request (see rest/plan_fanout.py)
+PLAN_GENERATION_MODE = getenv('PLAN_GENERATION_MODE', 'single')
+# Concurrent per-day requests for the local model; more than LOCAL_MODEL_REPLICAS just queue up
+LOCAL_FANOUT_WORKERS = int(getenv('LOCAL_FANOUT_WORKERS', 1))
+# When a plan is cut off or has days that fail validation, keep its valid days and ask for
+# the missing ones this many times before giving up (see rest/plan_recovery.py), 0 disables it
+PLAN_RECOVERY_ATTEMPTS = int(getenv('PLAN_RECOVERY_ATTEMPTS', 2))
+# 'full' asks models for GeneratedPlanSchema, 'compact' for CompactPlanSchema (short keys, meal type
+# codes, bare rest days), which is expanded back before the plan is validated (see rest/plan_wire.py).
+# 'catalog' has Gemini pick meals from the FoodItem catalog by ID and portions, and the server
+# computes the macros (see rest/food_catalog.py); the local model then keeps the full schema.
+PLAN_WIRE_SCHEMA = getenv('PLAN_WIRE_SCHEMA', 'full')
+# Match the foods in meal descriptions to the catalog when a plan is saved (see rest/food_matcher.py)
+FOOD_MATCH_ON_SAVE = getenv('FOOD_MATCH_ON_SAVE', 'True') == 'True'
+
+# AI backend routing (see rest/ai_router.py)
+# Backends: 'gemini', 'local', 'rules' and 'fallback' (the rule-based plan, see rest/rule_engine.py).
+# Leave the secondary empty to disable hedging.
+AI_PRIMARY_BACKEND = getenv('AI_PRIMARY_BACKEND', 'gemini')
+AI_SECONDARY_BACKEND = getenv('AI_SECONDARY_BACKEND', '')
+AI_FALLBACK_BACKEND = getenv('AI_FALLBACK_BACKEND', 'fallback')
+# Total time budget for a generation before degrading to the fallback plan
+AI_DEADLINE_SECONDS = float(getenv('AI_DEADLINE_SECONDS', 60))
+# Hedge to the secondary once the primary is slower than this percentile of its recent latency
+AI_HEDGE_PERCENTILE = float(getenv('AI_HEDGE_PERCENTILE', 95))
+AI_HEDGE_MIN_SAMPLES = int(getenv('AI_HEDGE_MIN_SAMPLES', 20))
+# Hedge delay used until enough latency samples have been collected
+AI_HEDGE_DEFAULT_SECONDS = float(getenv('AI_HEDGE_DEFAULT_SECONDS', 30))
+# Profiles the rule engine serves as well as a model (see rule_engine.is_simple_profile) get a
+# rule-based plan straight away instead of an AI call. Off by default: most complete profiles are
+# simple, so turning it on skips the model (and the plan cache) for most users
+AI_RULES_FOR_SIMPLE_PROFILES = getenv('AI_RULES_FOR_SIMPLE_PROFILES', 'False') == 'True'
+
+# Gemini context caching (see rest/gemini_context_cache.py)
+# The shared plan instructions are cached once and referenced by name instead of resent with every request.
+# Only instructions of at least GEMINI_CONTEXT_CACHE_MIN_TOKENS can be cached: the plain plan instructions
+# are under 200 tokens and always sent inline, so this only pays off with PLAN_WIRE_SCHEMA='catalog',
+# whose instructions include the food catalog. Off by default
+GEMINI_CONTEXT_CACHE = getenv('GEMINI_CONTEXT_CACHE', 'False') == 'True'
+# The cache's TTL, which is extended shortly before it runs out while requests keep using it
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(getenv('GEMINI_CONTEXT_CACHE_TTL_SECONDS', 3600))
+# The model's minimum size for explicit caching (1024 for gemini-2.5-flash); smaller instructions are sent inline
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(getenv('GEMINI_CONTEXT_CACHE_MIN_TOKENS', 1024))
+
+# Local inference scheduling (see ai_local/scheduler.py)
+# Each replica is a separate copy of the model in memory that can generate in parallel.
+LOCAL_MODEL_REPLICAS = int(getenv('LOCAL_MODEL_REPLICAS', 1))
+# Requests waiting beyond this are rejected with 503 and a Retry-After header
+LOCAL_INFERENCE_QUEUE_SIZE = int(getenv('LOCAL_INFERENCE_QUEUE_SIZE', 16))
+# Save the model state after the static prompt instructions and restore it for each request
+LOCAL_PROMPT_CACHE = getenv('LOCAL_PROMPT_CACHE', 'True') == 'True'
+# Constrain local sampling with a GBNF grammar generated from the response schema
+LOCAL_JSON_GRAMMAR = getenv('LOCAL_JSON_GRAMMAR', 'True') == 'True'
+# Local model lifecycle (see ai_local/lifecycle.py)
+LOCAL_MODEL_CONTEXT = int(getenv('LOCAL_MODEL_CONTEXT', 4096))
+# 0 splits the available CPUs between LOCAL_MODEL_REPLICAS
+LOCAL_MODEL_THREADS = int(getenv('LOCAL_MODEL_THREADS', 0))
+# Unload the model after this many idle seconds, 0 keeps it loaded once used
+LOCAL_MODEL_IDLE_UNLOAD_SECONDS = int(getenv('LOCAL_MODEL_IDLE_UNLOAD_SECONDS', 900))
+# Check model.gguf this often and hot-swap it when the file is replaced, 0 turns watching off
+LOCAL_MODEL_WATCH_SECONDS = int(getenv('LOCAL_MODEL_WATCH_SECONDS', 0))
+# A reload request may only name a .gguf file in this directory
+LOCAL_MODELS_DIR = getenv('LOCAL_MODELS_DIR', str(BASE_DIR))
+# Unix socket of the shared inference server (manage.py run_inference_server).
+# When set, web workers send local generations there instead of loading the model themselves.
+LOCAL_INFERENCE_SOCKET = getenv('LOCAL_INFERENCE_SOCKET', '')
+# 'sequential' runs one generation per replica at a time, 'batched' decodes concurrent
+# generations together as sequences of one llama.cpp context (see ai_local/batching.py)
+LOCAL_INFERENCE_MODE = getenv('LOCAL_INFERENCE_MODE', 'sequential')
+LOCAL_BATCH_MAX_SEQUENCES = int(getenv('LOCAL_BATCH_MAX_SEQUENCES', 4))
+# Speculative decoding for sequential local generation: '' (off), 'lookup' (n-grams from the
+# prompt and previous plans) or 'draft' (a small GGUF model at LOCAL_DRAFT_MODEL_PATH)
+LOCAL_SPECULATIVE = getenv('LOCAL_SPECULATIVE', '')
+LOCAL_SPECULATIVE_TOKENS = int(getenv('LOCAL_SPECULATIVE_TOKENS', 10))
+LOCAL_DRAFT_MODEL_PATH = getenv('LOCAL_DRAFT_MODEL_PATH', str(BASE_DIR / 'draft_model.gguf'))
+# Rescale meal portions before saving so each day's totals meet its targets (see rest/macro_balance.py)
+PLAN_MACRO_BALANCE = getenv('PLAN_MACRO_BALANCE', 'True') == 'True'
+# Days whose totals are all within this relative error of the targets are left as generated
+PLAN_MACRO_TOLERANCE = float(getenv('PLAN_MACRO_TOLERANCE', 0.05))
+# Rescale the active plan to the new targets when a profile update changes them (see rest/plan_adapt.py)
+PLAN_AUTO_ADAPT = getenv('PLAN_AUTO_ADAPT', 'True') == 'True'
+# Also queue a new plan when a profile update changes the goal; off by default so the
+# client confirms the AI generation with POST me/plans/adapt
+PLAN_AUTO_REGENERATE = getenv('PLAN_AUTO_REGENERATE', 'False') == 'True'
@@ -20,6 +20,7 @@ from django.urls import path, include
 
 from rest_framework import routers
 from rest import views as rest_views
+from rest import async_views as rest_async_views
 # from dj_rest_auth.registration.views import SocialAccountListView, SocialAccountDisconnectView
 
 router = routers.DefaultRouter() 
@@ -48,6 +49,10 @@ urlpatterns = [
     path('accounts/', include('allauth.urls')),
 
     # other api urls
+    # async plan creation, served natively when running under ASGI (api/asgi.py)
+    path('api/users/me/plans/async/', rest_async_views.me_plans_async, name='me-plans-async'),
     path('api/', include(router.urls)),
     path('api/status/', rest_views.StatusView.as_view(), name='status'),
+    path('api/status/ai/', rest_views.AiStatsView.as_view(), name='status-ai'),
+    path('api/status/ai/reload-local-model/', rest_views.ReloadLocalModelView.as_view(), name='status-ai-reload-local-model'),
 ]
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from rest_framework.authtoken.admin import TokenAdmin
-from .models import Profile, FitnessPlan, Meal, Exercise, WorkoutDay, NutritionDay
+from .models import Profile, FitnessPlan, Meal, Exercise, WorkoutDay, NutritionDay, GenerationJob, PlanTemplate, GenerationTelemetry, FoodItem, MealFoodMatch
 # Register your models here.
 
 TokenAdmin.raw_id_fields = ('user',)
@@ -10,4 +10,33 @@ admin.site.register(FitnessPlan)  # Register the FitnessPlan model
 admin.site.register(Meal)  # Register the Meal model
 admin.site.register(Exercise)  # Register the Exercise model
 admin.site.register(WorkoutDay)  # Register the WorkoutDay model
-admin.site.register(NutritionDay)  # Register the NutritionDay model
\ No newline at end of file
+admin.site.register(NutritionDay)  # Register the NutritionDay model
+admin.site.register(GenerationJob)  # Register the GenerationJob model
+
+
+@admin.register(PlanTemplate)
+class PlanTemplateAdmin(admin.ModelAdmin):
+    list_display = ('fingerprint', 'hit_count', 'created_at', 'last_used_at')
+    readonly_fields = ('created_at', 'last_used_at')
+
+
+@admin.register(GenerationTelemetry)
+class GenerationTelemetryAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'backend', 'model_version', 'latency_seconds', 'time_to_first_token_seconds',
+                    'prompt_tokens', 'output_tokens', 'retries', 'parse_failures', 'used_fallback', 'succeeded')
+    list_filter = ('backend', 'succeeded', 'used_fallback', 'created_at')
+    date_hierarchy = 'created_at'
+
+
+@admin.register(FoodItem)
+class FoodItemAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code', 'category', 'portion', 'calories', 'protein_grams', 'carbs_grams', 'fats_grams', 'is_active')
+    list_filter = ('category', 'is_active')
+    search_fields = ('name', 'code', 'tags')
+
+
+@admin.register(MealFoodMatch)
+class MealFoodMatchAdmin(admin.ModelAdmin):
+    list_display = ('meal', 'food', 'matched_text', 'score', 'portions')
+    list_filter = ('food__category',)
+    raw_id_fields = ('meal',)
@@ -0,0 +1,323 @@
+# rest/ai_router.py
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from datetime import date, timedelta
+from importlib.util import find_spec
+from threading import Lock, Thread
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Profile
+from .plan_cache import profile_fingerprint, get_cached_plan, store_cached_plan, CACHED_PLAN_MODEL_VERSION
+from .plan_persistence import save_generated_plan
+from .rule_engine import generate_rule_plan, is_simple_profile, RULE_ENGINE_VERSION
+from .telemetry import track_generation
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.5, 1, 2, 5, 10, 20, 30, 60, 120]
+
+
+def _gemini_backend(user_profile, start_date):
+    from .ai_service import generate_plan_data, GEMINI_MODEL
+    prompt, plan_data = generate_plan_data(user_profile, start_date)
+    return prompt, plan_data, GEMINI_MODEL
+
+
+def _local_backend(user_profile, start_date):
+    from ai_local.services import generate_local_plan_data
+    return generate_local_plan_data(user_profile)
+
+
+def _rules_backend(user_profile, start_date):
+    return '', generate_rule_plan(user_profile), RULE_ENGINE_VERSION
+
+
+# Every backend takes (user_profile, start_date) and returns
+# (prompt, plan_data, model_version), raising if it can't produce a plan.
+# The fallback is the rule-based plan, personalised and ready in under a millisecond.
+BACKENDS = {
+    'gemini': _gemini_backend,
+    'local': _local_backend,
+    'rules': _rules_backend,
+    'fallback': _rules_backend,
+}
+
+
+def register_backend(name, generate):
+    """Adds or replaces a backend in the registry."""
+    BACKENDS[name] = generate
+
+
+def backend_available(name):
+    """
+    Whether `name` can produce plans here. The local backend needs llama_cpp
+    or a shared inference server (LOCAL_INFERENCE_SOCKET); without them it
+    could only return the fallback plan.
+    """
+    if name not in BACKENDS:
+        return False
+    if name == 'local':
+        return bool(settings.LOCAL_INFERENCE_SOCKET) or find_spec('llama_cpp') is not None
+    return True
+
+
+class LatencyTracker:
+    """Recent latencies and a cumulative histogram for one backend."""
+
+    def __init__(self, window=200):
+        self._lock = Lock()
+        self.recent = deque(maxlen=window)
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.errors = 0
+
+    def record(self, seconds, ok=True):
+        with self._lock:
+            if ok:
+                self.recent.append(seconds)
+                self.histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            else:
+                self.errors += 1
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self.recent)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self):
+        with self._lock:
+            count = len(self.recent)
+            histogram = list(self.histogram)
+            errors = self.errors
+        labels = [f'<={bound}s' for bound in LATENCY_BUCKETS] + [f'>{LATENCY_BUCKETS[-1]}s']
+        return {
+            'samples': count,
+            'errors': errors,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'histogram': dict(zip(labels, histogram)),
+        }
+
+
+class BackendRouter:
+    """
+    Routes a plan generation to the primary backend within a latency budget.
+
+    If the primary hasn't answered by the configured percentile of its recent
+    latency, a hedged request is sent to the secondary and whichever answers
+    first wins. Past the deadline, or if both fail, the router degrades to the
+    fallback backend. Requests that lose the race are left to finish in the
+    background and their results are discarded; each attempt runs in its own
+    thread, so calls stuck on a stalled upstream (bounded by the client
+    timeouts, see GEMINI_TIMEOUT_SECONDS) never starve new requests. When
+    `simple_profile_backend` is set, simple profiles (see
+    rule_engine.is_simple_profile) go straight to it. A secondary that isn't
+    available (see backend_available) disables hedging.
+    """
+
+    def __init__(self, primary, secondary, fallback, deadline_seconds, hedge_percentile,
+                 hedge_min_samples, default_hedge_seconds, simple_profile_backend=None):
+        if secondary and not backend_available(secondary):
+            print(f"AI router: secondary backend '{secondary}' is not available, hedging is off")
+            secondary = ''
+        self.primary = primary
+        self.secondary = secondary
+        self.fallback = fallback
+        self.simple_profile_backend = simple_profile_backend
+        self.deadline_seconds = deadline_seconds
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.default_hedge_seconds = default_hedge_seconds
+        self.latency = {name: LatencyTracker() for name in BACKENDS}
+        self.decisions = Counter()
+        self.recent_decisions = deque(maxlen=50)
+        self._lock = Lock()
+
+    def _tracker(self, name):
+        with self._lock:
+            if name not in self.latency:
+                self.latency[name] = LatencyTracker()
+            return self.latency[name]
+
+    def hedge_delay(self):
+        """Seconds to wait on the primary before hedging to the secondary."""
+        tracker = self._tracker(self.primary)
+        if len(tracker.recent) < self.hedge_min_samples:
+            return self.default_hedge_seconds
+        return min(tracker.percentile(self.hedge_percentile), self.deadline_seconds)
+
+    def _submit(self, name, user_profile, start_date):
+        """Starts one backend attempt in its own thread and returns its Future."""
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self._call(name, user_profile, start_date))
+            except Exception as e:
+                future.set_exception(e)
+
+        Thread(target=run, daemon=True, name=f'ai-router-{name}').start()
+        return future
+
+    def _call(self, name, user_profile, start_date):
+        started = time.monotonic()
+        close_old_connections()
+        try:
+            # Every attempt, including hedges that lose the race, gets a telemetry row
+            with track_generation(name) as metrics:
+                result = BACKENDS[name](user_profile, start_date)
+                metrics.model_version = result[2]
+        except Exception:
+            self._tracker(name).record(time.monotonic() - started, ok=False)
+            raise
+        finally:
+            close_old_connections()
+        self._tracker(name).record(time.monotonic() - started)
+        return result
+
+    def _record_decision(self, decision, backend, started, errors):
+        elapsed = round(time.monotonic() - started, 3)
+        with self._lock:
+            self.decisions[decision] += 1
+            self.recent_decisions.append({
+                'decision': decision,
+                'backend': backend,
+                'seconds': elapsed,
+                'errors': errors,
+            })
+        print(f"AI router: {decision} -> {backend} in {elapsed}s" + (f" (errors: {errors})" if errors else ""))
+
+    def generate(self, user_profile, start_date):
+        """
+        Returns (backend_name, prompt, plan_data, model_version) or raises if even the
+        fallback backend failed.
+        """
+        started = time.monotonic()
+        if self.simple_profile_backend and is_simple_profile(user_profile):
+            prompt, plan_data, model_version = self._call(self.simple_profile_backend, user_profile, start_date)
+            self._record_decision('simple_profile', self.simple_profile_backend, started, {})
+            return self.simple_profile_backend, prompt, plan_data, model_version
+
+        deadline = started + self.deadline_seconds
+        hedge_at = started + self.hedge_delay()
+
+        futures = {self._submit(self.primary, user_profile, start_date): self.primary}
+        hedged = not self.secondary or self.secondary == self.primary
+        errors = {}
+
+        while futures:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            next_wakeup = deadline if hedged else min(hedge_at, deadline)
+            done, _ = wait(futures, timeout=max(0, next_wakeup - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = futures.pop(future)
+                try:
+                    prompt, plan_data, model_version = future.result()
+                except Exception as e:
+                    errors[name] = str(e)
+                    continue
+                decision = 'primary' if name == self.primary else 'hedge'
+                self._record_decision(decision, name, started, errors)
+                return name, prompt, plan_data, model_version
+
+            # Hedge once the primary is slower than usual, or straight away if it failed
+            if not hedged and (time.monotonic() >= hedge_at or not futures):
+                futures[self._submit(self.secondary, user_profile, start_date)] = self.secondary
+                hedged = True
+
+        decision = 'deadline_fallback' if futures else 'error_fallback'
+        prompt, plan_data, model_version = self._call(self.fallback, user_profile, start_date)
+        self._record_decision(decision, self.fallback, started, errors)
+        return self.fallback, prompt, plan_data, model_version
+
+    def stats(self):
+        with self._lock:
+            decisions = dict(self.decisions)
+            recent = list(self.recent_decisions)
+            names = list(self.latency)
+        return {
+            'primary': self.primary,
+            'secondary': self.secondary,
+            'fallback': self.fallback,
+            'simple_profile_backend': self.simple_profile_backend,
+            'deadline_seconds': self.deadline_seconds,
+            'hedge_delay_seconds': self.hedge_delay(),
+            'decisions': decisions,
+            'recent_decisions': recent,
+            'latency': {name: self._tracker(name).snapshot() for name in names},
+        }
+
+
+_router = None
+_router_lock = Lock()
+
+
+def get_router():
+    """Get or create the router configured from settings"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = BackendRouter(
+                primary=settings.AI_PRIMARY_BACKEND,
+                secondary=settings.AI_SECONDARY_BACKEND,
+                fallback=settings.AI_FALLBACK_BACKEND,
+                deadline_seconds=settings.AI_DEADLINE_SECONDS,
+                hedge_percentile=settings.AI_HEDGE_PERCENTILE,
+                hedge_min_samples=settings.AI_HEDGE_MIN_SAMPLES,
+                default_hedge_seconds=settings.AI_HEDGE_DEFAULT_SECONDS,
+                simple_profile_backend='rules' if settings.AI_RULES_FOR_SIMPLE_PROFILES else None,
+            )
+    return _router
+
+
+def router_stats():
+    return get_router().stats()
+
+
+def generate_and_save_plan_for_user(user_profile: Profile, start_date: date, replaces=None):
+    """
+    Generates a new fitness and nutrition plan with whichever backend the router
+    picks and saves it to the database. Returns None if no plan could be made.
+    `replaces` is passed on to save_generated_plan.
+    """
+    print(f"Generating plan for user: {user_profile.user.username}")
+
+    fingerprint = profile_fingerprint(user_profile)
+    plan_data = get_cached_plan(fingerprint)
+    prompt = ''
+    model_version = CACHED_PLAN_MODEL_VERSION
+    if plan_data is not None:
+        print(f"Using cached plan template: {fingerprint}")
+    else:
+        try:
+            backend, prompt, plan_data, model_version = get_router().generate(user_profile, start_date)
+        except Exception as e:
+            print(f"Error generating plan: {e}")
+            return None
+        # Rule-based plans are cheaper to make again than to share
+        if backend not in (settings.AI_FALLBACK_BACKEND, 'rules'):
+            store_cached_plan(fingerprint, plan_data)
+
+    try:
+        new_plan = save_generated_plan(
+            user_profile,
+            plan_data,
+            start_date=start_date,
+            end_date=start_date + timedelta(days=6),
+            prompt=prompt,
+            model_version=model_version,
+            replaces=replaces
+        )
+        print(f"Plan successfully generated and saved for user: {user_profile.user.username}")
+        return new_plan
+    except Exception as e:
+        print(f"Error saving plan to database: {e}")
+        return None
@@ -1,16 +1,50 @@
 # rest/ai_services.py (or views.py)
+import time
+from collections import deque
+
+import httpx
+from asgiref.sync import sync_to_async
 from google import genai
 from google.genai import types
 from os import getenv
 from django.conf import settings
-from django.db import transaction
-from .models import Profile, FitnessPlan, WorkoutDay, Exercise, NutritionDay, Meal
-from .schemas import GeneratedPlanSchema # Import your new Pydantic schema
-from datetime import date, timedelta
+from .food_catalog import catalog_instruction, catalog_targets_prompt
+from .gemini_context_cache import GeminiContextCache
+from .models import Profile
+from .plan_fanout import generate_plan_fanout
+from .plan_recovery import load_plan_text, aload_plan_text
+from .plan_wire import use_compact_schema, expand_plan_text
+from .rule_engine import energy_targets
+from .schemas import GeneratedPlanSchema, CompactPlanSchema, CatalogPlanSchema # Import your new Pydantic schema
+from . import telemetry
+from datetime import date
 import json
 
-client = genai.Client(api_key=getenv('GOOGLE_AI_API_KEY')
-                   
+# Recorded on every plan it generates, see FitnessPlan.model_version
+GEMINI_MODEL = "gemini-2.5-flash"
+
+
+def gemini_http_options(base_url=None):
+    """
+    HTTP options for the Gemini client. The async connection pool is sized
+    for many concurrent generations instead of httpx's default of 100, and
+    every call gives up after GEMINI_TIMEOUT_SECONDS so a stalled upstream
+    doesn't hold threads (e.g. hedges that lost the race) indefinitely.
+    """
+    max_connections = int(getenv('GEMINI_MAX_CONNECTIONS', 500))
+    timeout_seconds = float(getenv('GEMINI_TIMEOUT_SECONDS', 120))
+    return types.HttpOptions(
+        base_url=base_url,
+        timeout=int(timeout_seconds * 1000),
+        async_client_args={'limits': httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)},
+    )
+
+
+# One client per process: it keeps its HTTP connection pools (sync and
+# `client.aio`) open, so connections are reused across requests.
+# GEMINI_BASE_URL can point it at a local stand-in such as rest/gemini_stub.py.
+client = genai.Client(api_key=getenv('GOOGLE_AI_API_KEY'),
+                      http_options=gemini_http_options(getenv('GEMINI_BASE_URL'))
                   )
 
 # res = client.models.generate_content(
@@ -50,18 +84,120 @@ client = genai.Client(api_key=getenv('GOOGLE_AI_API_KEY')
 # It's best practice to do this once, not in every function call.
 
 
-def generate_and_save_plan_for_user(user_profile: Profile, start_date: date):
+# The instructions every plan request shares. They are sent as the system
+# instruction, from the context cache when it is enabled, so each request
+# only carries the user-specific prompt below.
+PLAN_SYSTEM_INSTRUCTION = """
+    Generate a comprehensive 7-day fitness and nutrition plan for a user in Ghana.
+    The response MUST be a valid JSON object that adheres to the provided schema.
+
+    Instructions:
+    - The nutrition plan must focus on common, accessible Ghanaian foods.
+    - The workout plan should include exercises that require minimal or no gym equipment.
+    - The workouts do not necessarily have to be localized to Ghana.
+    - Ensure all fields in the schema are populated accurately. For rest days, the 'exercises' list should be empty.
+    - Ensure days and dates matches the provided plan details.
+    - Plans are supposed to span up to a maximum of 7 days (weekly, Monday to Sunday).
     """
-    Generates a new fitness and nutrition plan using the Gemini API
-    with structured output and saves it to the database.
+
+# Recent per-call usage, split by whether the context cache was used
+_usage = {'cached': deque(maxlen=200), 'inline': deque(maxlen=200)}
+# One context cache per set of instructions, see instructions_key()
+_context_caches = {}
+
+
+def instructions_key(response_schema=None):
+    """Which instructions a request with `response_schema` gets: 'catalog' or 'plan'."""
+    return 'catalog' if response_schema is CatalogPlanSchema else 'plan'
+
+
+def plan_system_instruction(response_schema=None):
+    """
+    PLAN_SYSTEM_INSTRUCTION, followed by the food catalog for CatalogPlanSchema
+    requests. Every other schema (fan-out days, recovery continuations) asks
+    for meal descriptions and macros, which the catalog block says not to write.
     """
+    if instructions_key(response_schema) == 'catalog':
+        return PLAN_SYSTEM_INSTRUCTION + catalog_instruction()
+    return PLAN_SYSTEM_INSTRUCTION
+
+
+def get_context_cache(response_schema=None):
+    """The context cache for plan_system_instruction(response_schema), or None when GEMINI_CONTEXT_CACHE is off."""
+    if not settings.GEMINI_CONTEXT_CACHE:
+        return None
+    key = instructions_key(response_schema)
+    system_instruction = plan_system_instruction(response_schema)
+    context_cache = _context_caches.get(key)
+    # A changed catalog needs a new cache; the old one simply expires
+    if context_cache is None or context_cache.system_instruction != system_instruction:
+        context_cache = _context_caches[key] = GeminiContextCache(
+            client, GEMINI_MODEL, system_instruction,
+            ttl_seconds=settings.GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+            display_name=f'{key}-instructions',
+            min_tokens=settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+        )
+    return context_cache
+
+
+def cached_content_name(response_schema=None):
+    context_cache = get_context_cache(response_schema)
+    return context_cache.name() if context_cache else None
+
+
+def plan_instructions(response_schema=None):
+    """
+    (cached_content, system_instruction) for a request with `response_schema`:
+    the context cache name, or else the instructions to send inline.
+    """
+    cached_content = cached_content_name(response_schema)
+    return cached_content, None if cached_content else plan_system_instruction(response_schema)
+
+
+async def aplan_instructions(response_schema=None):
+    # Creating or refreshing the cache and reading the catalog are rare, so they just run in a thread
+    return await sync_to_async(plan_instructions, thread_sensitive=False)(response_schema)
+
+
+def record_usage(call, response, started, cached_content):
+    """
+    Logs the prompt tokens and latency of one call, keeps them for
+    gemini_usage_stats() and adds them to the generation's telemetry.
+    """
+    latency = time.perf_counter() - started
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    cached_tokens = getattr(usage, 'cached_content_token_count', None) or 0
+    telemetry.add_usage(prompt_tokens=prompt_tokens, output_tokens=getattr(usage, 'candidates_token_count', None))
+    kind = 'cached' if cached_content else 'inline'
+    _usage[kind].append({'prompt_tokens': prompt_tokens or 0, 'cached_tokens': cached_tokens, 'latency': latency})
+    print(f"[gemini] {call} instructions={kind} prompt_tokens={prompt_tokens} "
+          f"cached_tokens={cached_tokens} latency={latency:.2f}s")
 
-    print(f"Generating plan for user: {user_profile.user.username}")
-    # 1. Construct a detailed prompt from the user's profile
-    prompt = f"""
-    Generate a comprehensive 7-day fitness and nutrition plan for a user in Ghana.
-    The response MUST be a valid JSON object that adheres to the provided schema.
 
+def gemini_usage_stats():
+    stats = {}
+    for kind, samples in _usage.items():
+        samples = list(samples)
+        count = len(samples)
+        stats[kind] = {
+            'calls': count,
+            'avg_prompt_tokens': round(sum(s['prompt_tokens'] for s in samples) / count) if count else None,
+            'avg_uncached_prompt_tokens': round(sum(s['prompt_tokens'] - s['cached_tokens'] for s in samples) / count) if count else None,
+            'avg_latency_seconds': round(sum(s['latency'] for s in samples) / count, 3) if count else None,
+        }
+    stats['context_cache'] = {key: cache.stats() for key, cache in _context_caches.items()} \
+        if settings.GEMINI_CONTEXT_CACHE else None
+    return stats
+
+
+def build_plan_prompt(user_profile: Profile, start_date: date):
+    """
+    Constructs the user-specific prompt. The shared instructions are in
+    PLAN_SYSTEM_INSTRUCTION.
+    """
+    catalog_targets = catalog_targets_prompt(user_profile) if settings.PLAN_WIRE_SCHEMA == 'catalog' else ''
+    return f"""
     User Details:
     - Age: {user_profile.age}
     - Gender: {user_profile.gender}
@@ -78,115 +214,149 @@ def generate_and_save_plan_for_user(user_profile: Profile, start_date: date):
     
     Plan Details:
     - Start Date: {start_date} weekday = {start_date.isoweekday()}
+    {catalog_targets}"""
 
-    Instructions:
-    - The nutrition plan must focus on common, accessible Ghanaian foods.
-    - The workout plan should include exercises that require minimal or no gym equipment.
-    - The workouts do not necessarily have to be localized to Ghana.
-    - Ensure all fields in the schema are populated accurately. For rest days, the 'exercises' list should be empty.
-    - Ensure days and dates matches the provided plan details.
-    - Plans are supposed to span up to a maximum of 7 days (weekly, Monday to Sunday).
+
+def plan_generation_config(response_schema=GeneratedPlanSchema, cached_content=None, system_instruction=None):
+    """
+    The generation config shared by every plan request. The instructions come
+    from `cached_content` if given, otherwise they are sent inline. The response
+    schema is part of the generation config, which the API doesn't cache, so it
+    is sent with every request either way.
     """
+    if not cached_content and system_instruction is None:
+        system_instruction = plan_system_instruction(response_schema)
+    return types.GenerateContentConfig(
+        cached_content=cached_content,
+        system_instruction=None if cached_content else system_instruction,
+        thinking_config=types.ThinkingConfig(thinking_budget=0),
+        safety_settings=[
+            types.SafetySetting(
+                category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+                threshold=types.HarmBlockThreshold.BLOCK_NONE
+            ),
+            types.SafetySetting(
+                category=types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+                threshold=types.HarmBlockThreshold.BLOCK_NONE
+            ),
+            types.SafetySetting(
+                category=types.HarmCategory.HARM_CATEGORY_HARASSMENT,
+                threshold=types.HarmBlockThreshold.BLOCK_NONE
+            ),
+            types.SafetySetting(
+                category=types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+                threshold=types.HarmBlockThreshold.BLOCK_NONE
+            )
+        ],
+        response_mime_type="application/json",
+        response_schema=response_schema,  # Use the Pydantic schema for validation
+    )
 
-    # 2. Call the Gemini API with your Pydantic schema
-    try:
-        
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",  # Use the appropriate model
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0),
-                safety_settings=[
-                    types.SafetySetting(
-                        category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-                        threshold=types.HarmBlockThreshold.BLOCK_NONE
-                    ),
-                    types.SafetySetting(
-                        category=types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
-                        threshold=types.HarmBlockThreshold.BLOCK_NONE
-                    ),
-                    types.SafetySetting(
-                        category=types.HarmCategory.HARM_CATEGORY_HARASSMENT,
-                        threshold=types.HarmBlockThreshold.BLOCK_NONE
-                    ),
-                    types.SafetySetting(
-                        category=types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
-                        threshold=types.HarmBlockThreshold.BLOCK_NONE
-                    )
-                ],
-                response_mime_type="application/json",
-                response_schema=GeneratedPlanSchema,  # Use the Pydantic schema for validation
-        )
-        )
-        
-        # The response.text will be a JSON string that is guaranteed to match your Pydantic schema
-        plan_data = json.loads(response.text)
 
-    except Exception as e:
-        # Handle potential API errors (e.g., content filtering, bad response)
-        print(f"Error calling Gemini API: {e}")
-        return None
+def plan_response_schema():
+    """The response schema of whole-plan requests, see PLAN_WIRE_SCHEMA."""
+    if settings.PLAN_WIRE_SCHEMA == 'catalog':
+        return CatalogPlanSchema
+    return CompactPlanSchema if use_compact_schema() else GeneratedPlanSchema
+
+
+def request_plan_data(prompt, targets=None):
+    """
+    Calls the Gemini API with the plan response schema and returns the
+    parsed plan data. A compact or catalog response is expanded to
+    GeneratedPlanSchema first (see rest/plan_wire.py), catalog days getting
+    `targets` (the profile's energy_targets()). A response that was cut off is completed
+    by asking only for its missing days (see rest/plan_recovery.py).
+    """
+    response_schema = plan_response_schema()
+    cached_content, system_instruction = plan_instructions(response_schema)
+    started = time.perf_counter()
+    response = client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=prompt,
+        config=plan_generation_config(response_schema, cached_content, system_instruction),
+    )
+    record_usage('plan', response, started, cached_content)
+
+    # The response.text will be a JSON string that matches your Pydantic schema unless it was cut off
+    return load_plan_text(prompt, expand_plan_text(response.text, targets), request_json)
+
+
+def request_json(prompt, response_schema):
+    """
+    Calls the Gemini API for any Pydantic response schema and returns the JSON text.
+    Used by the fan-out mode for the weekly skeleton and the per-day requests.
+    """
+    cached_content, system_instruction = plan_instructions(response_schema)
+    started = time.perf_counter()
+    response = client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=prompt,
+        config=plan_generation_config(response_schema, cached_content, system_instruction),
+    )
+    record_usage(response_schema.__name__, response, started, cached_content)
+    return response.text
+
+
+async def arequest_plan_data(prompt, targets=None):
+    """Async version of request_plan_data, using the client's aio interface."""
+    response_schema = plan_response_schema()
+    cached_content, system_instruction = await aplan_instructions(response_schema)
+    started = time.perf_counter()
+    response = await client.aio.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=prompt,
+        config=plan_generation_config(response_schema, cached_content, system_instruction),
+    )
+    record_usage('plan', response, started, cached_content)
+    text = await sync_to_async(expand_plan_text, thread_sensitive=False)(response.text, targets)
+    return await aload_plan_text(prompt, text, arequest_json)
 
-    # 3. Parse the validated data and save it to your Django models
-    # The data is already validated by Pydantic via the API!
-    
-    print(f"Generated plan data: {plan_data}")
-    # Create the main FitnessPlan object
-    try: 
-        with transaction.atomic():
-            new_plan = FitnessPlan.objects.create(
-                profile=user_profile,
-                start_date=start_date,
-                end_date=start_date + timedelta(days=6),
-                goal_at_creation=user_profile.goal,
-                ai_prompt_text=prompt,
-                ai_response_raw=plan_data
-            )
 
-            # Create Workout Days and Exercises
-            for wd_data in plan_data['workout_days']:
-                workout_day = WorkoutDay.objects.create(
-                    plan=new_plan,
-                    day_of_week=wd_data['day_of_week'],
-                    title=wd_data['title'],
-                    description=wd_data['description'],
-                    is_rest_day=wd_data['is_rest_day']
-                )
-                for ex_data in wd_data['exercises']:
-                    Exercise.objects.create(
-                        workout_day=workout_day,
-                        name=ex_data['name'],
-                        sets=ex_data['sets'],
-                        reps=ex_data['reps'],
-                        rest_period_seconds=ex_data['rest_period_seconds'],
-                        notes=ex_data['notes']
-                    )
-
-            # Create Nutrition Days and Meals
-            for nd_data in plan_data['nutrition_days']:
-                nutrition_day = NutritionDay.objects.create(
-                    plan=new_plan,
-                    day_of_week=nd_data['day_of_week'],
-                    notes=nd_data['notes'],
-                    target_calories=nd_data['target_calories'],
-                    target_protein_grams=nd_data['target_protein_grams'],
-                    target_carbs_grams=nd_data['target_carbs_grams'],
-                    target_fats_grams=nd_data['target_fats_grams'],
-                    target_water_litres=nd_data['target_water_litres'] # Handle optional field
-                )
-                for meal_data in nd_data['meals']:
-                    Meal.objects.create(
-                        nutrition_day=nutrition_day,
-                        meal_type=meal_data['meal_type'],
-                        description=meal_data['description'],
-                        calories=meal_data['calories'],
-                        protein_grams=meal_data['protein_grams'],
-                        carbs_grams=meal_data['carbs_grams'],
-                        fats_grams=meal_data['fats_grams'],
-                        portion_size=meal_data['portion_size']
-                    )
-        print(f"Plan successfully generated and saved for user: {user_profile.user.username}")
-        return new_plan
-    except Exception as e:
-        print(f"Error saving plan to database: {e}")
-        return None
\ No newline at end of file
+async def arequest_json(prompt, response_schema):
+    """Async version of request_json."""
+    cached_content, system_instruction = await aplan_instructions(response_schema)
+    started = time.perf_counter()
+    response = await client.aio.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=prompt,
+        config=plan_generation_config(response_schema, cached_content, system_instruction),
+    )
+    record_usage(response_schema.__name__, response, started, cached_content)
+    return response.text
+
+
+def stream_plan_text(prompt):
+    """
+    Calls the Gemini streaming API and yields the plan JSON text
+    chunk by chunk as it is generated.
+    """
+    cached_content, system_instruction = plan_instructions()
+    started = time.perf_counter()
+    chunk = None
+    for chunk in client.models.generate_content_stream(
+        model=GEMINI_MODEL,
+        contents=prompt,
+        config=plan_generation_config(cached_content=cached_content, system_instruction=system_instruction),
+    ):
+        if chunk.text:
+            telemetry.first_token()
+            yield chunk.text
+    # Usage arrives with the last chunk
+    record_usage('stream', chunk, started, cached_content)
+
+
+def plan_targets(user_profile: Profile):
+    """The daily targets catalog plans are given, the ones catalog_targets_prompt() asks for."""
+    return energy_targets(user_profile) if settings.PLAN_WIRE_SCHEMA == 'catalog' else None
+
+
+def generate_plan_data(user_profile: Profile, start_date: date):
+    """
+    Generates plan data with the Gemini API without caching or saving it.
+    Returns (prompt, plan_data) and raises on API or parsing errors.
+    """
+    prompt = build_plan_prompt(user_profile, start_date)
+    if settings.PLAN_GENERATION_MODE == 'fanout':
+        return prompt, generate_plan_fanout(prompt, request_json)
+    return prompt, request_plan_data(prompt, plan_targets(user_profile))
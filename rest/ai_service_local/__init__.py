@@ -1 +0,0 @@
-# ai_service_local package
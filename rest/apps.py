@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+
+
+def _recover_jobs(**kwargs):
+    """Recovers the generation jobs a previous process left behind, once, when this one serves its first request."""
+    request_started.disconnect(dispatch_uid='rest-recover-jobs')
+    from django.conf import settings
+    if settings.PLAN_JOB_BACKEND == 'thread':
+        from .jobs import get_executor, recover_jobs
+        get_executor().submit(recover_jobs)
 
 
 class RestConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rest'
+
+    def ready(self):
+        # Not here: ready() also runs for migrate and other management commands
+        request_started.connect(_recover_jobs, dispatch_uid='rest-recover-jobs')
@@ -0,0 +1,95 @@
+# rest/async_views.py
+import json
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework.authtoken.models import Token
+
+from .authentication import CustomTokenAuthentication
+from .jobs import active_jobs, run_job_now
+from .models import Profile, FitnessPlan
+from .serializers import FitnessPlanSerializer
+
+
+async def _aget_user(request):
+    """Async equivalent of CustomTokenAuthentication ('Authorization: Bearer <token>')."""
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) != 2 or parts[0] != CustomTokenAuthentication.keyword:
+        return None
+    try:
+        token = await Token.objects.select_related('user').aget(key=parts[1])
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def me_plans_async(request):
+    """
+    POST: Generate a new fitness plan for the authenticated user without
+    holding a worker thread while the request waits.
+
+    Runs natively under ASGI: authentication and validation use the async ORM.
+    The plan itself goes the same way as a queued job (plan cache, then the AI
+    router with its deadline, hedging and fallback, then the save), run in a
+    thread and recorded as a GenerationJob so the duplicate check applies.
+    """
+    user = await _aget_user(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    try:
+        profile = await Profile.objects.select_related('user').aget(user=user)
+    except Profile.DoesNotExist:
+        return JsonResponse({"detail": "Profile not found. Please create a profile first."}, status=404)
+
+    try:
+        start_date_str = json.loads(request.body or b'{}').get('start_date')
+    except (ValueError, AttributeError):
+        return JsonResponse({"detail": "Invalid JSON body."}, status=400)
+    if not start_date_str:
+        return JsonResponse({"detail": "start_date is required."}, status=400)
+
+    try:
+        from dateutil.parser import isoparse
+        start_date = isoparse(start_date_str).date()
+    except (ValueError, ImportError):
+        return JsonResponse({"detail": "Invalid date format. Use ISO 8601 format."}, status=400)
+
+    if (date.today() - start_date).days > 6:
+        return JsonResponse({"detail": "Cannot create plan for a past date."}, status=400)
+
+    overlapping_plans = FitnessPlan.objects.filter(
+        profile=profile,
+        start_date__lte=start_date,
+        end_date__gte=start_date
+    )
+    if await overlapping_plans.aexists():
+        return JsonResponse({"detail": "A plan already exists for the selected date range."}, status=400)
+
+    if await active_jobs().filter(profile=profile, start_date=start_date).aexists():
+        return JsonResponse({"detail": "A plan is already being generated for the selected date."}, status=400)
+
+    # Fail fast when plans come from the local model and its queue is already full
+    if settings.AI_PRIMARY_BACKEND == 'local':
+        from ai_local.services import get_inference_scheduler
+        scheduler = get_inference_scheduler()
+        if scheduler.is_full():
+            response = JsonResponse({"detail": "The local model is busy. Please try again shortly."}, status=503)
+            response['Retry-After'] = str(scheduler.retry_after())
+            return response
+
+    job = await sync_to_async(run_job_now, thread_sensitive=False)(profile, start_date)
+    if job.plan is None:
+        return JsonResponse({"detail": "Failed to generate fitness plan."}, status=500)
+
+    data = await sync_to_async(lambda: FitnessPlanSerializer(job.plan).data)()
+    return JsonResponse({
+        "message": "Fitness plan generated successfully.",
+        "plan": data
+    }, status=201)
@@ -0,0 +1,131 @@
+# rest/food_catalog.py
+import json
+import time
+from threading import Lock
+
+from pydantic import ValidationError
+
+from .models import FoodItem
+from .rule_engine import energy_targets
+from .schemas import CatalogPlanSchema, GeneratedPlanSchema
+
+# How long the catalog text in the instructions is reused before it is read again
+CATALOG_REFRESH_SECONDS = 300
+
+_catalog_text = None
+_catalog_read_at = 0
+_catalog_lock = Lock()
+
+CATALOG_INSTRUCTION = """
+    Food catalog:
+    - Build every meal from the foods below. For each food give its id and the number of portions (in steps of 0.25).
+    - Do not write meal descriptions or macros, they are computed from the catalog.
+    - Choose portions so each day's meals add up to the user's daily energy target.
+    - Respect allergies, dislikes and dietary preferences using the tags.
+    id | food | portion | kcal | protein g | carbs g | fat g | tags
+"""
+
+
+def catalog_instruction():
+    """
+    The catalog section of the plan instructions: every active food with the
+    macros of one portion. It is read from the database at most every
+    CATALOG_REFRESH_SECONDS, so it stays identical between requests and can
+    live in the Gemini context cache with the rest of the instructions.
+    """
+    global _catalog_text, _catalog_read_at
+    with _catalog_lock:
+        if _catalog_text is None or time.time() - _catalog_read_at > CATALOG_REFRESH_SECONDS:
+            foods = FoodItem.objects.filter(is_active=True).order_by('pk')
+            lines = [
+                f"    {food.pk} | {food.name} | {food.portion} | {food.calories} | {food.protein_grams:g} | "
+                f"{food.carbs_grams:g} | {food.fats_grams:g} | {food.tags}"
+                for food in foods
+            ]
+            _catalog_text = CATALOG_INSTRUCTION + '\n'.join(lines) + '\n'
+            _catalog_read_at = time.time()
+        return _catalog_text
+
+
+def catalog_targets_prompt(user_profile):
+    """The daily energy target the catalog portions should add up to, for the user prompt."""
+    targets = energy_targets(user_profile)
+    return f"""- Daily energy target: {targets['calories']} kcal ({targets['protein_grams']} g protein, {targets['carbs_grams']} g carbs, {targets['fats_grams']} g fat)
+    """
+
+
+def describe_foods(items):
+    """A meal description from its (food, portions) items, e.g. 'Waakye with boiled egg and fried fish'."""
+    names = [food.name for food, _ in items]
+    if len(names) == 1:
+        return names[0]
+    rest = names[1:]
+    sides = rest[0] if len(rest) == 1 else f"{', '.join(rest[:-1])} and {rest[-1]}"
+    return f"{names[0]} with {sides[0].lower()}{sides[1:]}"
+
+
+def _meal(meal_type, items):
+    return {
+        'meal_type': meal_type,
+        'description': describe_foods(items)[:255],
+        'calories': round(sum(food.calories * portions for food, portions in items)),
+        'protein_grams': round(sum(food.protein_grams * portions for food, portions in items), 1),
+        'carbs_grams': round(sum(food.carbs_grams * portions for food, portions in items), 1),
+        'fats_grams': round(sum(food.fats_grams * portions for food, portions in items), 1),
+        'portion_size': ', '.join(f"{portions:g} x {food.portion}" for food, portions in items)[:100],
+    }
+
+
+def expand_catalog_plan(plan_data, targets=None):
+    """
+    Converts CatalogPlanSchema data into GeneratedPlanSchema data. Every food
+    of the week is loaded with one in_bulk() query and meal macros are the
+    catalog values times the portions. The day targets are `targets`, the
+    profile's energy_targets() the portions were chosen for, or left empty
+    without them. Unknown food IDs are dropped, as is a meal left without
+    foods and a day left without meals, so plan recovery asks for that day again.
+    """
+    plan = CatalogPlanSchema.model_validate(plan_data)
+    food_ids = {food.id for day in plan.nutrition_days for meal in day.meals for food in meal.foods}
+    foods = FoodItem.objects.in_bulk(food_ids)
+    unknown = food_ids - foods.keys()
+    if unknown:
+        print(f"Dropping unknown catalog food IDs {sorted(unknown)}")
+
+    nutrition_days = []
+    for day in plan.nutrition_days:
+        meals = []
+        for meal in day.meals:
+            items = [(foods[food.id], food.portions) for food in meal.foods if food.id in foods]
+            if items:
+                meals.append(_meal(meal.meal_type, items))
+        if not meals:
+            print(f"Dropping nutrition day {day.day_of_week}, none of its foods are in the catalog")
+            continue
+        nutrition_days.append({
+            'day_of_week': day.day_of_week,
+            'target_calories': targets['calories'] if targets else None,
+            'target_protein_grams': targets['protein_grams'] if targets else None,
+            'target_carbs_grams': targets['carbs_grams'] if targets else None,
+            'target_fats_grams': targets['fats_grams'] if targets else None,
+            'target_water_litres': day.target_water_litres,
+            'notes': day.notes,
+            'meals': meals,
+        })
+
+    return GeneratedPlanSchema(
+        workout_days=[day.model_dump() for day in plan.workout_days],
+        nutrition_days=nutrition_days,
+    ).model_dump()
+
+
+def expand_catalog_plan_text(text, targets=None):
+    """
+    Returns catalog plan JSON text as GeneratedPlanSchema JSON text, or the
+    text unchanged if it isn't a valid catalog plan (see plan_wire.expand_plan_text).
+    """
+    try:
+        plan = CatalogPlanSchema.model_validate_json(text or '')
+    except ValidationError:
+        return text
+    return json.dumps(expand_catalog_plan(plan.model_dump(), targets))
@@ -0,0 +1,235 @@
+# rest/food_matcher.py
+"""
+Maps free-text meal descriptions such as "Waakye with boiled egg and fish"
+to catalog foods (FoodItem) with estimated portions, without an AI call.
+
+Every food name and alias in the lexicon is indexed by its character
+trigrams. A description is split at connectors ("with", "and", commas)
+into phrases; every run of up to three words in a phrase is looked up in
+the index and scored against the candidates that share trigrams with it
+(Dice coefficient). The best non-overlapping matches above the threshold
+win. Quantities written before a food ("2 eggs", "half a ball") become the
+portion estimate.
+"""
+import re
+import time
+from collections import defaultdict, namedtuple
+from threading import Lock
+
+from django.db import transaction
+
+from .models import FoodItem, MealFoodMatch
+
+# Names people write for catalog foods besides the catalog name
+ALIASES = {
+    'waakye': ['waakye', 'waache'],
+    'jollof_rice': ['jollof'],
+    'plain_rice': ['rice', 'white rice', 'plain rice', 'fried rice'],
+    'banku': ['banku'],
+    'kenkey': ['kenkey', 'dokon'],
+    'fufu': ['fufu', 'fufuo'],
+    'tuo_zaafi': ['tuo zaafi', 'tuo zafi', 'tuo'],
+    'omo_tuo': ['omo tuo', 'rice balls'],
+    'boiled_yam': ['yam', 'ampesi'],
+    'boiled_plantain': ['boiled plantain', 'unripe plantain', 'green plantain'],
+    'fried_ripe_plantain': ['plantain', 'ripe plantain', 'fried plantain', 'dodo'],
+    'roasted_plantain': ['roasted plantain', 'kofi brokeman', 'kofi broke man'],
+    'boiled_cocoyam': ['cocoyam'],
+    'boiled_cassava': ['cassava'],
+    'sweet_potato': ['sweet potato', 'sweet potatoes'],
+    'gari_foto': ['gari foto', 'gari fotor'],
+    'eba': ['eba', 'gari'],
+    'wholewheat_bread': ['bread', 'wheat bread', 'brown bread'],
+    'oats_porridge': ['oats', 'oatmeal', 'porridge'],
+    'hausa_koko': ['hausa koko', 'koko', 'millet porridge'],
+    'tom_brown': ['tom brown'],
+    'rice_water': ['rice water'],
+    'boiled_corn': ['corn', 'maize'],
+    'boiled_egg': ['egg', 'eggs', 'boiled egg', 'boiled eggs'],
+    'koose': ['koose', 'kose', 'akara'],
+    'grilled_tilapia': ['tilapia', 'grilled fish'],
+    'fried_fish': ['fish', 'fried fish', 'herrings'],
+    'smoked_mackerel': ['mackerel', 'smoked fish', 'salmon'],
+    'grilled_chicken': ['chicken', 'grilled chicken', 'chicken breast'],
+    'goat_meat': ['goat', 'goat meat', 'mutton'],
+    'stewed_beef': ['beef', 'meat', 'beef stew', 'stewed beef'],
+    'crab': ['crab', 'crabs'],
+    'wagashi': ['wagashi', 'wagashie', 'cheese'],
+    'boiled_beans': ['beans', 'black eyed beans', 'boiled beans'],
+    'red_red': ['red red', 'bean stew', 'gob3'],
+    'chichinga': ['chichinga', 'kebab', 'suya'],
+    'light_soup': ['light soup', 'pepper soup'],
+    'groundnut_soup': ['groundnut soup', 'peanut soup', 'nkate nkwan'],
+    'palm_nut_soup': ['palm nut soup', 'palmnut soup', 'abenkwan'],
+    'okro_stew': ['okro', 'okra', 'okro stew', 'okro soup'],
+    'kontomire_stew': ['kontomire', 'palava sauce', 'palaver sauce', 'cocoyam leaves'],
+    'garden_egg_stew': ['garden egg', 'garden eggs', 'eggplant'],
+    'ayoyo_soup': ['ayoyo'],
+    'tomato_stew': ['stew', 'tomato stew', 'gravy'],
+    'shito': ['shito', 'black pepper sauce'],
+    'vegetable_salad': ['salad', 'vegetables', 'veggies'],
+    'pawpaw': ['pawpaw', 'papaya'],
+    'orange': ['orange', 'oranges'],
+    'banana': ['banana', 'bananas'],
+    'watermelon': ['watermelon'],
+    'avocado': ['avocado', 'pear'],
+    'plain_yoghurt': ['yoghurt', 'yogurt'],
+    'fresh_milk': ['milk'],
+    'roasted_groundnuts': ['groundnuts', 'peanuts', 'nkatie'],
+    'peanut_butter': ['peanut butter', 'groundnut paste'],
+    'plantain_chips': ['plantain chips', 'chips'],
+    'bofrot': ['bofrot', 'puff puff'],
+}
+
+CONNECTORS = re.compile(r'\s*(?:,|;|&|\+|/|\bwith\b|\band\b|\bplus\b|\bserved\b|\bside of\b)\s*')
+WORD = re.compile(r"[a-z0-9.']+")
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'half': 0.5, 'quarter': 0.25,
+    'small': 0.75, 'medium': 1, 'large': 1.5, 'big': 1.5, 'double': 2,
+}
+MAX_WORDS = 3
+# Lowest Dice score a run of words needs to count as a food. Lower lets in
+# unrelated foods that share a word, e.g. "fried rice" matching fried fish
+THRESHOLD = 0.75
+# How long a built index is reused before the catalog is read again
+REFRESH_SECONDS = 300
+
+FoodMatch = namedtuple('FoodMatch', 'food_id matched_text score portions')
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _portions(words):
+    """The quantity written before a food, e.g. ['2'] -> 2, ['half', 'a'] -> 0.5."""
+    portions = None
+    for word in words:
+        try:
+            value = float(word)
+        except ValueError:
+            value = NUMBER_WORDS.get(word)
+        if value is not None:
+            portions = value if portions is None else portions * value
+    return portions or 1
+
+
+class FoodMatcher:
+    """A trigram index over the food lexicon. Build it with from_catalog()."""
+
+    def __init__(self, names):
+        """`names` maps each lexicon name to the FoodItem id it stands for."""
+        self.names = list(names)
+        self.food_ids = [names[name] for name in self.names]
+        self.grams = [trigrams(name) for name in self.names]
+        self.exact = {name: i for i, name in enumerate(self.names)}
+        self.index = defaultdict(list)
+        for i, grams in enumerate(self.grams):
+            for gram in grams:
+                self.index[gram].append(i)
+
+    @classmethod
+    def from_catalog(cls):
+        names = {}
+        codes = {}
+        for pk, code, name in FoodItem.objects.filter(is_active=True).values_list('pk', 'code', 'name'):
+            codes[code] = pk
+            names[re.sub(r'\s*\(.*\)', '', name).lower()] = pk
+        for code, aliases in ALIASES.items():
+            if code in codes:
+                for alias in aliases:
+                    names.setdefault(alias, codes[code])
+        return cls(names)
+
+    def lookup(self, text):
+        """The best lexicon entry for `text` as (entry index, score), or None."""
+        entry = self.exact.get(text)
+        if entry is not None:
+            return entry, 1.0
+        grams = trigrams(text)
+        shared = defaultdict(int)
+        for gram in grams:
+            for i in self.index.get(gram, ()):
+                shared[i] += 1
+        best, best_score = None, THRESHOLD
+        for i, count in shared.items():
+            score = 2 * count / (len(grams) + len(self.grams[i]))
+            if score > best_score:
+                best, best_score = i, score
+        return None if best is None else (best, best_score)
+
+    def match(self, description):
+        """
+        The foods in a meal description as FoodMatch tuples, at most one per
+        food. Runs of words are taken best first by squared score times
+        length, so a longer close match wins over a shorter exact one inside it.
+        """
+        found = {}
+        for phrase in CONNECTORS.split((description or '').lower()):
+            words = WORD.findall(phrase)
+            candidates = []
+            for start in range(len(words)):
+                for end in range(min(len(words), start + MAX_WORDS), start, -1):
+                    text = ' '.join(words[start:end])
+                    if text in NUMBER_WORDS or len(text) < 3:
+                        continue
+                    result = self.lookup(text)
+                    if result:
+                        # Weighted by length, so "jolof rice" beats the exact but shorter "rice",
+                        # and by the squared score, so extra words don't win on length alone
+                        candidates.append((result[1] ** 2 * len(text), result[1], start, end, result[0]))
+            taken = set()
+            for _, score, start, end, entry in sorted(candidates, reverse=True):
+                if taken.intersection(range(start, end)):
+                    continue
+                taken.update(range(start, end))
+                food_id = self.food_ids[entry]
+                # Quantity words between the previous food and this one, e.g. "half a ball of"
+                before = [i for i in range(max(0, start - 4), start) if i not in taken]
+                portions = _portions([words[i] for i in before])
+                if food_id in found:
+                    # "egg ... and another egg": add up the portions
+                    previous = found[food_id]
+                    found[food_id] = previous._replace(portions=previous.portions + portions)
+                else:
+                    found[food_id] = FoodMatch(food_id, self.names[entry], round(score, 3), portions)
+        return list(found.values())
+
+
+_matcher = None
+_built_at = 0
+_lock = Lock()
+
+
+def get_food_matcher():
+    """The matcher for the current catalog, rebuilt at most every REFRESH_SECONDS."""
+    global _matcher, _built_at
+    with _lock:
+        if _matcher is None or time.time() - _built_at > REFRESH_SECONDS:
+            _matcher = FoodMatcher.from_catalog()
+            _built_at = time.time()
+        return _matcher
+
+
+def build_meal_food_matches(meals, matcher=None):
+    """Unsaved MealFoodMatch rows for saved Meal objects, ready for bulk_create()."""
+    matcher = matcher or get_food_matcher()
+    return [
+        MealFoodMatch(meal_id=meal.pk, food_id=match.food_id, matched_text=match.matched_text,
+                      score=match.score, portions=match.portions)
+        for meal in meals
+        for match in matcher.match(meal.description)
+    ]
+
+
+def save_meal_food_matches(meals):
+    """
+    Matches and saves the foods of just-saved meals, e.g. at plan persistence.
+    Runs in a savepoint and only logs failures, so the meals are kept either way.
+    """
+    try:
+        with transaction.atomic():
+            MealFoodMatch.objects.bulk_create(build_meal_food_matches(meals))
+    except Exception as e:
+        print(f"Error matching meal foods: {e}")
@@ -0,0 +1,120 @@
+# rest/gemini_context_cache.py
+import threading
+import time
+from datetime import timezone
+
+from google.genai import types
+
+
+class GeminiContextCache:
+    """
+    Keeps one Gemini cached content holding the static system instruction.
+
+    Requests then reference it by name (GenerateContentConfig.cached_content)
+    and only send the user-specific prompt. An instruction estimated below
+    `min_tokens` (the model's minimum for explicit caching) is never sent to
+    the API and callers always get None. Otherwise the cache is created on
+    first use and its TTL extended shortly before it expires, both in a
+    background thread, so requests never wait on the caches API: until the
+    cache exists (or while it can't be created) they get None and send the
+    instruction inline. A failed creation is retried after `retry_seconds`.
+    """
+
+    def __init__(self, client, model, system_instruction, ttl_seconds=3600, refresh_margin_seconds=300,
+                 retry_seconds=600, display_name='plan-instructions', min_tokens=1024):
+        self.client = client
+        self.model = model
+        self.system_instruction = system_instruction
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+        self.display_name = display_name
+        # About four characters per token
+        self.estimated_tokens = len(system_instruction) // 4
+        self.min_tokens = min_tokens
+        self._lock = threading.Lock()
+        self._name = None
+        self._expires_at = 0
+        self._retry_at = 0
+        self._updating = False
+        self.cached_tokens = None
+        self.created = 0
+        self.refreshed = 0
+        self.last_error = None
+        if self.estimated_tokens < min_tokens:
+            self.last_error = (f"Instructions of about {self.estimated_tokens} tokens are below the "
+                               f"{min_tokens} token minimum for caching")
+
+    def name(self):
+        """The cached content name to send with a request, or None to send the instruction inline."""
+        if self.estimated_tokens < self.min_tokens:
+            return None
+        with self._lock:
+            now = time.time()
+            if self._name and now < self._expires_at - self.refresh_margin_seconds:
+                return self._name
+            usable = self._name if self._name and now < self._expires_at else None
+            if not self._updating and now >= self._retry_at:
+                self._updating = True
+                threading.Thread(target=self._update, args=(usable,), daemon=True,
+                                 name=f'{self.display_name}-cache').start()
+            return usable
+
+    def _update(self, name):
+        """Creates the cache, or extends `name`'s TTL, outside the lock."""
+        try:
+            cached = self._refresh(name) if name else self._create()
+        except Exception as e:
+            print(f"Gemini context cache unavailable, sending instructions inline: {e}")
+            with self._lock:
+                self.last_error = str(e)
+                self._retry_at = time.time() + self.retry_seconds
+                self._updating = False
+            return
+        with self._lock:
+            self._store(cached)
+            self._updating = False
+
+    def _create(self):
+        cached = self.client.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                display_name=self.display_name,
+                system_instruction=self.system_instruction,
+                ttl=f'{self.ttl_seconds}s',
+            ),
+        )
+        self.created += 1
+        if cached.usage_metadata is not None:
+            self.cached_tokens = cached.usage_metadata.total_token_count
+        print(f"Created Gemini context cache {cached.name} ({self.cached_tokens} tokens)")
+        return cached
+
+    def _refresh(self, name):
+        cached = self.client.caches.update(
+            name=name,
+            config=types.UpdateCachedContentConfig(ttl=f'{self.ttl_seconds}s'),
+        )
+        self.refreshed += 1
+        return cached
+
+    def _store(self, cached):
+        self._name = cached.name
+        self.last_error = None
+        expire_time = cached.expire_time
+        if expire_time is None:
+            self._expires_at = time.time() + self.ttl_seconds
+        else:
+            if expire_time.tzinfo is None:
+                expire_time = expire_time.replace(tzinfo=timezone.utc)
+            self._expires_at = expire_time.timestamp()
+
+    def stats(self):
+        return {
+            'name': self._name,
+            'expires_in_seconds': round(self._expires_at - time.time()) if self._name else None,
+            'cached_tokens': self.cached_tokens,
+            'created': self.created,
+            'refreshed': self.refreshed,
+            'last_error': self.last_error,
+        }
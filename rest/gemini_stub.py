@@ -0,0 +1,224 @@
+# rest/gemini_stub.py
+"""
+A local stand-in for the Gemini generateContent and cachedContents APIs,
+used by the benchmarks and for development without an API key. Point a
+client at it with GEMINI_BASE_URL=<stub.url> (or genai.Client(http_options={'base_url': ...})).
+"""
+import json
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+MODEL_PATH = re.compile(r'^/[^/]+/models/(?P<model>[^:/]+):(?P<method>\w+)')
+CACHE_PATH = re.compile(r'^/[^/]+/cachedContents(?:/(?P<id>[^/?]+))?')
+
+
+def _token_count(value):
+    """Rough token count of a request field, about four characters per token."""
+    return len(json.dumps(value)) // 4 if value else 0
+
+
+class GeminiStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, response_text, delay=0.0, chunk_count=8, host='127.0.0.1', port=0, prompt_token_delay=0.0,
+                 output_token_delay=0.0, min_cache_tokens=1024):
+        """
+        `response_text` is returned as the model output for every request after
+        `delay` seconds plus `prompt_token_delay` seconds per prompt token that
+        isn't in a cached content and `output_token_delay` seconds per output
+        token; streaming requests receive it split into `chunk_count` chunks.
+        Like the real API, cached contents under `min_cache_tokens` are refused.
+        """
+        super().__init__((host, port), _StubHandler)
+        self.response_text = response_text
+        self.delay = delay
+        self.chunk_count = chunk_count
+        self.prompt_token_delay = prompt_token_delay
+        self.output_token_delay = output_token_delay
+        self.min_cache_tokens = min_cache_tokens
+        self.caches = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def cached_tokens(self, body):
+        cache = self.caches.get(body.get('cachedContent'))
+        return cache['usageMetadata']['totalTokenCount'] if cache else 0
+
+    def uncached_prompt_tokens(self, body):
+        return _token_count(body.get('contents')) + _token_count(body.get('systemInstruction'))
+
+    def output_tokens(self):
+        return len(self.response_text) // 4
+
+    def usage_metadata(self, body):
+        # Like the real API, the prompt count includes the tokens read from the cache
+        cached_tokens = self.cached_tokens(body)
+        prompt_tokens = self.uncached_prompt_tokens(body) + cached_tokens
+        output_tokens = self.output_tokens()
+        usage = {
+            'promptTokenCount': prompt_tokens,
+            'candidatesTokenCount': output_tokens,
+            'totalTokenCount': prompt_tokens + output_tokens,
+        }
+        if cached_tokens:
+            usage['cachedContentTokenCount'] = cached_tokens
+        return usage
+
+    def store_cache(self, name, body, previous=None):
+        ttl = float(body.get('ttl', '3600s').rstrip('s'))
+        expire_time = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        cache = dict(previous or {
+            'name': name,
+            'model': body.get('model'),
+            'displayName': body.get('displayName', ''),
+            'usageMetadata': {'totalTokenCount': _token_count(body.get('systemInstruction')) + _token_count(body.get('contents'))},
+        })
+        cache['expireTime'] = expire_time.isoformat().replace('+00:00', 'Z')
+        with self._lock:
+            self.caches[name] = cache
+        return cache
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        body = self._read_json()
+        if CACHE_PATH.match(self.path):
+            with server._lock:
+                server.requests.append({'path': self.path, 'method': 'createCachedContent', 'body': body})
+                name = f'cachedContents/stub-{len(server.caches) + 1}'
+            tokens = _token_count(body.get('systemInstruction')) + _token_count(body.get('contents'))
+            if tokens < server.min_cache_tokens:
+                self._send_json({'error': {'code': 400, 'status': 'INVALID_ARGUMENT', 'message': (
+                    f"Cached content is too small. total_token_count={tokens}, "
+                    f"min_total_token_count={server.min_cache_tokens}")}}, status=400)
+                return
+            self._send_json(server.store_cache(name, body))
+            return
+
+        match = MODEL_PATH.match(self.path)
+        if not match:
+            self._send_json({'error': {'code': 404, 'message': f'Unknown path {self.path}'}}, status=404)
+            return
+
+        method = match.group('method')
+        with server._lock:
+            server.requests.append({'path': self.path, 'method': method, 'body': body})
+
+        if body.get('cachedContent') and body['cachedContent'] not in server.caches:
+            self._send_json({'error': {'code': 403, 'message': f"CachedContent not found: {body['cachedContent']}"}}, status=403)
+            return
+
+        server._enter()
+        try:
+            time.sleep(server.delay + server.prompt_token_delay * server.uncached_prompt_tokens(body)
+                       + server.output_token_delay * server.output_tokens())
+            if method == 'generateContent':
+                self._send_json(self._candidate(server.response_text, body, final=True))
+            elif method == 'streamGenerateContent':
+                self._stream(body)
+            else:
+                self._send_json({'error': {'code': 404, 'message': f'Unknown method {method}'}}, status=404)
+        finally:
+            server._exit()
+
+    def do_PATCH(self):
+        server = self.server
+        body = self._read_json()
+        match = CACHE_PATH.match(self.path)
+        name = f"cachedContents/{match.group('id')}" if match and match.group('id') else None
+        if name not in server.caches:
+            self._send_json({'error': {'code': 404, 'message': f'Unknown cached content {self.path}'}}, status=404)
+            return
+        with server._lock:
+            server.requests.append({'path': self.path, 'method': 'updateCachedContent', 'body': body})
+        self._send_json(server.store_cache(name, body, previous=server.caches[name]))
+
+    def do_GET(self):
+        match = CACHE_PATH.match(self.path)
+        name = f"cachedContents/{match.group('id')}" if match and match.group('id') else None
+        if name not in self.server.caches:
+            self._send_json({'error': {'code': 404, 'message': f'Unknown cached content {self.path}'}}, status=404)
+            return
+        self._send_json(self.server.caches[name])
+
+    def _candidate(self, text, body, final):
+        payload = {
+            'candidates': [{
+                'content': {'role': 'model', 'parts': [{'text': text}]},
+                'index': 0,
+            }],
+            'modelVersion': 'gemini-stub',
+        }
+        if final:
+            payload['candidates'][0]['finishReason'] = 'STOP'
+            payload['usageMetadata'] = self.server.usage_metadata(body)
+        return payload
+
+    def _stream(self, body):
+        text = self.server.response_text
+        size = max(1, -(-len(text) // self.server.chunk_count))
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for index, chunk in enumerate(chunks):
+            event = f"data: {json.dumps(self._candidate(chunk, body, final=index == len(chunks) - 1))}\r\n\r\n".encode()
+            self.wfile.write(f'{len(event):x}\r\n'.encode() + event + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
@@ -0,0 +1,145 @@
+# rest/jobs.py
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .ai_router import generate_and_save_plan_for_user
+from .models import GenerationJob
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    """Get or create the in-process worker pool used for plan generation."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PLAN_JOB_WORKERS,
+                thread_name_prefix='plan-job',
+            )
+    return _executor
+
+
+def enqueue_generation_job(profile, start_date, replaces=None):
+    """
+    Creates a pending GenerationJob. With the 'thread' backend the job is handed
+    to the in-process pool once the surrounding transaction commits; with the
+    'worker' backend it waits for `manage.py run_plan_jobs` to pick it up.
+    `replaces` is a plan the new one takes over from (see save_generated_plan).
+    """
+    job = GenerationJob.objects.create(profile=profile, start_date=start_date, replaces=replaces)
+    if settings.PLAN_JOB_BACKEND == 'thread':
+        transaction.on_commit(lambda: get_executor().submit(run_generation_job, job.pk))
+    return job
+
+
+def active_jobs():
+    """
+    Jobs still to finish: pending ones, and running ones started within
+    PLAN_JOB_TIMEOUT_SECONDS. Older running jobs belonged to a worker that died.
+    """
+    stale_before = timezone.now() - timedelta(seconds=settings.PLAN_JOB_TIMEOUT_SECONDS)
+    return GenerationJob.objects.filter(
+        Q(status=GenerationJob.STATUS_PENDING)
+        | Q(status=GenerationJob.STATUS_RUNNING, started_at__gte=stale_before)
+    )
+
+
+def fail_stale_jobs():
+    """Marks running jobs older than PLAN_JOB_TIMEOUT_SECONDS as failed. Returns how many there were."""
+    stale_before = timezone.now() - timedelta(seconds=settings.PLAN_JOB_TIMEOUT_SECONDS)
+    failed = GenerationJob.objects.filter(
+        status=GenerationJob.STATUS_RUNNING, started_at__lt=stale_before
+    ).update(
+        status=GenerationJob.STATUS_FAILED, finished_at=timezone.now(),
+        error="The worker running this job stopped before it finished.",
+    )
+    if failed:
+        print(f"Marked {failed} stale generation jobs as failed")
+    return failed
+
+
+def recover_jobs():
+    """
+    Cleans up after a restart or a crashed worker: fails stale running jobs
+    and hands pending jobs, whose in-process submit was lost with the old
+    process, to this process's pool. claim_job() keeps a job that another
+    process picks up as well from running twice.
+    """
+    close_old_connections()
+    try:
+        fail_stale_jobs()
+        pending_ids = list(
+            GenerationJob.objects.filter(status=GenerationJob.STATUS_PENDING)
+            .order_by('created_at').values_list('pk', flat=True)
+        )
+        for job_id in pending_ids:
+            get_executor().submit(run_generation_job, job_id)
+        if pending_ids:
+            print(f"Re-enqueued {len(pending_ids)} pending generation jobs")
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id):
+    """
+    Atomically moves a job from pending to running.
+    Returns False if another worker got there first.
+    """
+    claimed = GenerationJob.objects.filter(
+        pk=job_id, status=GenerationJob.STATUS_PENDING
+    ).update(status=GenerationJob.STATUS_RUNNING, started_at=timezone.now())
+    return claimed == 1
+
+
+def _execute_job(job):
+    """Generates the plan for a running job and records the outcome."""
+    try:
+        plan = generate_and_save_plan_for_user(job.profile, job.start_date, replaces=job.replaces)
+    except Exception as e:
+        plan = None
+        job.error = str(e)
+
+    job.plan = plan
+    job.status = GenerationJob.STATUS_SUCCEEDED if plan else GenerationJob.STATUS_FAILED
+    if not plan and not job.error:
+        job.error = "Failed to generate fitness plan."
+    job.finished_at = timezone.now()
+    job.save(update_fields=['plan', 'status', 'error', 'finished_at'])
+    return job
+
+
+def run_generation_job(job_id):
+    """Runs a single generation job to completion and records the outcome."""
+    close_old_connections()
+    try:
+        if not claim_job(job_id):
+            return
+        job = GenerationJob.objects.select_related('profile__user', 'replaces').get(pk=job_id)
+        _execute_job(job)
+    finally:
+        close_old_connections()
+
+
+def run_job_now(profile, start_date):
+    """
+    Generates a plan in the calling thread, recorded as a GenerationJob that
+    starts out running, so the duplicate check (see active_jobs) covers it
+    like a queued one. Returns the finished job.
+    """
+    close_old_connections()
+    try:
+        job = GenerationJob.objects.create(
+            profile=profile, start_date=start_date,
+            status=GenerationJob.STATUS_RUNNING, started_at=timezone.now(),
+        )
+        return _execute_job(job)
+    finally:
+        close_old_connections()
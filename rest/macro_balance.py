@@ -0,0 +1,189 @@
+# rest/macro_balance.py
+"""
+Rescales meal portions so each day's totals meet its targets.
+
+Generated plans often have meals whose calories and macros don't add up to
+the day's targets. Instead of regenerating the plan, every meal gets a
+portion scale factor. For one day, with A the 4 x meals matrix of meal
+calories, protein, carbs and fats and t the day's targets, the factors s
+minimise
+
+    || W (A s - t) ||^2 + reg * || s - 1 ||^2
+
+where W weighs each row by 1 / target, so the errors are relative, and the
+second term keeps the plan as written where the targets allow it. This is a
+small ridge-regularised least-squares problem. The day's calories are an
+equality constraint, so protein, carbs and fats are only traded against each
+other and never against the energy the day provides. Its KKT system is solved
+for all seven days at once with batched numpy.linalg.solve calls. Factors are
+kept within [MIN_SCALE, MAX_SCALE] and rounded to SCALE_STEP so portions stay
+readable.
+"""
+import numpy as np
+
+MIN_SCALE = 0.5
+MAX_SCALE = 2.0
+SCALE_STEP = 0.05
+REGULARIZATION = 0.005
+# Relative weights of the calorie, protein, carbs and fats errors
+ROW_WEIGHTS = np.array([2.0, 1.0, 1.0, 1.0])
+MEAL_FIELDS = ('calories', 'protein_grams', 'carbs_grams', 'fats_grams')
+TARGET_FIELDS = ('target_calories', 'target_protein_grams', 'target_carbs_grams', 'target_fats_grams')
+
+
+def _inverse(targets):
+    """1 / target, 0 where there is no target."""
+    return np.where(targets > 0, 1 / np.where(targets > 0, targets, 1), 0.0)
+
+
+def _day_errors(totals, targets, inverse=None):
+    """Relative error of each total against its target, 0 where there is no target."""
+    return np.abs(totals - targets) * (_inverse(targets) if inverse is None else inverse)
+
+
+def _objective(errors):
+    """The weighted sum of squared relative errors of each day that the solve minimises."""
+    return ((ROW_WEIGHTS * errors) ** 2).sum(axis=1)
+
+
+def _round_to_calories(scales, calories, targets, lower, upper):
+    """
+    Moves the one factor per day by a SCALE_STEP that brings the day's
+    calories closest to its target, undoing most of the drift from rounding.
+    """
+    residual = np.where(targets > 0, targets - (calories * scales).sum(axis=1), 0.0)
+    step = np.where(residual > 0, SCALE_STEP, -SCALE_STEP)[:, None]
+    moved = scales + step
+    allowed = (moved >= lower - 1e-9) & (moved <= upper + 1e-9) & (calories > 0)
+    remaining = np.where(allowed, np.abs(residual[:, None] - calories * step), np.inf)
+    best = remaining.argmin(axis=1)
+    rows = np.arange(len(scales))
+    better = remaining[rows, best] < np.abs(residual)
+    scales[rows[better], best[better]] += step[better, 0]
+    return scales
+
+
+def solve_scales(meals, targets, tolerance, lower=MIN_SCALE, upper=MAX_SCALE):
+    """
+    `meals` is (days, 4, meals) and `targets` (days, 4), zero where a day has
+    no such meal or target. Returns the (days, meals) scale factors. `lower`
+    and `upper` bound the factors, either one value or one per meal, e.g. so
+    that a meal already scaled stays within [MIN_SCALE, MAX_SCALE] in total.
+
+    Calories are a hard constraint: a day's factors are only used if its
+    calories end up within `tolerance` of the target and its weighted error
+    goes down. Days already within `tolerance` on every target, and days
+    whose calories can't be met within the bounds, keep a factor of 1.
+    """
+    days, _, width = meals.shape
+    lower = np.broadcast_to(lower, (days, width))
+    upper = np.broadcast_to(upper, (days, width))
+    calories = meals[:, 0, :]
+    inverse = _inverse(targets)
+    weights = ROW_WEIGHTS * inverse
+    weighted = meals * weights[:, :, None]
+
+    # KKT system of the ridge problem with the equality constraint calories . s = target:
+    # [[A'W'WA + reg I, c], [c', 0]] [s, lambda] = [A'W'Wt + reg 1, target]
+    size = width + 1
+    kkt = np.zeros((days, size, size))
+    kkt[:, :width, :width] = weighted.transpose(0, 2, 1) @ weighted + REGULARIZATION * np.eye(width)
+    kkt[:, :width, width] = calories
+    kkt[:, width, :width] = calories
+    rhs = np.zeros((days, size))
+    rhs[:, :width] = (weighted.transpose(0, 2, 1) @ (targets * weights)[:, :, None])[:, :, 0] + REGULARIZATION
+    rhs[:, width] = targets[:, 0]
+    constrained = targets[:, 0] > 0
+
+    # Bounded least squares by active set: factors that leave [lower, upper]
+    # are fixed at the nearer bound and the others solved again, for every day
+    # in one batched solve. Most weeks need no more than one or two rounds.
+    # Once no free meal has calories left the constraint is dropped; such a day
+    # can't meet its calories and is left as written below.
+    fixed = np.zeros((days, width), dtype=bool)
+    bound = np.zeros((days, size))
+    identity = np.eye(size)
+    for _ in range(width):
+        free = np.concatenate([~fixed, (constrained & ((calories > 0) & ~fixed).any(axis=1))[:, None]], axis=1)
+        system = np.where(free[:, :, None] & free[:, None, :], kkt, identity)
+        rhs_free = rhs - (kkt @ bound[:, :, None])[:, :, 0]
+        scales = np.linalg.solve(system, np.where(free, rhs_free, bound)[:, :, None])[:, :width, 0]
+        outside = ~fixed & ((scales < lower) | (scales > upper))
+        if not outside.any():
+            break
+        bound[:, :width] = np.where(outside, np.clip(scales, lower, upper), bound[:, :width])
+        fixed |= outside
+    scales = np.clip(np.round(scales / SCALE_STEP) * SCALE_STEP, lower, upper)
+    scales = _round_to_calories(scales, calories, targets[:, 0], lower, upper)
+
+    before = _day_errors(meals.sum(axis=2), targets, inverse)
+    after = _day_errors((meals * scales[:, None, :]).sum(axis=2), targets, inverse)
+    keep = (
+        (before.max(axis=1) <= tolerance)
+        | (after[:, 0] > tolerance)
+        | (_objective(after) >= _objective(before))
+    )
+    scales[keep] = 1.0
+    return scales
+
+
+def balance_plan(plan_data, tolerance=0.05):
+    """
+    Returns (plan_data, report): a copy of the plan (shaped like
+    GeneratedPlanSchema) with every meal's calories and macros multiplied by
+    its scale factor, and a report of each day's largest relative error before
+    and after and whether it is within `tolerance`. The factor is multiplied into the meal's 'portion_scale' (1 if
+    it has none), which stays within [MIN_SCALE, MAX_SCALE], and
+    'portion_size' stays the unscaled portion.
+    """
+    days = plan_data['nutrition_days']
+    if not days:
+        return plan_data, []
+    width = max(len(day['meals']) for day in days) or 1
+    meals = np.zeros((len(days), 4, width))
+    targets = np.zeros((len(days), 4))
+    portion_scales = np.ones((len(days), width))
+    for d, day in enumerate(days):
+        targets[d] = [day.get(field) or 0 for field in TARGET_FIELDS]
+        for m, meal in enumerate(day['meals']):
+            meals[d, :, m] = [meal.get(field) or 0 for field in MEAL_FIELDS]
+            portion_scales[d, m] = meal.get('portion_scale') or 1.0
+
+    # Bounds on the factor that keep the meal's total portion_scale within [MIN_SCALE, MAX_SCALE]
+    scales = solve_scales(meals, targets, tolerance, MIN_SCALE / portion_scales, MAX_SCALE / portion_scales)
+    before = _day_errors(meals.sum(axis=2), targets).max(axis=1)
+    after = _day_errors((meals * scales[:, None, :]).sum(axis=2), targets).max(axis=1)
+
+    balanced_days = []
+    report = []
+    for d, day in enumerate(days):
+        balanced_meals = []
+        for m, meal in enumerate(day['meals']):
+            scale = round(float(scales[d, m]), 2)
+            balanced_meals.append(_scale_meal(meal, scale))
+        balanced_days.append({**day, 'meals': balanced_meals})
+        report.append({
+            'day_of_week': day['day_of_week'],
+            'error_before': round(float(before[d]), 3),
+            'error_after': round(float(after[d]), 3),
+            'within_tolerance': bool(after[d] <= tolerance),
+            'scales': [meal['portion_scale'] for meal in balanced_meals],
+        })
+    return {**plan_data, 'nutrition_days': balanced_days}, report
+
+
+def _scale_meal(meal, scale):
+    portion_scale = meal.get('portion_scale') or 1.0
+    if scale == 1:
+        return {**meal, 'portion_scale': portion_scale}
+    # Rounding the total to two decimals can take it just past a bound, e.g. 1.7 * 1.18
+    total = min(MAX_SCALE, max(MIN_SCALE, round(portion_scale * scale, 2)))
+    scale = total / portion_scale
+    return {
+        **meal,
+        'calories': round(meal['calories'] * scale),
+        'protein_grams': round(meal['protein_grams'] * scale, 1),
+        'carbs_grams': round(meal['carbs_grams'] * scale, 1),
+        'fats_grams': round(meal['fats_grams'] * scale, 1),
+        'portion_scale': total,
+    }
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from google import genai
+
+from rest import ai_service
+from rest.gemini_stub import GeminiStubServer
+from rest.management.commands.bench_plan_persistence import build_sample_plan
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares how many plan generations the blocking (WSGI) and async (ASGI) "
+        "Gemini paths keep in flight, against a local fake Gemini server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Number of plan generations to run.")
+        parser.add_argument('--delay', type=float, default=1.0,
+                            help="Seconds the fake server takes to answer each request.")
+        parser.add_argument('--sync-workers', type=int, default=8,
+                            help="Worker threads for the blocking path, e.g. gunicorn workers x threads.")
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        response_text = json.dumps(build_sample_plan(4))
+        prompts = [f"benchmark prompt {i}" for i in range(total)]
+
+        with GeminiStubServer(response_text, delay=options['delay']) as stub:
+            original_client = ai_service.client
+            ai_service.client = genai.Client(api_key='stub', http_options=ai_service.gemini_http_options(stub.url))
+            try:
+                results = [
+                    ('wsgi (blocking)', self._run_sync(prompts, options['sync_workers']), stub.max_in_flight),
+                ]
+                stub.max_in_flight = 0
+                results.append(('asgi (async)', self._run_async(prompts), stub.max_in_flight))
+            finally:
+                ai_service.client = original_client
+
+        self.stdout.write(f"{total} generations, {options['delay']}s per request at the fake server\n")
+        self.stdout.write(f"{'path':<18} {'seconds':>8} {'plans/s':>8} {'max in flight':>14}")
+        for name, elapsed, in_flight in results:
+            self.stdout.write(f"{name:<18} {elapsed:>8.2f} {total / elapsed:>8.1f} {in_flight:>14}")
+
+    def _run_sync(self, prompts, workers):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(ai_service.request_plan_data, prompts))
+        return time.perf_counter() - started
+
+    def _run_async(self, prompts):
+        async def run_all():
+            await asyncio.gather(*(ai_service.arequest_plan_data(prompt) for prompt in prompts))
+
+        started = time.perf_counter()
+        asyncio.run(run_all())
+        return time.perf_counter() - started
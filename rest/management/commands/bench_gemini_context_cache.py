@@ -0,0 +1,83 @@
+import json
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from google import genai
+
+from rest import ai_service
+from rest.gemini_stub import GeminiStubServer
+from rest.management.commands.bench_plan_persistence import build_sample_plan
+from rest.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares per-call prompt tokens and latency of Gemini plan requests with the "
+        "instructions sent inline and from the context cache, against a local fake Gemini server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20,
+                            help="Plan requests per mode.")
+        parser.add_argument('--delay', type=float, default=0.2,
+                            help="Seconds the fake server takes to answer each request.")
+        parser.add_argument('--prompt-token-delay', type=float, default=0.0005,
+                            help="Extra seconds per uncached prompt token at the fake server.")
+        parser.add_argument('--wire-schema', choices=['full', 'compact', 'catalog'], default=None,
+                            help="PLAN_WIRE_SCHEMA to run with. Only the catalog instructions are above "
+                                 "the minimum size for caching; the others are always sent inline.")
+
+    def handle(self, *args, **options):
+        response_text = json.dumps(build_sample_plan(4))
+        profile = Profile(age=30, gender='male', current_weight=80, height=180,
+                          goal='weight_loss', activity_level='moderately_active')
+        wire_schema = options['wire_schema'] or settings.PLAN_WIRE_SCHEMA
+
+        rows = []
+        notes = []
+        with GeminiStubServer(response_text, delay=options['delay'],
+                              prompt_token_delay=options['prompt_token_delay']) as stub:
+            original_client = ai_service.client
+            ai_service.client = genai.Client(api_key='stub', http_options=ai_service.gemini_http_options(stub.url))
+            try:
+                for enabled in (False, True):
+                    with override_settings(GEMINI_CONTEXT_CACHE=enabled, PLAN_WIRE_SCHEMA=wire_schema):
+                        prompt = ai_service.build_plan_prompt(profile, date.today())
+                        ai_service._context_caches.clear()
+                        for samples in ai_service._usage.values():
+                            samples.clear()
+                        for _ in range(options['requests']):
+                            ai_service.request_plan_data(prompt)
+                            # The cache is created in the background; give it a moment after the first request
+                            if enabled and not ai_service._usage['cached']:
+                                time.sleep(0.05)
+                        stats = ai_service.gemini_usage_stats()
+                    if not enabled:
+                        rows.append(('inline', stats['inline']))
+                        continue
+                    rows.append(('context cache', stats['cached']))
+                    inline_calls = stats['inline']['calls']
+                    if inline_calls:
+                        notes.append(f"{inline_calls} of the context cache requests sent the instructions inline")
+                    for key, cache in (stats['context_cache'] or {}).items():
+                        if cache['last_error']:
+                            notes.append(f"{key} context cache: {cache['last_error']}")
+            finally:
+                ai_service.client = original_client
+                ai_service._context_caches.clear()
+
+        self.stdout.write(f"{options['requests']} plan requests per mode ({wire_schema} wire schema)\n")
+        self.stdout.write(f"{'instructions':<14} {'calls':>6} {'prompt tokens':>14} {'uncached':>9} {'latency s':>10}")
+        for name, stats in rows:
+            if not stats['calls']:
+                self.stdout.write(f"{name:<14} {0:>6} {'-':>14} {'-':>9} {'-':>10}")
+                continue
+            self.stdout.write(
+                f"{name:<14} {stats['calls']:>6} {stats['avg_prompt_tokens']:>14} {stats['avg_uncached_prompt_tokens']:>9} "
+                f"{stats['avg_latency_seconds']:>10.3f}"
+            )
+        for note in notes:
+            self.stdout.write(note)
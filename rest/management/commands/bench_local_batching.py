@@ -0,0 +1,75 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from rest.management.commands.bench_local_grammar import BENCHMARK_PROMPTS
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures local plans per minute at several concurrency levels, generating "
+        "one plan at a time (sequential) and with continuous batching."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                            help="Numbers of simultaneous plan requests to test.")
+        parser.add_argument('--plans', type=int, default=16,
+                            help="Plans to generate per run (at least the concurrency).")
+        parser.add_argument('--model', default=os.path.join(settings.BASE_DIR, 'model.gguf'),
+                            help="Path of the GGUF model file.")
+
+    def handle(self, *args, **options):
+        from ai_local.services import LocalModel, LLAMA_CPP_AVAILABLE, build_local_scheduler
+
+        if not LLAMA_CPP_AVAILABLE or not os.path.exists(options['model']):
+            raise CommandError("The local model is not available, see ai_local/SETUP.md.")
+
+        rows = []
+        for concurrency in options['concurrency']:
+            plans = max(concurrency, options['plans'])
+            results = {}
+            for mode in ('sequential', 'batched'):
+                with override_settings(
+                    LOCAL_INFERENCE_MODE=mode,
+                    LOCAL_BATCH_MAX_SEQUENCES=concurrency,
+                    LOCAL_MODEL_REPLICAS=1,
+                    LOCAL_INFERENCE_QUEUE_SIZE=max(plans, settings.LOCAL_INFERENCE_QUEUE_SIZE),
+                ):
+                    model = LocalModel(options['model'])
+                    if not model.load_model():
+                        raise CommandError("The local model failed to load.")
+                    results[mode] = self._run(build_local_scheduler(model), plans, concurrency)
+                    model.lifecycle.unload()
+            rows.append((concurrency, plans, results))
+
+        self.stdout.write(f"{'concurrency':>11} {'plans':>6} {'sequential/min':>15} {'batched/min':>12} {'speedup':>8} {'failed':>7}")
+        for concurrency, plans, results in rows:
+            (seq_elapsed, seq_failed), (batch_elapsed, batch_failed) = results['sequential'], results['batched']
+            seq_rate, batch_rate = plans * 60 / seq_elapsed, plans * 60 / batch_elapsed
+            self.stdout.write(
+                f"{concurrency:>11} {plans:>6} {seq_rate:>15.2f} {batch_rate:>12.2f} "
+                f"{batch_rate / seq_rate:>7.2f}x {seq_failed:>3}/{batch_failed:<3}"
+            )
+
+    def _run(self, scheduler, plans, concurrency):
+        """Generates `plans` plans with `concurrency` callers, returns (seconds, failures)."""
+        failed = 0
+
+        def generate(i):
+            prompt = BENCHMARK_PROMPTS[i % len(BENCHMARK_PROMPTS)]
+            return scheduler.run(lambda model: model.generate_plan(prompt, fallback=False))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(generate, i) for i in range(plans)]:
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Generation failed: {e}")
+        return time.perf_counter() - started, failed
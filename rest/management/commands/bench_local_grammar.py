@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from ai_local.services import get_local_model
+from rest.schemas import GeneratedPlanSchema
+
+BENCHMARK_PROMPTS = [
+    """
+    Generate a comprehensive 7-day fitness and nutrition plan for a user in Ghana.
+    User Details:
+    - Age: 25
+    - Gender: male
+    - Weight: 70 kg
+    - Height: 175 cm
+    - Goal: Weight Loss
+    - Activity Level: Lightly Active
+    """,
+    """
+    Generate a comprehensive 7-day fitness and nutrition plan for a user in Ghana.
+    User Details:
+    - Age: 41
+    - Gender: female
+    - Weight: 82 kg
+    - Height: 163 cm
+    - Goal: Maintain Weight
+    - Activity Level: Sedentary
+    """,
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs local plan generations with and without the JSON grammar and reports "
+        "how often the output parses as a plan and how many tokens each plan costs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help="Generations per mode.")
+
+    def handle(self, *args, **options):
+        model = get_local_model()
+        if not model.model:
+            raise CommandError("The local model is not loaded, see ai_local/SETUP.md.")
+
+        results = []
+        for name, use_grammar in (('free text', False), ('grammar', True)):
+            with override_settings(LOCAL_JSON_GRAMMAR=use_grammar):
+                results.append((name, self._run(model, options['runs'])))
+
+        self.stdout.write(f"{options['runs']} generations per mode\n")
+        self.stdout.write(f"{'mode':<10} {'parsed':>8} {'tokens/plan':>12} {'tokens/parsed':>14} {'s/plan':>8}")
+        for name, (parsed, tokens, elapsed) in results:
+            runs = options['runs']
+            per_parsed = f"{tokens / parsed:.0f}" if parsed else '-'
+            self.stdout.write(
+                f"{name:<10} {parsed:>3}/{runs:<4} {tokens / runs:>12.0f} {per_parsed:>14} {elapsed / runs:>8.1f}"
+            )
+
+    def _run(self, model, runs):
+        parsed = tokens = 0
+        started = time.perf_counter()
+        for i in range(runs):
+            try:
+                response_text = model.generate_plan(BENCHMARK_PROMPTS[i % len(BENCHMARK_PROMPTS)], fallback=False)
+                GeneratedPlanSchema.model_validate_json(response_text)
+                parsed += 1
+            except Exception as e:
+                self.stderr.write(f"Run {i + 1} failed: {e}")
+            # Tokens are spent whether or not the output was usable
+            tokens += model.last_completion_tokens
+        return parsed, tokens, time.perf_counter() - started
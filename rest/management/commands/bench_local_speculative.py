@@ -0,0 +1,62 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from rest.management.commands.bench_local_grammar import BENCHMARK_PROMPTS
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates local plans without speculative decoding, with prompt lookup and, "
+        "if a draft model is present, with the draft model. Reports the draft "
+        "acceptance rate and end-to-end tokens per second."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=4,
+                            help="Plans per mode. Lookup improves as it remembers earlier plans.")
+        parser.add_argument('--model', default=os.path.join(settings.BASE_DIR, 'model.gguf'),
+                            help="Path of the GGUF model file.")
+
+    def handle(self, *args, **options):
+        from ai_local.services import LocalModel, LLAMA_CPP_AVAILABLE
+
+        if not LLAMA_CPP_AVAILABLE or not os.path.exists(options['model']):
+            raise CommandError("The local model is not available, see ai_local/SETUP.md.")
+
+        modes = ['', 'lookup']
+        if os.path.exists(settings.LOCAL_DRAFT_MODEL_PATH):
+            modes.append('draft')
+
+        rows = []
+        for mode in modes:
+            with override_settings(LOCAL_SPECULATIVE=mode, LOCAL_INFERENCE_MODE='sequential'):
+                model = LocalModel(options['model'])
+                if not model.load_model():
+                    raise CommandError("The local model failed to load.")
+                tokens, elapsed = self._run(model, options['runs'])
+                stats = model.draft.stats() if model.draft is not None else {}
+                model.lifecycle.unload()
+            rows.append((mode or 'off', tokens, elapsed, stats.get('acceptance_rate')))
+
+        baseline = rows[0][1] / rows[0][2]
+        self.stdout.write(f"{options['runs']} plans per mode\n")
+        self.stdout.write(f"{'speculative':<12} {'tokens':>8} {'tokens/s':>9} {'speedup':>8} {'accepted':>9}")
+        for mode, tokens, elapsed, acceptance in rows:
+            rate = tokens / elapsed
+            accepted = f"{acceptance:.0%}" if acceptance is not None else '-'
+            self.stdout.write(f"{mode:<12} {tokens:>8} {rate:>9.1f} {rate / baseline:>7.2f}x {accepted:>9}")
+
+    def _run(self, model, runs):
+        tokens = 0
+        started = time.perf_counter()
+        for i in range(runs):
+            try:
+                model.generate_plan(BENCHMARK_PROMPTS[i % len(BENCHMARK_PROMPTS)], fallback=False)
+            except Exception as e:
+                self.stderr.write(f"Run {i + 1} failed: {e}")
+            tokens += model.last_completion_tokens
+        return tokens, time.perf_counter() - started
@@ -0,0 +1,94 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from rest.macro_balance import MEAL_FIELDS, TARGET_FIELDS, balance_plan, solve_scales
+from rest.models import Profile
+from rest.rule_engine import generate_rule_plan
+
+
+def drifted_plan(plan, drift, rng):
+    """The plan with every meal scaled by a random factor, like a generated plan whose meals miss the targets."""
+    days = []
+    for day in plan['nutrition_days']:
+        meals = []
+        for meal in day['meals']:
+            factor = rng.uniform(1 - drift, 1 + drift)
+            meals.append({**meal, **{field: round(meal[field] * factor, 1) for field in MEAL_FIELDS}})
+        days.append({**day, 'meals': meals})
+    return {**plan, 'nutrition_days': days}
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1e6
+
+
+class Command(BaseCommand):
+    help = (
+        "Times macro balancing of week plans whose meals miss the day targets, both the batched "
+        "solve on its own and the whole balance_plan() pass, and reports the errors before and after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000,
+                            help="Plans balanced.")
+        parser.add_argument('--drift', type=float, default=0.3,
+                            help="Largest relative error put into each meal.")
+        parser.add_argument('--tolerance', type=float, default=0.05,
+                            help="Relative error a day may keep.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        profile = Profile(age=30, gender='male', current_weight=80, height=175,
+                          goal='maintenance', activity_level='moderately_active')
+        base = generate_rule_plan(profile)
+        # Targets the meals meet exactly, so all of the error comes from the drift
+        base['nutrition_days'] = [
+            {**day, **{target: sum(meal[field] for meal in day['meals'])
+                       for field, target in zip(MEAL_FIELDS, TARGET_FIELDS)}}
+            for day in base['nutrition_days']
+        ]
+        plans = [drifted_plan(base, options['drift'], rng) for _ in range(50)]
+
+        solve_samples = []
+        balance_samples = []
+        before = []
+        after = []
+        within = 0
+        for i in range(options['iterations']):
+            plan = plans[i % len(plans)]
+            days = plan['nutrition_days']
+            width = max(len(day['meals']) for day in days)
+            meals = np.zeros((len(days), 4, width))
+            targets = np.array([[day[field] for field in TARGET_FIELDS] for day in days], dtype=float)
+            for d, day in enumerate(days):
+                for m, meal in enumerate(day['meals']):
+                    meals[d, :, m] = [meal[field] for field in MEAL_FIELDS]
+
+            started = time.perf_counter()
+            solve_scales(meals, targets, options['tolerance'])
+            solve_samples.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            _, report = balance_plan(plan, options['tolerance'])
+            balance_samples.append(time.perf_counter() - started)
+            before.extend(day['error_before'] for day in report)
+            after.extend(day['error_after'] for day in report)
+            within += sum(day['within_tolerance'] for day in report)
+
+        solve_samples.sort()
+        balance_samples.sort()
+        self.stdout.write(f"{'stage':<14} {'p50 us':>8} {'p99 us':>8}")
+        self.stdout.write(f"{'solve':<14} {percentile(solve_samples, 0.5):>8.0f} {percentile(solve_samples, 0.99):>8.0f}")
+        self.stdout.write(f"{'balance_plan':<14} {percentile(balance_samples, 0.5):>8.0f} {percentile(balance_samples, 0.99):>8.0f}")
+        self.stdout.write(
+            f"Largest day error: {max(before):.1%} before, {max(after):.1%} after "
+            f"(mean {sum(before) / len(before):.1%} -> {sum(after) / len(after):.1%})"
+        )
+        self.stdout.write(f"Days within tolerance after balancing: {within / len(after):.1%}")
+
+        if percentile(solve_samples, 0.99) >= 1000:
+            raise CommandError("The solve for a week is over the 1ms budget")
+        self.stdout.write(self.style.SUCCESS("Every week was solved within budget."))
@@ -0,0 +1,89 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest.models import Profile
+from rest.plan_persistence import save_generated_plan
+
+
+def build_sample_plan(items_per_day):
+    """A synthetic 7-day plan with `items_per_day` exercises and meals per day."""
+    return {
+        'workout_days': [
+            {
+                'day_of_week': day,
+                'title': f'Day {day}',
+                'is_rest_day': False,
+                'description': 'Benchmark workout',
+                'exercises': [
+                    {'name': f'Exercise {i}', 'sets': 3, 'reps': '10-12', 'rest_period_seconds': 60, 'notes': None}
+                    for i in range(items_per_day)
+                ],
+            }
+            for day in range(1, 8)
+        ],
+        'nutrition_days': [
+            {
+                'day_of_week': day,
+                'target_calories': 2000,
+                'target_protein_grams': 120,
+                'target_carbs_grams': 200,
+                'target_fats_grams': 70,
+                'target_water_litres': 2.5,
+                'notes': None,
+                'meals': [
+                    {'meal_type': 'snack', 'description': f'Meal {i}', 'calories': 400, 'protein_grams': 20.0,
+                     'carbs_grams': 50.0, 'fats_grams': 10.0, 'portion_size': '1 plate'}
+                    for i in range(items_per_day)
+                ],
+            }
+            for day in range(1, 8)
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = "Counts the SQL statements used to save generated plans of increasing size."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 8],
+                            help="Exercises and meals per day to benchmark.")
+
+    def handle(self, *args, **options):
+        counts = set()
+        self.stdout.write(f"{'items/day':>10} {'rows':>6} {'queries':>8} {'inserts':>8} {'ms':>8}")
+
+        # Everything happens inside a transaction that is rolled back, so the
+        # benchmark leaves no users or plans behind.
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username='__bench_plan_persistence__')
+                profile = Profile.objects.create(user=user, goal='maintenance')
+                start_date = timezone.now().date()
+
+                for size in options['sizes']:
+                    plan_data = build_sample_plan(size)
+                    rows = 1 + 14 + 14 * size
+                    with CaptureQueriesContext(connection) as ctx:
+                        started = time.perf_counter()
+                        save_generated_plan(profile, plan_data, start_date, start_date, prompt='benchmark')
+                        elapsed_ms = (time.perf_counter() - started) * 1000
+                    inserts = sum(1 for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith('INSERT'))
+                    counts.add(inserts)
+                    self.stdout.write(f"{size:>10} {rows:>6} {len(ctx.captured_queries):>8} {inserts:>8} {elapsed_ms:>8.2f}")
+
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        if len(counts) != 1:
+            raise CommandError(f"INSERT count changed with plan size: {sorted(counts)}")
+        self.stdout.write(self.style.SUCCESS(f"Every plan was saved with {counts.pop()} INSERT statements."))
+
+
+class _Rollback(Exception):
+    pass
@@ -0,0 +1,133 @@
+import json
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from google import genai
+
+from rest import ai_service, telemetry
+from rest.gemini_stub import GeminiStubServer
+from rest.management.commands.bench_plan_persistence import build_sample_plan
+from rest.models import FoodItem, Profile
+from rest.plan_wire import compact_plan, expand_compact_plan
+
+MEAL_TYPES = ['breakfast', 'lunch', 'dinner', 'snack']
+REST_DAYS = (3, 7)
+
+
+def build_wire_sample_plan(items_per_day):
+    """build_sample_plan() with rest days and the usual meal types, like a real weekly plan."""
+    plan = build_sample_plan(items_per_day)
+    for day in plan['workout_days']:
+        if day['day_of_week'] in REST_DAYS:
+            day.update(title='Rest Day', is_rest_day=True, description=None, exercises=[])
+    for day in plan['nutrition_days']:
+        for i, meal in enumerate(day['meals']):
+            meal['meal_type'] = MEAL_TYPES[i % len(MEAL_TYPES)]
+    return plan
+
+
+def build_catalog_sample(plan, food_ids):
+    """The same week as CatalogPlanSchema data, each meal made of two catalog foods."""
+    return {
+        'workout_days': plan['workout_days'],
+        'nutrition_days': [
+            {
+                'day_of_week': day['day_of_week'],
+                'target_water_litres': day['target_water_litres'],
+                'notes': day['notes'],
+                'meals': [
+                    {'meal_type': meal['meal_type'], 'foods': [
+                        {'id': food_ids[(i * 2) % len(food_ids)], 'portions': 1.5},
+                        {'id': food_ids[(i * 2 + 1) % len(food_ids)], 'portions': 1},
+                    ]}
+                    for i, meal in enumerate(day['meals'])
+                ],
+            }
+            for day in plan['nutrition_days']
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares output tokens and latency of whole-plan Gemini requests with the full "
+        "(GeneratedPlanSchema), compact (CompactPlanSchema) and catalog (CatalogPlanSchema) wire "
+        "schemas, against a local fake Gemini server or, with --live, the real API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=10,
+                            help="Plan requests per schema.")
+        parser.add_argument('--items', type=int, default=4,
+                            help="Exercises and meals per day in the fake server's plan.")
+        parser.add_argument('--delay', type=float, default=0.1,
+                            help="Seconds the fake server takes to answer each request.")
+        parser.add_argument('--output-token-delay', type=float, default=0.0005,
+                            help="Extra seconds per output token at the fake server.")
+        parser.add_argument('--live', action='store_true',
+                            help="Call the configured Gemini API instead of the fake server.")
+
+    def handle(self, *args, **options):
+        profile = Profile(age=30, gender='male', current_weight=80, height=180,
+                          goal='weight_loss', activity_level='moderately_active')
+        prompt = ai_service.build_plan_prompt(profile, date.today())
+
+        plan = build_wire_sample_plan(options['items'])
+        compact = compact_plan(plan)
+        if expand_compact_plan(compact) != plan:
+            self.stderr.write("compact_plan() round trip changed the plan")
+        responses = {
+            'full': json.dumps(plan, separators=(',', ':')),
+            'compact': json.dumps(compact, separators=(',', ':')),
+        }
+        food_ids = list(FoodItem.objects.filter(is_active=True).values_list('pk', flat=True))
+        if food_ids:
+            responses['catalog'] = json.dumps(build_catalog_sample(plan, food_ids), separators=(',', ':'))
+        else:
+            self.stderr.write("The food catalog is empty, skipping the catalog schema (run migrate)")
+
+        rows = []
+        for schema, response_text in responses.items():
+            with override_settings(PLAN_WIRE_SCHEMA=schema):
+                targets = ai_service.plan_targets(profile)
+                if options['live']:
+                    samples = self._run(prompt, targets, options['requests'])
+                else:
+                    with GeminiStubServer(response_text, delay=options['delay'],
+                                          output_token_delay=options['output_token_delay']) as stub:
+                        original_client = ai_service.client
+                        ai_service.client = genai.Client(api_key='stub', http_options=ai_service.gemini_http_options(stub.url))
+                        # The context cache holds a name from the previous server
+                        ai_service._context_caches.clear()
+                        try:
+                            samples = self._run(prompt, targets, options['requests'])
+                        finally:
+                            ai_service.client = original_client
+                            ai_service._context_caches.clear()
+            rows.append((schema, len(response_text), samples))
+
+        source = 'Gemini API' if options['live'] else 'fake server'
+        self.stdout.write(f"{options['requests']} plan requests per schema ({source})\n")
+        self.stdout.write(f"{'schema':<8} {'sample chars':>12} {'output tokens':>14} {'latency s':>10} {'failed':>7}")
+        for schema, chars, samples in rows:
+            ok = [s for s in samples if s['output_tokens'] is not None]
+            output_tokens = round(sum(s['output_tokens'] for s in ok) / len(ok)) if ok else '-'
+            latency = sum(s['latency'] for s in samples) / len(samples) if samples else 0
+            self.stdout.write(
+                f"{schema:<8} {chars:>12} {output_tokens:>14} {latency:>10.3f} {len(samples) - len(ok):>7}"
+            )
+
+    def _run(self, prompt, targets, requests):
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            with telemetry.collect_usage() as metrics:
+                try:
+                    ai_service.request_plan_data(prompt, targets)
+                except Exception as e:
+                    self.stderr.write(f"Request failed: {e}")
+                    metrics.output_tokens = None
+            samples.append({'output_tokens': metrics.output_tokens, 'latency': time.perf_counter() - started})
+        return samples
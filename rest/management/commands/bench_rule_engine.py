@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rest.models import Profile
+from rest.rule_engine import generate_rule_plan, is_simple_profile
+from rest.schemas import GeneratedPlanSchema
+
+PROFILES = {
+    'weight_loss': dict(age=34, gender='female', current_weight=82, height=163,
+                        goal='weight_loss', activity_level='lightly_active'),
+    'muscle_gain': dict(age=24, gender='male', current_weight=68, height=178,
+                        goal='muscle_gain', activity_level='very_active'),
+    'allergies': dict(age=45, gender='male', current_weight=90, height=172, goal='maintenance',
+                      activity_level='sedentary', allergies='peanuts, shellfish', disliked_foods='fish'),
+    'vegan': dict(age=29, gender='female', current_weight=60, height=160, goal='endurance',
+                  activity_level='athlete', dietary_preferences='vegan'),
+}
+
+
+class Command(BaseCommand):
+    help = "Times rule-based plan generation and checks every plan against GeneratedPlanSchema."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000,
+                            help="Plans generated per profile.")
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        self.stdout.write(f"{'profile':<12} {'simple':>6} {'p50 us':>8} {'p99 us':>8} {'kcal':>6}")
+        worst = 0
+        for name, fields in PROFILES.items():
+            profile = Profile(**fields)
+            plan = generate_rule_plan(profile)
+            GeneratedPlanSchema.model_validate(plan)
+
+            samples = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                generate_rule_plan(profile)
+                samples.append(time.perf_counter() - started)
+            samples.sort()
+            p50 = samples[len(samples) // 2] * 1e6
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6
+            worst = max(worst, p99)
+            self.stdout.write(
+                f"{name:<12} {str(is_simple_profile(profile)):>6} {p50:>8.0f} {p99:>8.0f} "
+                f"{plan['nutrition_days'][0]['target_calories']:>6}"
+            )
+
+        if worst >= 1000:
+            raise CommandError(f"p99 of {worst:.0f}us is over the 1ms budget")
+        self.stdout.write(self.style.SUCCESS(f"Every plan was valid and the worst p99 was {worst:.0f}us."))
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rest.food_matcher import FoodMatcher, build_meal_food_matches
+from rest.models import Meal, MealFoodMatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Matches the foods in every saved meal description to the food catalog, streaming "
+        "the meals in primary key order one batch at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Meals read, matched and written per batch.")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Match meals that already have matches again, replacing them.")
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Stop after this many meals.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        limit = options['limit']
+        # Built once so every batch uses the same lexicon
+        matcher = FoodMatcher.from_catalog()
+
+        meals_seen = matched_meals = matches_saved = 0
+        match_seconds = 0.0
+        started = time.perf_counter()
+        last_pk = 0
+        while limit is None or meals_seen < limit:
+            queryset = Meal.objects.filter(pk__gt=last_pk)
+            if not options['rebuild']:
+                queryset = queryset.filter(food_matches__isnull=True)
+            size = batch_size if limit is None else min(batch_size, limit - meals_seen)
+            meals = list(queryset.order_by('pk').only('pk', 'description')[:size])
+            if not meals:
+                break
+            last_pk = meals[-1].pk
+
+            match_started = time.perf_counter()
+            matches = build_meal_food_matches(meals, matcher)
+            match_seconds += time.perf_counter() - match_started
+
+            with transaction.atomic():
+                if options['rebuild']:
+                    MealFoodMatch.objects.filter(meal_id__in=[meal.pk for meal in meals]).delete()
+                MealFoodMatch.objects.bulk_create(matches)
+
+            meals_seen += len(meals)
+            matched_meals += len({match.meal_id for match in matches})
+            matches_saved += len(matches)
+            self.stdout.write(f"{meals_seen} meals, {matches_saved} matches (up to meal {last_pk})")
+
+        elapsed = time.perf_counter() - started
+        per_meal = match_seconds / meals_seen * 1e6 if meals_seen else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Matched {matched_meals} of {meals_seen} meals to {matches_saved} catalog foods in {elapsed:.1f}s "
+            f"({per_meal:.0f}us of matching per meal)."
+        ))
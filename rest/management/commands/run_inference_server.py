@@ -0,0 +1,35 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the local inference server that owns the local model for every web worker. "
+        "Point the workers at it with LOCAL_INFERENCE_SOCKET."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.LOCAL_INFERENCE_SOCKET or os.path.join(settings.BASE_DIR, 'local_inference.sock'),
+                            help="Path of the Unix socket to listen on.")
+        parser.add_argument('--model', default=os.path.join(settings.BASE_DIR, 'model.gguf'),
+                            help="Path of the GGUF model file.")
+        parser.add_argument('--preload', action='store_true',
+                            help="Load the model now instead of on the first request.")
+
+    def handle(self, *args, **options):
+        from ai_local.inference_server import InferenceServer
+
+        server = InferenceServer(options['socket'], options['model'])
+        if options['preload']:
+            server.model.load_model()
+        self.stdout.write(
+            f"Serving local inference on {options['socket']} with {len(server.scheduler.replicas)} replica(s)"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rest.jobs import fail_stale_jobs, run_generation_job
+from rest.models import GenerationJob
+
+
+class Command(BaseCommand):
+    help = "Runs a pool of workers that process pending plan generation jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.PLAN_JOB_WORKERS,
+                            help="Number of jobs to run concurrently.")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to wait between polls when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the pending jobs and exit instead of polling forever.")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        self.stdout.write(f"Processing plan generation jobs with {workers} worker(s)")
+
+        in_flight = {}
+        last_cleanup = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='plan-job') as pool:
+            while True:
+                # Jobs left running by a worker that died would otherwise block their date for good.
+                # Pending jobs, including those a web process lost on restart, are picked up below.
+                if time.monotonic() - last_cleanup > 60:
+                    fail_stale_jobs()
+                    last_cleanup = time.monotonic()
+
+                # Forget about jobs that have finished
+                in_flight = {job_id: f for job_id, f in in_flight.items() if not f.done()}
+
+                free_slots = workers - len(in_flight)
+                pending_ids = []
+                if free_slots > 0:
+                    pending_ids = list(
+                        GenerationJob.objects.filter(status=GenerationJob.STATUS_PENDING)
+                        .exclude(pk__in=in_flight.keys())
+                        .order_by('created_at')
+                        .values_list('pk', flat=True)[:free_slots]
+                    )
+                for job_id in pending_ids:
+                    in_flight[job_id] = pool.submit(run_generation_job, job_id)
+                    self.stdout.write(f"Started job {job_id}")
+
+                if options['once'] and not pending_ids and not in_flight:
+                    break
+                if not pending_ids:
+                    time.sleep(options['poll_interval'])
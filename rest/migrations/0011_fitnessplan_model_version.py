@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0010_plantemplate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fitnessplan',
+            name='model_version',
+            field=models.CharField(blank=True, help_text='The model (and version) that generated this plan.', max_length=100),
+        ),
+    ]
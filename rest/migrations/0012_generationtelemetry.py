@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0011_fitnessplan_model_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationTelemetry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('backend', models.CharField(db_index=True, help_text="e.g. 'gemini', 'local' or 'fallback'.", max_length=50)),
+                ('model_version', models.CharField(blank=True, max_length=100)),
+                ('prompt_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('output_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('time_to_first_token_seconds', models.FloatField(blank=True, null=True)),
+                ('latency_seconds', models.FloatField()),
+                ('retries', models.PositiveIntegerField(default=0, help_text='Extra requests made to complete or repair the plan.')),
+                ('parse_failures', models.PositiveIntegerField(default=0, help_text='Responses that failed JSON or schema validation.')),
+                ('used_fallback', models.BooleanField(default=False)),
+                ('succeeded', models.BooleanField(default=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
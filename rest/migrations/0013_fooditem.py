@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0012_generationtelemetry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(help_text="Stable identifier, e.g. 'waakye'.", unique=True)),
+                ('name', models.CharField(help_text="e.g., 'Waakye'", max_length=100)),
+                ('category', models.CharField(choices=[('staple', 'Staple'), ('protein', 'Protein'), ('soup', 'Soup or Stew'), ('vegetable', 'Vegetable'), ('fruit', 'Fruit'), ('dairy', 'Dairy'), ('snack', 'Snack'), ('drink', 'Drink')], db_index=True, max_length=20)),
+                ('portion', models.CharField(help_text="One portion, e.g. 'ladle (250 g)'.", max_length=50)),
+                ('portion_grams', models.FloatField()),
+                ('calories', models.PositiveIntegerField(help_text='Per portion.')),
+                ('protein_grams', models.FloatField(help_text='Per portion.')),
+                ('carbs_grams', models.FloatField(help_text='Per portion.')),
+                ('fats_grams', models.FloatField(help_text='Per portion.')),
+                ('tags', models.CharField(blank=True, help_text="Comma-separated allergens and food groups, e.g. 'fish,shellfish'.", max_length=200)),
+                ('is_active', models.BooleanField(default=True, help_text='Only active foods are offered to the AI.')),
+            ],
+            options={
+                'ordering': ['category', 'name'],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+import json
+from pathlib import Path
+
+from django.db import migrations
+
+CATALOG_PATH = Path(__file__).resolve().parent.parent / 'data' / 'ghana_food_catalog.json'
+
+
+def load_catalog():
+    with open(CATALOG_PATH) as catalog:
+        return json.load(catalog)['foods']
+
+
+def seed_food_items(apps, schema_editor):
+    FoodItem = apps.get_model('rest', 'FoodItem')
+    existing = set(FoodItem.objects.values_list('code', flat=True))
+    FoodItem.objects.bulk_create([
+        FoodItem(**food) for food in load_catalog() if food['code'] not in existing
+    ])
+
+
+def remove_food_items(apps, schema_editor):
+    FoodItem = apps.get_model('rest', 'FoodItem')
+    FoodItem.objects.filter(code__in=[food['code'] for food in load_catalog()]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0013_fooditem'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_food_items, remove_food_items),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0014_seed_fooditems'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealFoodMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('matched_text', models.CharField(help_text="The lexicon name that matched, e.g. 'boiled egg'.", max_length=100)),
+                ('score', models.FloatField(help_text='Trigram similarity of the match, 1.0 for an exact name.')),
+                ('portions', models.FloatField(default=1, help_text='Estimated number of catalog portions.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('food', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_matches', to='rest.fooditem')),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='food_matches', to='rest.meal')),
+            ],
+            options={
+                'unique_together': {('meal', 'food')},
+            },
+        ),
+    ]
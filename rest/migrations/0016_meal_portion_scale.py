@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0015_mealfoodmatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='portion_scale',
+            field=models.FloatField(default=1.0, help_text="Factor the generated portion and macros were scaled by to meet the day's targets"),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest', '0016_meal_portion_scale'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='replaces',
+            field=models.ForeignKey(blank=True, help_text='A plan the new plan takes over from; it is ended or removed when the new plan is saved.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='replaced_by_jobs', to='rest.fitnessplan'),
+        ),
+    ]
@@ -96,6 +96,7 @@ class FitnessPlan(models.Model):
     # For debugging and fine-tuning your AI
     ai_prompt_text = models.TextField(blank=True, help_text="The exact prompt sent to the AI.")
     ai_response_raw = models.JSONField(blank=True, null=True, help_text="The raw JSON response from the AI.")
+    model_version = models.CharField(blank=True, max_length=100, help_text="The model (and version) that generated this plan.")
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -168,11 +169,128 @@ class Meal(models.Model):
     carbs_grams = models.FloatField()
     fats_grams = models.FloatField()
     portion_size = models.CharField(max_length=100, blank=True, null=True, help_text="e.g., '1 medium ladle', '2 pieces of chicken'")
+    portion_scale = models.FloatField(default=1.0, help_text="Factor the generated portion and macros were scaled by to meet the day's targets")
     
     def __str__(self):
         return f"{self.get_meal_type_display()}: {self.description}"
 
 
+class FoodItem(models.Model):
+    """ A catalog food with the macros of one standard portion, for plans built from catalog IDs. """
+    CATEGORY_CHOICES = [
+        ('staple', 'Staple'),
+        ('protein', 'Protein'),
+        ('soup', 'Soup or Stew'),
+        ('vegetable', 'Vegetable'),
+        ('fruit', 'Fruit'),
+        ('dairy', 'Dairy'),
+        ('snack', 'Snack'),
+        ('drink', 'Drink'),
+    ]
+    code = models.SlugField(max_length=50, unique=True, help_text="Stable identifier, e.g. 'waakye'.")
+    name = models.CharField(max_length=100, help_text="e.g., 'Waakye'")
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, db_index=True)
+    portion = models.CharField(max_length=50, help_text="One portion, e.g. 'ladle (250 g)'.")
+    portion_grams = models.FloatField()
+    calories = models.PositiveIntegerField(help_text="Per portion.")
+    protein_grams = models.FloatField(help_text="Per portion.")
+    carbs_grams = models.FloatField(help_text="Per portion.")
+    fats_grams = models.FloatField(help_text="Per portion.")
+    tags = models.CharField(max_length=200, blank=True, help_text="Comma-separated allergens and food groups, e.g. 'fish,shellfish'.")
+    is_active = models.BooleanField(default=True, help_text="Only active foods are offered to the AI.")
+
+    class Meta:
+        ordering = ['category', 'name']
+
+    def __str__(self):
+        return f"{self.name} ({self.portion})"
+
+
+class MealFoodMatch(models.Model):
+    """ A catalog food found in a meal's free-text description (see rest/food_matcher.py). """
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name='food_matches')
+    food = models.ForeignKey(FoodItem, on_delete=models.CASCADE, related_name='meal_matches')
+    matched_text = models.CharField(max_length=100, help_text="The lexicon name that matched, e.g. 'boiled egg'.")
+    score = models.FloatField(help_text="Trigram similarity of the match, 1.0 for an exact name.")
+    portions = models.FloatField(default=1, help_text="Estimated number of catalog portions.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['meal', 'food']
+
+    def __str__(self):
+        return f"{self.food.name} x{self.portions:g} in meal {self.meal_id}"
+
+
+class GenerationJob(models.Model):
+    """ A queued request to generate a FitnessPlan in the background. """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='generation_jobs')
+    start_date = models.DateField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    plan = models.ForeignKey(FitnessPlan, on_delete=models.SET_NULL, null=True, blank=True, related_name='generation_jobs')
+    replaces = models.ForeignKey(FitnessPlan, on_delete=models.SET_NULL, null=True, blank=True, related_name='replaced_by_jobs',
+                                 help_text="A plan the new plan takes over from; it is ended or removed when the new plan is saved.")
+    error = models.TextField(blank=True, null=True, help_text="Why the generation failed, if it did.")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"Generation job {self.pk} ({self.status}) for {self.profile.user.username}"
+
+
+class PlanTemplate(models.Model):
+    """ A generated plan cached for reuse by every profile with the same fingerprint. """
+    fingerprint = models.CharField(max_length=255, unique=True, help_text="Normalized summary of the profile fields used in the prompt.")
+    plan_data = models.JSONField(help_text="The generated plan, shaped like GeneratedPlanSchema.")
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-last_used_at']
+
+    def __str__(self):
+        return f"Plan template {self.fingerprint} ({self.hit_count} hits)"
+
+
+class GenerationTelemetry(models.Model):
+    """ Tokens, timings and outcome of one plan generation attempt (see rest/telemetry.py). """
+    backend = models.CharField(max_length=50, db_index=True, help_text="e.g. 'gemini', 'local' or 'fallback'.")
+    model_version = models.CharField(blank=True, max_length=100)
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    output_tokens = models.PositiveIntegerField(null=True, blank=True)
+    time_to_first_token_seconds = models.FloatField(null=True, blank=True)
+    latency_seconds = models.FloatField()
+    retries = models.PositiveIntegerField(default=0, help_text="Extra requests made to complete or repair the plan.")
+    parse_failures = models.PositiveIntegerField(default=0, help_text="Responses that failed JSON or schema validation.")
+    used_fallback = models.BooleanField(default=False)
+    succeeded = models.BooleanField(default=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.backend} generation at {self.created_at:%Y-%m-%d %H:%M} ({self.latency_seconds:.1f}s)"
+
+
 class WorkoutTracking(models.Model):
     """ Track completion of individual exercises """
     exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='tracking_records')
@@ -0,0 +1,135 @@
+# rest/plan_adapt.py
+"""
+Updates the active plan's numbers after a profile change without an AI call.
+
+A new weight or activity level only changes how much the user should eat, not
+what the plan is, so the daily targets are recomputed with the rule engine
+and the meals are rescaled to them with the macro-balancing solver. Only a
+change of goal needs a new plan, which is generated by a background job.
+"""
+from datetime import date
+
+import numpy as np
+from django.db import transaction
+
+from .jobs import active_jobs, enqueue_generation_job
+from .macro_balance import MAX_SCALE, MEAL_FIELDS, MIN_SCALE, TARGET_FIELDS, solve_scales
+from .models import Meal, NutritionDay
+from .rule_engine import energy_targets
+
+# Profile fields the energy targets are computed from
+TARGET_PROFILE_FIELDS = ('current_weight', 'height', 'age', 'gender', 'activity_level', 'goal')
+# Days whose meals are closer than this to the new day targets are left as they are
+ADAPT_TOLERANCE = 0.02
+
+
+def get_active_plan(profile):
+    """The plan covering today, the newest if more than one does, or None."""
+    today = date.today()
+    return profile.fitness_plans.filter(start_date__lte=today, end_date__gte=today).order_by('-created_at').first()
+
+
+def new_day_targets(days, targets):
+    """
+    The day targets for `targets` (from energy_targets): each macro is scaled
+    by the same factor on every day, so the week averages the new targets and
+    training days keep eating more than rest days.
+    """
+    new_targets = []
+    for target_field, key in zip(TARGET_FIELDS, ('calories', 'protein_grams', 'carbs_grams', 'fats_grams')):
+        current = [getattr(day, target_field) for day in days if getattr(day, target_field)]
+        factor = targets[key] / (sum(current) / len(current)) if current else None
+        new_targets.append([
+            round(getattr(day, target_field) * factor) if factor and getattr(day, target_field) else targets[key]
+            for day in days
+        ])
+    return [dict(zip(TARGET_FIELDS, values)) for values in zip(*new_targets)]
+
+
+def adapt_plan(plan, profile):
+    """
+    Sets the plan's day targets to the profile's current energy targets and
+    rescales each day's meals to meet them, in one transaction with one bulk
+    UPDATE for the days and one for the meals. Returns (days, meals) updated.
+
+    A day's meals are only touched when their totals are more than
+    ADAPT_TOLERANCE off the new targets, and only rescaled when that meets the
+    new calories within ADAPT_TOLERANCE and brings the macros closer (see
+    solve_scales). Days that stay further off are logged.
+    """
+    targets = energy_targets(profile)
+    days = list(NutritionDay.objects.filter(plan=plan).order_by('day_of_week'))
+    if not days:
+        return 0, 0
+    meals_by_day = {day.pk: [] for day in days}
+    for meal in Meal.objects.filter(nutrition_day__plan=plan).order_by('pk'):
+        meals_by_day[meal.nutrition_day_id].append(meal)
+
+    day_targets = new_day_targets(days, targets)
+    width = max(len(meals) for meals in meals_by_day.values()) or 1
+    meal_matrix = np.zeros((len(days), 4, width))
+    portion_scales = np.ones((len(days), width))
+    for d, day in enumerate(days):
+        for m, meal in enumerate(meals_by_day[day.pk]):
+            meal_matrix[d, :, m] = [getattr(meal, field) for field in MEAL_FIELDS]
+            portion_scales[d, m] = meal.portion_scale
+    target_matrix = np.array([[values[field] for field in TARGET_FIELDS] for values in day_targets], dtype=float)
+    # Bounds on the factor that keep each meal's total portion_scale within [MIN_SCALE, MAX_SCALE];
+    # days already within ADAPT_TOLERANCE get a factor of 1 on every meal
+    scales = solve_scales(meal_matrix, target_matrix, ADAPT_TOLERANCE,
+                          MIN_SCALE / portion_scales, MAX_SCALE / portion_scales)
+    totals = (meal_matrix * scales[:, None, :]).sum(axis=2)
+    errors = np.where(target_matrix > 0, np.abs(totals - target_matrix) / np.where(target_matrix > 0, target_matrix, 1), 0)
+
+    changed_meals = []
+    for d, day in enumerate(days):
+        for field, value in day_targets[d].items():
+            setattr(day, field, value)
+        day.target_water_litres = targets['water_litres']
+        for m, meal in enumerate(meals_by_day[day.pk]):
+            if scales[d, m] == 1:
+                continue
+            # Macros are recomputed from the unscaled portion so rounding doesn't compound
+            total = min(MAX_SCALE, max(MIN_SCALE, round(meal.portion_scale * float(scales[d, m]), 2)))
+            unscaled = meal_matrix[d, :, m] / meal.portion_scale
+            meal.calories = round(unscaled[0] * total)
+            meal.protein_grams = round(unscaled[1] * total, 1)
+            meal.carbs_grams = round(unscaled[2] * total, 1)
+            meal.fats_grams = round(unscaled[3] * total, 1)
+            meal.portion_scale = total
+            changed_meals.append(meal)
+
+    missed = [day.day_of_week for d, day in enumerate(days) if errors[d].max() > ADAPT_TOLERANCE]
+    if missed:
+        print(f"Plan {plan.pk}: days {missed} are still more than {ADAPT_TOLERANCE:.0%} off their new targets")
+
+    with transaction.atomic():
+        NutritionDay.objects.bulk_update(days, list(TARGET_FIELDS) + ['target_water_litres'])
+        Meal.objects.bulk_update(changed_meals, list(MEAL_FIELDS) + ['portion_scale'])
+    return len(days), len(changed_meals)
+
+
+def adapt_active_plan(profile, regenerate=True):
+    """
+    Brings the active plan in line with the profile. Returns a dict with the
+    'plan' (or None when there is no active plan) and either the numbers of
+    'days' and 'meals' updated or, when the goal has changed since the plan
+    was created, 'goal_changed' and the 'job' generating its replacement.
+    The job is only queued when `regenerate` is set, otherwise it is None.
+    The replacement starts today; when it is saved the old plan is ended
+    yesterday, and later plans it overlaps are deleted, in the same
+    transaction (see save_generated_plan).
+    """
+    plan = get_active_plan(profile)
+    if plan is None:
+        return {'plan': None}
+
+    if plan.goal_at_creation and plan.goal_at_creation != profile.goal:
+        job = active_jobs().filter(profile=profile, start_date=date.today()).first()
+        if job is None and regenerate:
+            job = enqueue_generation_job(profile, date.today(), replaces=plan)
+        return {'plan': plan, 'goal_changed': True, 'job': job}
+
+    days, meals = adapt_plan(plan, profile)
+    print(f"Adapted plan {plan.pk} to profile {profile.pk}: {days} days, {meals} meals")
+    return {'plan': plan, 'days': days, 'meals': meals}
@@ -0,0 +1,124 @@
+# rest/plan_cache.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PlanTemplate
+
+# Bump this whenever the prompt changes in a way that makes old templates stale.
+FINGERPRINT_VERSION = 'v1'
+
+# Model version recorded on plans copied from a template rather than generated
+CACHED_PLAN_MODEL_VERSION = 'plan-cache'
+
+HITS_KEY = 'plan_cache:hits'
+MISSES_KEY = 'plan_cache:misses'
+
+AGE_BAND_YEARS = 5
+WEIGHT_BAND_KG = 5
+HEIGHT_BAND_CM = 5
+
+
+def _band(value, width):
+    if value is None:
+        return 'na'
+    low = int(value // width * width)
+    return f'{low}-{low + width - 1}'
+
+
+def _is_empty(text):
+    return not text or text.strip().lower() in ('', 'none', 'no', 'n/a', 'none specified')
+
+
+def profile_fingerprint(profile):
+    """
+    Returns a normalized key for the profile fields that go into the prompt,
+    or None when the profile has personal details (diet, allergies, food likes
+    and dislikes, disabilities, medical conditions) that a shared plan can't honour.
+    """
+    personal_fields = [
+        profile.dietary_preferences, profile.allergies,
+        profile.liked_foods, profile.disliked_foods,
+        profile.disabilities, profile.medical_conditions,
+    ]
+    if not all(_is_empty(value) for value in personal_fields):
+        return None
+
+    return '|'.join([
+        FINGERPRINT_VERSION,
+        profile.gender or 'na',
+        profile.goal or 'na',
+        profile.activity_level or 'na',
+        f'age{_band(profile.age, AGE_BAND_YEARS)}',
+        f'wt{_band(profile.current_weight, WEIGHT_BAND_KG)}',
+        f'ht{_band(profile.height, HEIGHT_BAND_CM)}',
+    ])
+
+
+def _count(key):
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The key was evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+
+
+def get_cached_plan(fingerprint):
+    """Returns the cached plan data for a fingerprint, or None on a miss."""
+    if not settings.PLAN_CACHE_ENABLED or fingerprint is None:
+        return None
+
+    template = PlanTemplate.objects.filter(fingerprint=fingerprint).first()
+    if template is None:
+        _count(MISSES_KEY)
+        return None
+
+    if template.created_at < timezone.now() - timedelta(seconds=settings.PLAN_CACHE_TTL_SECONDS):
+        template.delete()
+        _count(MISSES_KEY)
+        return None
+
+    PlanTemplate.objects.filter(pk=template.pk).update(
+        hit_count=F('hit_count') + 1,
+        last_used_at=timezone.now()
+    )
+    _count(HITS_KEY)
+    return template.plan_data
+
+
+def store_cached_plan(fingerprint, plan_data):
+    """Caches a freshly generated plan and evicts the least recently used templates."""
+    if not settings.PLAN_CACHE_ENABLED or fingerprint is None:
+        return
+
+    now = timezone.now()
+    PlanTemplate.objects.update_or_create(
+        fingerprint=fingerprint,
+        defaults={'plan_data': plan_data, 'hit_count': 0, 'created_at': now, 'last_used_at': now}
+    )
+
+    stale_ids = list(
+        PlanTemplate.objects.order_by('-last_used_at')
+        .values_list('pk', flat=True)[settings.PLAN_CACHE_MAX_ENTRIES:]
+    )
+    if stale_ids:
+        PlanTemplate.objects.filter(pk__in=stale_ids).delete()
+
+
+def plan_cache_stats():
+    """Hit and miss counts for the plan template cache."""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'enabled': settings.PLAN_CACHE_ENABLED,
+        'entries': PlanTemplate.objects.count(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 3) if lookups else None,
+        'miss_rate': round(misses / lookups, 3) if lookups else None,
+    }
@@ -0,0 +1,96 @@
+# rest/plan_fanout.py
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from .schemas import GeneratedPlanSchema, WeekSkeletonSchema, DayPlanSchema
+
+DAY_NAMES = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday', 5: 'Friday', 6: 'Saturday', 7: 'Sunday'}
+
+
+class FanoutError(Exception):
+    """Raised when the weekly skeleton or a day can't be generated."""
+
+
+def build_skeleton_prompt(base_prompt):
+    return f"""{base_prompt}
+
+    Task:
+    - Do NOT generate the full plan yet. Only plan the shape of the week.
+    - Return exactly one entry per day of the week (day_of_week 1 to 7).
+    - For each day give its title, whether it is a rest day, a one-sentence focus
+      for the workout and meals, and the day's calorie, macronutrient and water targets.
+    """
+
+
+def build_day_prompt(base_prompt, skeleton, day):
+    week_outline = '\n'.join(
+        f"    - {DAY_NAMES[d.day_of_week]}: {d.title}{' (rest day)' if d.is_rest_day else ''} - {d.focus}"
+        for d in skeleton.days
+    )
+    return f"""{base_prompt}
+
+    The week has already been planned as follows:
+{week_outline}
+
+    Task:
+    - Generate ONLY {DAY_NAMES[day.day_of_week]} (day_of_week = {day.day_of_week}): "{day.title}".
+    - Focus: {day.focus}
+    - {'This is a rest day, so the exercises list must be empty.' if day.is_rest_day else 'Include the exercises for this workout.'}
+    - The meals must add up to about {day.target_calories} kcal, {day.target_protein_grams} g protein,
+      {day.target_carbs_grams} g carbs and {day.target_fats_grams} g fats.
+    - Avoid repeating meals planned for other days where possible.
+    """
+
+
+def generate_plan_fanout(base_prompt, generate_json, max_workers=7):
+    """
+    Generates a 7-day plan by first fixing the weekly skeleton (rest days, the
+    focus of each day and its targets) and then generating every day with its
+    own concurrent request, so latency tracks the slowest day instead of the week.
+
+    `generate_json(prompt, schema)` calls a backend and returns its JSON text.
+    Returns plan data shaped like GeneratedPlanSchema.
+    """
+    skeleton = _parse_skeleton(generate_json(build_skeleton_prompt(base_prompt), WeekSkeletonSchema))
+
+    def generate_day(day):
+        return DayPlanSchema.model_validate_json(
+            generate_json(build_day_prompt(base_prompt, skeleton, day), DayPlanSchema)
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='plan-day') as pool:
+        # Each day runs in a copy of this context so its usage counts towards the caller's telemetry
+        futures = [pool.submit(contextvars.copy_context().run, generate_day, day) for day in skeleton.days]
+        day_plans = [future.result() for future in futures]
+
+    return _stitch(skeleton, day_plans)
+
+
+def _parse_skeleton(skeleton_json):
+    skeleton = WeekSkeletonSchema.model_validate_json(skeleton_json)
+    days = {day.day_of_week: day for day in skeleton.days}
+    if sorted(days) != list(range(1, 8)):
+        raise FanoutError(f"Skeleton must cover days 1-7, got {sorted(days)}")
+    skeleton.days = [days[d] for d in range(1, 8)]
+    return skeleton
+
+
+def _stitch(skeleton, day_plans):
+    # Stitch the days together, trusting the skeleton for anything the
+    # per-day requests could disagree on.
+    for day, day_plan in zip(skeleton.days, day_plans):
+        workout_day, nutrition_day = day_plan.workout_day, day_plan.nutrition_day
+        workout_day.day_of_week = nutrition_day.day_of_week = day.day_of_week
+        workout_day.is_rest_day = day.is_rest_day
+        if day.is_rest_day:
+            workout_day.exercises = []
+        nutrition_day.target_calories = day.target_calories
+        nutrition_day.target_protein_grams = day.target_protein_grams
+        nutrition_day.target_carbs_grams = day.target_carbs_grams
+        nutrition_day.target_fats_grams = day.target_fats_grams
+        nutrition_day.target_water_litres = day.target_water_litres
+
+    return GeneratedPlanSchema(
+        workout_days=[day_plan.workout_day for day_plan in day_plans],
+        nutrition_days=[day_plan.nutrition_day for day_plan in day_plans],
+    ).model_dump()
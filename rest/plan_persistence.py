@@ -0,0 +1,122 @@
+# rest/plan_persistence.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .food_matcher import save_meal_food_matches
+from .macro_balance import balance_plan
+from .models import FitnessPlan, WorkoutDay, Exercise, NutritionDay, Meal
+
+
+def save_generated_plan(user_profile, plan_data, start_date, end_date, prompt='', model_version='', replaces=None):
+    """
+    Saves a generated plan (a dict shaped like GeneratedPlanSchema) to the database.
+    `model_version` records which model (or 'fallback' / 'plan-cache') produced it.
+
+    The whole tree is built in memory first and written with one INSERT per level
+    (plan, workout days, exercises, nutrition days, meals), so the number of
+    statements does not grow with the size of the plan.
+
+    With PLAN_MACRO_BALANCE the meal portions are first rescaled so each day's
+    totals meet its targets (see macro_balance.py); ai_response_raw keeps the
+    plan as generated.
+
+    `replaces` is a plan the new one takes over from, e.g. after a change of
+    goal. In the same transaction it, and any other plan of the profile that
+    overlaps the new one, is ended the day before `start_date`, or deleted if
+    it starts on or after it, so no two plans cover the same day.
+    """
+    raw_plan_data = plan_data
+    if settings.PLAN_MACRO_BALANCE:
+        plan_data, report = balance_plan(plan_data, settings.PLAN_MACRO_TOLERANCE)
+        adjusted = [day for day in report if day['error_before'] != day['error_after']]
+        if adjusted:
+            print(f"Balanced macros of {len(adjusted)} days: "
+                  + ', '.join(f"day {day['day_of_week']} {day['error_before']:.0%} -> {day['error_after']:.0%}" for day in adjusted))
+        missed = [day['day_of_week'] for day in report if not day['within_tolerance']]
+        if missed:
+            print(f"Days {missed} are still more than {settings.PLAN_MACRO_TOLERANCE:.0%} off their targets")
+
+    with transaction.atomic():
+        if replaces is not None:
+            replaced = FitnessPlan.objects.filter(
+                Q(pk=replaces.pk)
+                | Q(profile=user_profile, start_date__lte=end_date, end_date__gte=start_date)
+            )
+            replaced.filter(start_date__lt=start_date, end_date__gte=start_date).update(
+                end_date=start_date - timedelta(days=1), is_active=False
+            )
+            replaced.filter(start_date__gte=start_date).delete()
+
+        new_plan = FitnessPlan.objects.create(
+            profile=user_profile,
+            start_date=start_date,
+            end_date=end_date,
+            goal_at_creation=user_profile.goal,
+            ai_prompt_text=prompt,
+            ai_response_raw=raw_plan_data,
+            model_version=model_version or ''
+        )
+
+        workout_days = []
+        exercises = []
+        for wd_data in plan_data['workout_days']:
+            workout_day = WorkoutDay(
+                plan=new_plan,
+                day_of_week=wd_data['day_of_week'],
+                title=wd_data['title'],
+                description=wd_data.get('description') or '',
+                is_rest_day=wd_data.get('is_rest_day', False)
+            )
+            workout_days.append(workout_day)
+            for ex_data in wd_data.get('exercises') or []:
+                exercises.append(Exercise(
+                    workout_day=workout_day,
+                    name=ex_data['name'],
+                    sets=ex_data['sets'],
+                    reps=ex_data['reps'],
+                    rest_period_seconds=ex_data['rest_period_seconds'],
+                    notes=ex_data.get('notes')
+                ))
+
+        nutrition_days = []
+        meals = []
+        for nd_data in plan_data['nutrition_days']:
+            nutrition_day = NutritionDay(
+                plan=new_plan,
+                day_of_week=nd_data['day_of_week'],
+                notes=nd_data.get('notes'),
+                target_calories=nd_data.get('target_calories'),
+                target_protein_grams=nd_data.get('target_protein_grams'),
+                target_carbs_grams=nd_data.get('target_carbs_grams'),
+                target_fats_grams=nd_data.get('target_fats_grams'),
+                target_water_litres=nd_data.get('target_water_litres')
+            )
+            nutrition_days.append(nutrition_day)
+            for meal_data in nd_data['meals']:
+                meals.append(Meal(
+                    nutrition_day=nutrition_day,
+                    meal_type=meal_data['meal_type'],
+                    description=meal_data['description'],
+                    calories=meal_data['calories'],
+                    protein_grams=meal_data['protein_grams'],
+                    carbs_grams=meal_data['carbs_grams'],
+                    fats_grams=meal_data['fats_grams'],
+                    portion_size=meal_data.get('portion_size'),
+                    portion_scale=meal_data.get('portion_scale', 1.0)
+                ))
+
+        # Parents must be written first so their primary keys are set
+        # before the children that point at them are inserted.
+        WorkoutDay.objects.bulk_create(workout_days)
+        Exercise.objects.bulk_create(exercises)
+        NutritionDay.objects.bulk_create(nutrition_days)
+        Meal.objects.bulk_create(meals)
+
+        # One more INSERT for the catalog foods found in the meal descriptions
+        if settings.FOOD_MATCH_ON_SAVE:
+            save_meal_food_matches(meals)
+
+    return new_plan
@@ -0,0 +1,218 @@
+# rest/plan_recovery.py
+import json
+
+from django.conf import settings
+from pydantic import ValidationError
+
+from . import telemetry
+from .plan_fanout import DAY_NAMES
+from .plan_stream import PlanStreamParser, DAY_SCHEMAS, WEEK
+from .schemas import GeneratedPlanSchema
+
+
+class PlanRecoveryError(Exception):
+    """Raised when a cut-off or invalid plan can't be completed."""
+
+
+def recover_days(text):
+    """
+    Returns the days that are complete and valid in plan text that may have
+    been cut off, as {array_key: {day_of_week: day_dict}}. The first copy of
+    a day wins if the text repeats one.
+    """
+    parser = PlanStreamParser()
+    parser.feed(text)
+    recovered = {key: {} for key in DAY_SCHEMAS}
+    for key, days in parser.days.items():
+        for day in days:
+            recovered[key].setdefault(day['day_of_week'], day)
+    return recovered
+
+
+def invalid_days(error):
+    """The (array_key, index) of every day a plan ValidationError points into."""
+    return sorted({
+        tuple(detail['loc'][:2]) for detail in error.errors()
+        if len(detail['loc']) >= 2 and detail['loc'][0] in DAY_SCHEMAS
+    })
+
+
+def missing_days(recovered):
+    """The day numbers each array still needs, e.g. {'workout_days': [6, 7], ...}."""
+    return {key: [d for d in WEEK if d not in days] for key, days in recovered.items()}
+
+
+def build_continuation_prompt(base_prompt, recovered, missing):
+    partial_plan = {key: [days[d] for d in sorted(days)] for key, days in recovered.items()}
+    wanted = '\n'.join(
+        f"    - {key}: {', '.join(f'{DAY_NAMES[d]} (day_of_week = {d})' for d in days)}"
+        for key, days in missing.items() if days
+    )
+    return f"""{base_prompt}
+
+    A previous response was cut off or had invalid days. These days are valid and must not change:
+    {json.dumps(partial_plan, separators=(',', ':'))}
+
+    Task:
+    - Continue the plan. Return ONLY the days that are still missing:
+{wanted}
+    - Leave every other day out of both lists.
+    - Keep the style and weekly progression of the complete days, and avoid repeating their meals.
+    """
+
+
+def _merge(recovered, missing, text):
+    """Adds the requested days found in a continuation response to `recovered`."""
+    for key, days in recover_days(text).items():
+        for day_of_week, day in days.items():
+            if day_of_week in missing[key]:
+                recovered[key][day_of_week] = day
+
+
+def _complete_week(recovered):
+    return GeneratedPlanSchema(**{
+        key: [days[d] for d in WEEK] for key, days in recovered.items()
+    }).model_dump()
+
+
+def _start(text, invalid=None):
+    """
+    The valid days of `text` to continue from, without the days in `invalid`
+    ({array_key: [day_of_week, ...]}) so they are requested again.
+    """
+    recovered = recover_days(text or '')
+    for key, days in (invalid or {}).items():
+        for day_of_week in days:
+            recovered[key].pop(day_of_week, None)
+    if any(recovered.values()):
+        print(f"Keeping {sum(len(days) for days in recovered.values())} valid days of the plan")
+    else:
+        print("No valid day in the response, requesting the whole plan again")
+    return recovered
+
+
+def _next_prompt(base_prompt, recovered, missing):
+    """The whole plan again while no day is valid, otherwise only the missing days."""
+    if not any(recovered.values()):
+        return base_prompt
+    return build_continuation_prompt(base_prompt, recovered, missing)
+
+
+def complete_plan(base_prompt, text, generate_json, attempts=None, invalid=None):
+    """
+    Completes plan text that was cut off (max_tokens, a stop sequence, a dropped
+    stream) or has invalid days by keeping its valid days and asking for only
+    the missing ones, which include the `invalid` days validate_plan_text()
+    pointed out. If no day is valid the whole plan is requested again. Each
+    request may itself be cut off or invalid; whatever it gets right is kept
+    and the next attempt asks for the rest, up to `attempts`
+    (PLAN_RECOVERY_ATTEMPTS) requests.
+
+    `generate_json(prompt, schema)` calls a backend and returns its JSON text.
+    Returns plan data shaped like GeneratedPlanSchema.
+    """
+    attempts = settings.PLAN_RECOVERY_ATTEMPTS if attempts is None else attempts
+    recovered = _start(text, invalid)
+    for _ in range(attempts):
+        missing = missing_days(recovered)
+        if not any(missing.values()):
+            break
+        prompt = _next_prompt(base_prompt, recovered, missing)
+        telemetry.count(retries=1)
+        _merge(recovered, missing, generate_json(prompt, GeneratedPlanSchema))
+
+    missing = missing_days(recovered)
+    if any(missing.values()):
+        raise PlanRecoveryError(f"Plan still missing days after {attempts} attempts: {missing}")
+    return _complete_week(recovered)
+
+
+async def acomplete_plan(base_prompt, text, agenerate_json, attempts=None, invalid=None):
+    """Async version of complete_plan, where `agenerate_json(prompt, schema)` is a coroutine."""
+    attempts = settings.PLAN_RECOVERY_ATTEMPTS if attempts is None else attempts
+    recovered = _start(text, invalid)
+    for _ in range(attempts):
+        missing = missing_days(recovered)
+        if not any(missing.values()):
+            break
+        prompt = _next_prompt(base_prompt, recovered, missing)
+        telemetry.count(retries=1)
+        _merge(recovered, missing, await agenerate_json(prompt, GeneratedPlanSchema))
+
+    missing = missing_days(recovered)
+    if any(missing.values()):
+        raise PlanRecoveryError(f"Plan still missing days after {attempts} attempts: {missing}")
+    return _complete_week(recovered)
+
+
+def invalid_day_numbers(text, error):
+    """
+    The day_of_week of each day `error` (see invalid_days) points into, as
+    {array_key: [day_of_week, ...]}. Days whose number can't be read are left
+    out; they are missing from the recovered days anyway.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    numbers = {}
+    for key, index in invalid_days(error):
+        items = data.get(key) if isinstance(data, dict) else None
+        item = items[index] if isinstance(items, list) and isinstance(index, int) and index < len(items) else None
+        day_of_week = item.get('day_of_week') if isinstance(item, dict) else None
+        if day_of_week in WEEK:
+            numbers.setdefault(key, []).append(day_of_week)
+    return numbers
+
+
+def check_plan_text(text):
+    """
+    Validates plan JSON text against GeneratedPlanSchema in one pass (parsing
+    and validation both happen in pydantic-core). Returns (plan_data, invalid):
+    the plan data if it is valid and covers the whole week, otherwise None and
+    the days that must be generated again ({array_key: [day_of_week, ...]},
+    empty when the text is cut off or malformed rather than wrong).
+    """
+    try:
+        plan = GeneratedPlanSchema.model_validate_json(text or '')
+    except ValidationError as e:
+        invalid = invalid_day_numbers(text, e)
+        if invalid:
+            print(f"Plan has invalid days {invalid}: {e.error_count()} errors")
+        else:
+            print(f"Plan JSON is incomplete or malformed: {e.errors()[0]['msg']}")
+        return None, invalid
+
+    plan_data = plan.model_dump()
+    covered = {key: {day['day_of_week'] for day in plan_data[key]} for key in DAY_SCHEMAS}
+    if any(len(plan_data[key]) != 7 or covered[key] != set(WEEK) for key in DAY_SCHEMAS):
+        print(f"Plan does not cover each day once: {covered}")
+        return None, {}
+    return plan_data, {}
+
+
+def validate_plan_text(text):
+    """The plan data of `text` if it is valid and covers the whole week, otherwise None (see check_plan_text)."""
+    return check_plan_text(text)[0]
+
+
+def load_plan_text(base_prompt, text, generate_json):
+    """
+    Parses and validates plan JSON text. If it was cut off or some days are
+    invalid, only those days are requested again with complete_plan() before
+    the plan is used. Raises PlanRecoveryError if it can't be completed.
+    """
+    plan_data, invalid = check_plan_text(text)
+    if plan_data is not None:
+        return plan_data
+    telemetry.count(parse_failures=1)
+    return complete_plan(base_prompt, text, generate_json, invalid=invalid)
+
+
+async def aload_plan_text(base_prompt, text, agenerate_json):
+    """Async version of load_plan_text."""
+    plan_data, invalid = check_plan_text(text)
+    if plan_data is not None:
+        return plan_data
+    telemetry.count(parse_failures=1)
+    return await acomplete_plan(base_prompt, text, agenerate_json, invalid=invalid)
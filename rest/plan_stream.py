@@ -0,0 +1,215 @@
+# rest/plan_stream.py
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from pydantic import ValidationError
+
+from .plan_cache import CACHED_PLAN_MODEL_VERSION
+from .plan_persistence import save_generated_plan
+from .schemas import GeneratedPlanSchema, WorkoutDaySchema, NutritionDaySchema
+
+WEEK = range(1, 8)
+
+# Top-level plan arrays and the schema each of their items must satisfy
+DAY_SCHEMAS = {
+    'workout_days': WorkoutDaySchema,
+    'nutrition_days': NutritionDaySchema,
+}
+
+
+class PlanStreamParser:
+    """
+    Incremental JSON scanner for plan text arriving in chunks.
+
+    It tracks string and nesting state character by character so that as soon
+    as an item of `workout_days` or `nutrition_days` closes, it can be parsed
+    and validated on its own, long before the rest of the plan has arrived.
+    Any text before the opening brace (e.g. a model's preamble) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.days = {key: [] for key in DAY_SCHEMAS}
+        self._pos = 0
+        self._start = None  # index of the top-level '{'
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._array_key = None
+        self._item_start = None
+
+    def feed(self, chunk):
+        """
+        Adds a chunk of text and returns a list of (array_key, day_dict)
+        for every day that was completed by it.
+        """
+        self.text += chunk
+        completed = []
+        text = self.text
+
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+
+            if self._start is None:
+                if char == '{':
+                    self._start = pos
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1:pos]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char in '{[':
+                if self._depth == 1 and char == '[':
+                    self._array_key = self._last_key
+                elif self._depth == 2 and char == '{' and self._array_key in DAY_SCHEMAS:
+                    self._item_start = pos
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 2 and char == '}' and self._item_start is not None:
+                    day = self._parse_day(self._array_key, text[self._item_start:pos + 1])
+                    if day is not None:
+                        self.days[self._array_key].append(day)
+                        completed.append((self._array_key, day))
+                    self._item_start = None
+                elif self._depth == 1:
+                    self._array_key = None
+
+        self._pos = len(text)
+        return completed
+
+    @staticmethod
+    def _parse_day(array_key, item_text):
+        try:
+            return DAY_SCHEMAS[array_key].model_validate_json(item_text).model_dump()
+        except ValidationError as e:
+            print(f"Skipping invalid {array_key} item in stream: {e}")
+            return None
+
+    def result(self):
+        """
+        Returns the complete plan data once the stream has ended. Falls back
+        to the days collected while streaming if the full text won't parse,
+        but only if they cover every day of the week in both arrays; a stream
+        cut off part way returns None.
+        """
+        if self._start is not None:
+            end = self.text.rfind('}')
+            try:
+                return GeneratedPlanSchema.model_validate_json(self.text[self._start:end + 1]).model_dump()
+            except ValidationError as e:
+                print(f"Streamed plan failed validation, using the streamed days: {e}")
+        week = {}
+        for key, days in self.days.items():
+            by_day = {}
+            for day in days:
+                by_day.setdefault(day['day_of_week'], day)
+            if set(by_day) != set(WEEK):
+                print(f"Streamed {key} only cover days {sorted(by_day)}")
+                return None
+            week[key] = [by_day[d] for d in WEEK]
+        return week
+
+
+def open_plan_text_stream(user_profile, start_date):
+    """
+    Starts streaming a plan from the backend chosen by PLAN_STREAM_BACKEND.
+    Returns the prompt, an iterable of raw output text chunks and a function
+    that returns the version of the model that produced them, to be called
+    once the stream has ended.
+    """
+    if settings.PLAN_STREAM_BACKEND == 'local':
+        from ai_local.services import build_local_prompt, stream_local_plan_text, current_local_model_version
+        prompt = build_local_prompt(user_profile)
+        # The model is loaded lazily and may be swapped, so look the version up afterwards
+        return prompt, stream_local_plan_text(prompt), current_local_model_version
+
+    from .ai_service import build_plan_prompt, stream_plan_text, GEMINI_MODEL
+    from .plan_cache import profile_fingerprint, get_cached_plan
+    prompt = build_plan_prompt(user_profile, start_date)
+    cached_plan = get_cached_plan(profile_fingerprint(user_profile))
+    if cached_plan is not None:
+        return prompt, [json.dumps(cached_plan)], lambda: CACHED_PLAN_MODEL_VERSION
+    return prompt, stream_plan_text(prompt), lambda: GEMINI_MODEL
+
+
+def sse_event(event, data):
+    """Formats a Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def plan_event_stream(user_profile, start_date, prompt, chunks, serialize_plan, model_version=None, telemetry=None):
+    """
+    Relays each plan day to the client as soon as it has been generated,
+    then saves the full plan and sends it as the final `plan` event.
+
+    `chunks` is an iterable of raw model output text, `serialize_plan`
+    turns the saved FitnessPlan into response data and `model_version`,
+    if given, returns the version to record on the plan. `telemetry` is
+    the TrackedStream the chunks were opened in, if any.
+    """
+    parser = PlanStreamParser()
+    yield sse_event('start', {'start_date': start_date})
+
+    if telemetry is not None:
+        chunks = telemetry.iterate(chunks)
+    try:
+        for chunk in chunks:
+            for array_key, day in parser.feed(chunk):
+                event = 'workout_day' if array_key == 'workout_days' else 'nutrition_day'
+                yield sse_event(event, day)
+    except Exception as e:
+        print(f"Error while streaming plan: {e}")
+        if telemetry is not None:
+            telemetry.finish(error=str(e) or type(e).__name__)
+        yield sse_event('error', {'detail': "Failed to generate fitness plan."})
+        return
+
+    plan_data = parser.result()
+    if plan_data is None and parser.text and settings.PLAN_STREAM_BACKEND != 'local':
+        # Ask Gemini for just the days the stream didn't deliver
+        from .ai_service import request_json
+        from .plan_recovery import complete_plan
+        try:
+            plan_data = complete_plan(prompt, parser.text, request_json)
+        except Exception as e:
+            print(f"Could not complete the streamed plan: {e}")
+    version = model_version() if model_version else ''
+    if telemetry is not None and version != CACHED_PLAN_MODEL_VERSION:
+        if plan_data is None:
+            telemetry.metrics.count(parse_failures=1)
+        telemetry.finish(version, error=None if plan_data is not None else "Streamed plan could not be parsed")
+    if plan_data is None:
+        yield sse_event('error', {'detail': "Failed to generate fitness plan."})
+        return
+
+    try:
+        plan = save_generated_plan(
+            user_profile,
+            plan_data,
+            start_date=start_date,
+            end_date=start_date + timedelta(days=6),
+            prompt=prompt,
+            model_version=version
+        )
+    except Exception as e:
+        print(f"Error saving plan to database: {e}")
+        yield sse_event('error', {'detail': "Failed to save fitness plan."})
+        return
+
+    yield sse_event('plan', serialize_plan(plan))
@@ -0,0 +1,126 @@
+# rest/plan_wire.py
+import json
+
+from django.conf import settings
+from pydantic import ValidationError
+
+from .food_catalog import expand_catalog_plan_text
+from .schemas import CompactPlanSchema, GeneratedPlanSchema
+
+# Meal type codes used by CompactMealSchema
+MEAL_TYPE_CODES = {'breakfast': 'b', 'lunch': 'l', 'dinner': 'd', 'snack': 's'}
+MEAL_TYPES = {code: meal_type for meal_type, code in MEAL_TYPE_CODES.items()}
+
+REST_DAY_TITLE = 'Rest Day'
+
+# Full field name -> compact key, per object type
+EXERCISE_KEYS = {'name': 'n', 'sets': 's', 'reps': 'r', 'rest_period_seconds': 'rp', 'notes': 'no'}
+MEAL_KEYS = {'meal_type': 'm', 'description': 'ds', 'calories': 'c', 'protein_grams': 'p',
+             'carbs_grams': 'cb', 'fats_grams': 'f', 'portion_size': 'ps'}
+NUTRITION_DAY_KEYS = {'day_of_week': 'd', 'target_calories': 'c', 'target_protein_grams': 'p',
+                      'target_carbs_grams': 'cb', 'target_fats_grams': 'f', 'target_water_litres': 'w',
+                      'notes': 'no'}
+
+
+def use_compact_schema():
+    """Whether plan requests should ask for CompactPlanSchema (PLAN_WIRE_SCHEMA = 'compact')."""
+    return settings.PLAN_WIRE_SCHEMA == 'compact'
+
+
+def _rename(data, keys):
+    return {short: data.get(full) for full, short in keys.items()}
+
+
+def _expand(data, keys):
+    return {full: data.get(short) for full, short in keys.items()}
+
+
+def _compact_workout_day(day):
+    # Defaults elision: a rest day with nothing to say is just its number
+    if day['is_rest_day'] and not day.get('exercises') and not day.get('description') \
+            and day.get('title') == REST_DAY_TITLE:
+        return {'d': day['day_of_week'], 'rd': True}
+    return {
+        'd': day['day_of_week'],
+        'rd': day['is_rest_day'],
+        't': day['title'],
+        'ds': day.get('description'),
+        'ex': [_rename(exercise, EXERCISE_KEYS) for exercise in day.get('exercises') or []],
+    }
+
+
+def _expand_workout_day(day):
+    title = day.get('t')
+    if title is None:
+        title = REST_DAY_TITLE if day.get('rd') else ''
+    return {
+        'day_of_week': day['d'],
+        'title': title,
+        'is_rest_day': day.get('rd', False),
+        'description': day.get('ds'),
+        'exercises': [_expand(exercise, EXERCISE_KEYS) for exercise in day.get('ex') or []],
+    }
+
+
+def _compact_meal(meal):
+    if meal['meal_type'] not in MEAL_TYPE_CODES:
+        raise ValueError(f"Meal type {meal['meal_type']!r} has no compact code")
+    compact = _rename(meal, MEAL_KEYS)
+    compact['m'] = MEAL_TYPE_CODES[meal['meal_type']]
+    return compact
+
+
+def _expand_meal(meal):
+    full = _expand(meal, MEAL_KEYS)
+    full['meal_type'] = MEAL_TYPES[meal['m']]
+    return full
+
+
+def compact_plan(plan_data):
+    """
+    Converts plan data shaped like GeneratedPlanSchema into CompactPlanSchema
+    data. Raises ValueError for a meal type other than those in MEAL_TYPE_CODES,
+    which the compact schema can't carry.
+    """
+    plan = GeneratedPlanSchema.model_validate(plan_data).model_dump()
+    return {
+        'w': [_compact_workout_day(day) for day in plan['workout_days']],
+        'n': [
+            {**_rename(day, NUTRITION_DAY_KEYS), 'ml': [_compact_meal(meal) for meal in day['meals']]}
+            for day in plan['nutrition_days']
+        ],
+    }
+
+
+def expand_compact_plan(compact_data):
+    """
+    Converts CompactPlanSchema data back into GeneratedPlanSchema data. The
+    mapping is lossless for every plan compact_plan() produces, so the rest of
+    the pipeline (validation, recovery, persistence) only sees the full schema.
+    """
+    compact = CompactPlanSchema.model_validate(compact_data).model_dump()
+    return GeneratedPlanSchema(
+        workout_days=[_expand_workout_day(day) for day in compact['w']],
+        nutrition_days=[
+            {**_expand(day, NUTRITION_DAY_KEYS), 'meals': [_expand_meal(meal) for meal in day['ml']]}
+            for day in compact['n']
+        ],
+    ).model_dump()
+
+
+def expand_plan_text(text, targets=None):
+    """
+    Returns compact (or, with PLAN_WIRE_SCHEMA = 'catalog', catalog) plan JSON
+    text as GeneratedPlanSchema JSON text. Text that isn't a valid plan in that
+    schema (e.g. it was cut off, or it already is a full plan such as the
+    fallback) is returned unchanged for the usual validation and recovery.
+    `targets` are the energy_targets() catalog days are given.
+    """
+    if settings.PLAN_WIRE_SCHEMA == 'catalog':
+        # Reads the catalog, so async callers run this in a thread
+        return expand_catalog_plan_text(text, targets)
+    try:
+        compact = CompactPlanSchema.model_validate_json(text or '')
+    except ValidationError:
+        return text
+    return json.dumps(expand_compact_plan(compact.model_dump()))
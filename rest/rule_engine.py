@@ -0,0 +1,391 @@
+# rest/rule_engine.py
+"""
+A deterministic, rule-based plan generator.
+
+Energy targets come from the Mifflin-St Jeor equation and the profile's
+activity level and goal; the days are filled from fixed tables of Ghanaian
+meals and bodyweight exercises, filtered by allergies, dislikes and dietary
+preferences. Each day's portions are fitted to all four targets with the
+macro-balancing solver (rest/macro_balance.py), which keeps the calories on
+target. The table meals can't always reach the protein of a high-protein goal,
+so a day's macro targets are what its fitted meals provide. No model is
+involved: a plan takes a millisecond or two, and well under one once the
+fitted days for its targets are cached.
+It serves simple profiles directly and is the fallback when the AI backends
+fail or are too slow (see rest/ai_router.py).
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+from .macro_balance import MAX_SCALE, MEAL_FIELDS, MIN_SCALE, SCALE_STEP, TARGET_FIELDS, balance_plan
+
+RULE_ENGINE_VERSION = 'rules-v2'
+
+# Mifflin-St Jeor: 10 * kg + 6.25 * cm - 5 * age + s
+GENDER_CONSTANTS = {'male': 5, 'female': -161}
+ACTIVITY_FACTORS = {
+    'sedentary': 1.2,
+    'lightly_active': 1.375,
+    'moderately_active': 1.55,
+    'very_active': 1.725,
+    'athlete': 1.9,
+}
+# Used for whatever a profile leaves out
+DEFAULT_WEIGHT, DEFAULT_HEIGHT, DEFAULT_AGE, DEFAULT_ACTIVITY = 70, 170, 30, 'lightly_active'
+MIN_CALORIES = {'male': 1500, 'female': 1200}
+
+# goal: (calorie change, protein g per kg, share of calories from fat)
+GOAL_RULES = {
+    'weight_loss': (-500, 2.0, 0.25),
+    'maintenance': (0, 1.6, 0.30),
+    'muscle_gain': (300, 2.0, 0.25),
+    'endurance': (200, 1.4, 0.25),
+}
+WATER_ML_PER_KG = 35
+
+MealOption = namedtuple('MealOption', 'description portion calories protein carbs fats tags')
+ExerciseOption = namedtuple('ExerciseOption', 'name category reps notes high_impact')
+
+# Per-portion values. Tags name allergens and food groups for filtering.
+MEAL_OPTIONS = {
+    'breakfast': [
+        MealOption('Hausa koko with koose', '1 cup with 3 koose', 350, 11, 52, 11, frozenset({'millet', 'beans'})),
+        MealOption('Tom brown porridge with milk and groundnuts', '1 bowl', 320, 12, 50, 8, frozenset({'groundnut', 'dairy'})),
+        MealOption('Oats with banana and milk', '1 bowl', 330, 12, 55, 7, frozenset({'oats', 'dairy'})),
+        MealOption('Boiled eggs with wholewheat bread', '2 eggs and 2 slices', 300, 16, 28, 12, frozenset({'egg', 'gluten'})),
+        MealOption('Fried plantain with egg stew', '1 plate', 380, 14, 45, 16, frozenset({'egg', 'plantain'})),
+        MealOption('Ablemamu porridge with milk', '1 bowl', 300, 9, 52, 6, frozenset({'corn', 'dairy'})),
+        MealOption('Boiled sweet potato with garden egg stew', '1 plate', 310, 6, 55, 8, frozenset({'sweet potato', 'garden egg'})),
+    ],
+    'lunch': [
+        MealOption('Waakye with boiled egg and fish', '1 medium plate', 620, 30, 85, 17, frozenset({'beans', 'egg', 'fish'})),
+        MealOption('Jollof rice with grilled chicken', '1 plate', 600, 35, 75, 17, frozenset({'meat'})),
+        MealOption('Red red with ripe plantain', '1 plate', 550, 18, 80, 18, frozenset({'beans', 'plantain'})),
+        MealOption('Banku with grilled tilapia and pepper', '1 ball and 1 fish', 580, 38, 70, 15, frozenset({'corn', 'fish'})),
+        MealOption('Kenkey with fried fish and shito', '1 ball', 560, 30, 80, 14, frozenset({'corn', 'fish', 'shellfish'})),
+        MealOption('Omo tuo with groundnut soup and chicken', '2 balls', 640, 34, 75, 22, frozenset({'groundnut', 'meat'})),
+        MealOption('Yam with kontomire stew and egg', '1 plate', 520, 18, 72, 17, frozenset({'yam', 'egg'})),
+        MealOption('Brown rice with vegetable stew and beans', '1 plate', 500, 17, 85, 10, frozenset({'beans'})),
+    ],
+    'dinner': [
+        MealOption('Fufu with light soup and goat meat', '1 medium bowl', 600, 32, 80, 15, frozenset({'cassava', 'meat'})),
+        MealOption('Tuo zaafi with ayoyo soup and fish', '1 bowl', 520, 26, 78, 11, frozenset({'millet', 'fish'})),
+        MealOption('Boiled plantain with garden egg stew and mackerel', '1 plate', 480, 24, 62, 15, frozenset({'plantain', 'fish'})),
+        MealOption('Kokonte with groundnut soup and fish', '1 bowl', 560, 28, 72, 18, frozenset({'cassava', 'groundnut', 'fish'})),
+        MealOption('Banku with okro stew and crab', '1 ball', 540, 30, 70, 15, frozenset({'corn', 'fish', 'shellfish'})),
+        MealOption('Boiled yam with garden egg stew and beans', '1 plate', 470, 16, 80, 9, frozenset({'yam', 'beans'})),
+        MealOption('Grilled chicken with boiled plantain and vegetables', '1 plate', 480, 38, 50, 13, frozenset({'meat', 'plantain'})),
+    ],
+    'snack': [
+        MealOption('Roasted groundnuts', '1 handful (30 g)', 170, 7, 5, 14, frozenset({'groundnut'})),
+        MealOption('Pawpaw slices', '1 cup', 60, 1, 15, 0, frozenset({'fruit'})),
+        MealOption('Pineapple and orange', '1 cup', 80, 1, 20, 0, frozenset({'fruit'})),
+        MealOption('Kelewele', '1 small bowl', 220, 2, 35, 9, frozenset({'plantain'})),
+        MealOption('Boiled corn with coconut', '1 cob and 2 pieces', 210, 5, 32, 8, frozenset({'corn', 'coconut'})),
+        MealOption('Plain yoghurt', '1 cup', 150, 8, 20, 4, frozenset({'dairy'})),
+        MealOption('Roasted plantain with groundnuts', '1 finger and 1 handful', 260, 5, 45, 8, frozenset({'plantain', 'groundnut'})),
+    ],
+}
+# Share of the day's calories per meal
+MEAL_SHARES = {'breakfast': 0.25, 'lunch': 0.35, 'dinner': 0.30, 'snack': 0.10}
+# Largest relative error of a day's calories against the energy target
+CALORIE_TOLERANCE = 0.02
+
+# What a profile may write for an allergy or dislike -> the tag it excludes
+TAG_ALIASES = {
+    'peanut': 'groundnut', 'peanuts': 'groundnut', 'groundnuts': 'groundnut', 'nut': 'groundnut', 'nuts': 'groundnut',
+    'eggs': 'egg', 'milk': 'dairy', 'lactose': 'dairy', 'seafood': 'fish', 'shrimp': 'shellfish',
+    'crab': 'shellfish', 'prawns': 'shellfish', 'wheat': 'gluten', 'bread': 'gluten', 'chicken': 'meat',
+    'goat': 'meat', 'bean': 'beans', 'yams': 'yam',
+}
+DIET_EXCLUSIONS = {
+    'vegetarian': {'meat', 'fish', 'shellfish'},
+    'vegan': {'meat', 'fish', 'shellfish', 'egg', 'dairy'},
+    'pescatarian': {'meat'},
+}
+
+EXERCISE_OPTIONS = {
+    'upper': [
+        ExerciseOption('Push-ups', 'upper', None, 'Keep your body in a straight line', False),
+        ExerciseOption('Incline push-ups on a bench', 'upper', None, 'Easier than floor push-ups', False),
+        ExerciseOption('Chair tricep dips', 'upper', None, 'Use a sturdy chair', False),
+        ExerciseOption('Pike push-ups', 'upper', None, 'Targets the shoulders', False),
+    ],
+    'lower': [
+        ExerciseOption('Squats', 'lower', None, 'Keep your heels on the ground', False),
+        ExerciseOption('Glute bridges', 'lower', None, 'Squeeze at the top', False),
+        ExerciseOption('Reverse lunges', 'lower', None, 'Alternate legs', False),
+        ExerciseOption('Step-ups on a stair', 'lower', None, 'Drive through the front heel', False),
+        ExerciseOption('Wall sit', 'lower', '30-45 seconds', 'Thighs parallel to the floor', False),
+        ExerciseOption('Jump squats', 'lower', None, 'Land softly', True),
+    ],
+    'core': [
+        ExerciseOption('Plank', 'core', '30-60 seconds', 'Hold the position steadily', False),
+        ExerciseOption('Dead bug', 'core', None, 'Keep your lower back on the floor', False),
+        ExerciseOption('Bicycle crunches', 'core', None, 'Slow and controlled', False),
+        ExerciseOption('Side plank', 'core', '20-30 seconds each side', None, False),
+        ExerciseOption('Mountain climbers', 'core', '30 seconds', 'Keep your hips level', True),
+    ],
+    'cardio': [
+        ExerciseOption('Brisk walking', 'cardio', '20-30 minutes', 'Early morning or evening when it is cooler', False),
+        ExerciseOption('Stair climbing', 'cardio', '5-10 minutes', None, False),
+        ExerciseOption('Jumping jacks', 'cardio', '45 seconds', None, True),
+        ExerciseOption('High knees', 'cardio', '30 seconds', None, True),
+        ExerciseOption('Ampe (jumping game)', 'cardio', '2-3 minutes', 'A fun Ghanaian playground game', True),
+        ExerciseOption('Skipping rope', 'cardio', '1 minute', None, True),
+    ],
+}
+
+# Session type: (title, description, exercise categories)
+SESSIONS = {
+    'full': ('Full Body Circuit', 'Bodyweight circuit for the whole body', ('upper', 'lower', 'core', 'cardio')),
+    'upper': ('Upper Body Strength', 'Push and arm exercises with core work', ('upper', 'upper', 'upper', 'core')),
+    'lower': ('Lower Body Strength', 'Leg and hip exercises with core work', ('lower', 'lower', 'lower', 'core')),
+    'cardio': ('Cardio & Core', 'Conditioning and core stability', ('cardio', 'cardio', 'core', 'core')),
+}
+GOAL_SESSIONS = {
+    'weight_loss': ('full', 'cardio', 'full', 'cardio', 'full', 'cardio'),
+    'maintenance': ('full', 'cardio', 'upper', 'lower', 'full', 'cardio'),
+    'muscle_gain': ('upper', 'lower', 'full', 'upper', 'lower', 'full'),
+    'endurance': ('cardio', 'full', 'cardio', 'full', 'cardio', 'lower'),
+}
+# goal: (sets, reps, rest seconds) for exercises without a fixed duration
+GOAL_PRESCRIPTIONS = {
+    'weight_loss': (3, '12-15', 45),
+    'maintenance': (3, '10-12', 60),
+    'muscle_gain': (4, '8-12', 90),
+    'endurance': (3, '15-20', 30),
+}
+TRAINING_DAYS = {
+    'sedentary': (1, 3, 5),
+    'lightly_active': (1, 3, 5),
+    'moderately_active': (1, 2, 4, 5),
+    'very_active': (1, 2, 3, 5, 6),
+    'athlete': (1, 2, 3, 4, 5, 6),
+}
+REST_DAY = {
+    'title': 'Rest Day',
+    'is_rest_day': True,
+    'description': 'Active recovery: light walking or stretching',
+}
+SIMPLE_DIETS = {'', 'none', 'halal', *DIET_EXCLUSIONS}
+
+
+def _split(text):
+    return [item.strip().lower() for item in (text or '').split(',') if item.strip()]
+
+
+def energy_targets(profile):
+    """
+    Daily energy and macro targets for a profile: BMR (Mifflin-St Jeor),
+    TDEE from the activity level, and calories and macros adjusted for the goal.
+    """
+    weight = profile.current_weight or DEFAULT_WEIGHT
+    height = profile.height or DEFAULT_HEIGHT
+    age = profile.age or DEFAULT_AGE
+    # Halfway between the two constants when the gender isn't known
+    constant = GENDER_CONSTANTS.get(profile.gender, -78)
+    bmr = 10 * weight + 6.25 * height - 5 * age + constant
+    tdee = bmr * ACTIVITY_FACTORS.get(profile.activity_level or DEFAULT_ACTIVITY, ACTIVITY_FACTORS[DEFAULT_ACTIVITY])
+
+    change, protein_per_kg, fat_share = GOAL_RULES.get(profile.goal, GOAL_RULES['maintenance'])
+    if change < 0:
+        # Never more than a 20% deficit
+        change = max(change, -0.2 * tdee)
+    calories = max(tdee + change, MIN_CALORIES.get(profile.gender, 1200))
+
+    protein = protein_per_kg * weight
+    fats = fat_share * calories / 9
+    carbs = max(0, (calories - protein * 4 - fats * 9) / 4)
+    return {
+        'bmr': round(bmr),
+        'tdee': round(tdee),
+        'calories': round(calories),
+        'protein_grams': round(protein),
+        'carbs_grams': round(carbs),
+        'fats_grams': round(fats),
+        'water_litres': round(weight * WATER_ML_PER_KG / 1000, 1),
+    }
+
+
+def excluded_tags(profile):
+    """The meal tags and words a profile rules out, as (allergy tags, disliked tags)."""
+    allergies = {TAG_ALIASES.get(item, item) for item in _split(profile.allergies)}
+    for diet in _split(profile.dietary_preferences):
+        allergies |= DIET_EXCLUSIONS.get(diet, set())
+    dislikes = {TAG_ALIASES.get(item, item) for item in _split(profile.disliked_foods)}
+    return allergies, dislikes
+
+
+def _allowed(option, excluded):
+    if option.tags & excluded:
+        return False
+    description = option.description.lower()
+    return not any(term in description for term in excluded)
+
+
+def meal_options(profile):
+    """
+    The meals a profile can have, by meal type. Allergies and dietary
+    preferences always exclude a meal; dislikes only while something else is left.
+    """
+    allergies, dislikes = excluded_tags(profile)
+    options = {}
+    for meal_type, meals in MEAL_OPTIONS.items():
+        safe = [meal for meal in meals if _allowed(meal, allergies)]
+        options[meal_type] = [meal for meal in safe if _allowed(meal, dislikes)] or safe
+    return options
+
+
+def is_simple_profile(profile):
+    """
+    Whether a rule-based plan serves the profile as well as a generated one:
+    everything the energy equations need is filled in and nothing calls for
+    judgement (medical conditions, disabilities, favourite foods, unusual diets).
+    """
+    return bool(
+        profile.current_weight and profile.height and profile.age and profile.gender
+        and profile.goal in GOAL_RULES and profile.activity_level in ACTIVITY_FACTORS
+        and not (profile.medical_conditions or '').strip()
+        and not (profile.disabilities or '').strip()
+        and not (profile.liked_foods or '').strip()
+        and all(diet in SIMPLE_DIETS for diet in _split(profile.dietary_preferences))
+    )
+
+
+def _portion_scales(meals, calories):
+    """
+    The portion scale of each (meal_type, option) so the day reaches `calories`:
+    each meal gets its share of them (MEAL_SHARES, over the meal types the day
+    has), and what a meal can't take within [MIN_SCALE, MAX_SCALE] is shared
+    out between the others.
+    """
+    scales = [None] * len(meals)
+    while True:
+        free = [i for i, scale in enumerate(scales) if scale is None]
+        if not free:
+            break
+        remaining = calories - sum(meals[i][1].calories * scale for i, scale in enumerate(scales) if scale is not None)
+        shares = sum(MEAL_SHARES[meals[i][0]] for i in free)
+        wanted = {i: remaining * MEAL_SHARES[meals[i][0]] / shares / meals[i][1].calories for i in free}
+        clipped = {i: min(MAX_SCALE, max(MIN_SCALE, scale)) for i, scale in wanted.items()
+                   if not MIN_SCALE <= scale <= MAX_SCALE}
+        if not clipped:
+            for i, scale in wanted.items():
+                scales[i] = scale
+            break
+        for i, scale in clipped.items():
+            scales[i] = scale
+    return [round(round(scale / SCALE_STEP) * SCALE_STEP, 2) for scale in scales]
+
+
+@lru_cache(maxsize=4096)
+def _scaled_meal(meal_type, option, scale):
+    return {
+        'meal_type': meal_type,
+        'description': option.description,
+        'calories': round(option.calories * scale),
+        'protein_grams': round(option.protein * scale, 1),
+        'carbs_grams': round(option.carbs * scale, 1),
+        'fats_grams': round(option.fats * scale, 1),
+        'portion_size': option.portion,
+        'portion_scale': scale,
+    }
+
+
+@lru_cache(maxsize=1024)
+def _nutrition_days(options, targets):
+    """
+    The week's nutrition days for `options` ((meal_type, choices) pairs) and
+    `targets` (calories, protein, carbs, fats), without water and notes. Days
+    whose meals can't reach the calories at MAX_SCALE get extra snacks. Many
+    profiles share both, so the fitted days are reused.
+    """
+    calories = targets[0]
+    days = []
+    snacks = dict(options).get('snack', ())
+    for day in range(1, 8):
+        meals = [(meal_type, choices[day % len(choices)]) for meal_type, choices in options]
+        # Add snacks while even the largest portions stay short of the calories
+        for extra in range(1, len(snacks)):
+            if sum(option.calories for _, option in meals) * MAX_SCALE >= calories:
+                break
+            meals.append(('snack', snacks[(day + extra) % len(snacks)]))
+        days.append({
+            'day_of_week': day,
+            **dict(zip(TARGET_FIELDS, targets)),
+            'meals': [
+                _scaled_meal(meal_type, option, scale)
+                for (meal_type, option), scale in zip(meals, _portion_scales(meals, calories))
+            ],
+        })
+    balanced, _ = balance_plan({'nutrition_days': days}, CALORIE_TOLERANCE)
+
+    fitted = []
+    for day in balanced['nutrition_days']:
+        totals = {field: sum(meal[field] for meal in day['meals']) for field in MEAL_FIELDS}
+        if abs(totals['calories'] - calories) > CALORIE_TOLERANCE * calories:
+            print(f"Rule plan day {day['day_of_week']} has {totals['calories']} kcal for a {calories} kcal target")
+        # The calories stay the energy target; the macros are what the meals provide
+        fitted.append({
+            **day,
+            **{target: round(totals[field]) for field, target in zip(MEAL_FIELDS[1:], TARGET_FIELDS[1:])},
+        })
+    return tuple(fitted)
+
+
+def _workout_day(day, session, index, goal, low_impact):
+    title, description, categories = SESSIONS[session]
+    sets, reps, rest = GOAL_PRESCRIPTIONS.get(goal, GOAL_PRESCRIPTIONS['maintenance'])
+    exercises = []
+    used = set()
+    for offset, category in enumerate(categories):
+        choices = [e for e in EXERCISE_OPTIONS[category] if not (low_impact and e.high_impact) and e.name not in used]
+        if not choices:
+            continue
+        exercise = choices[(index + offset) % len(choices)]
+        used.add(exercise.name)
+        exercises.append({
+            'name': exercise.name,
+            # Continuous cardio such as walking is done once
+            'sets': 1 if 'minutes' in (exercise.reps or '') else sets,
+            'reps': exercise.reps or reps,
+            'rest_period_seconds': rest,
+            'notes': exercise.notes,
+        })
+    return {'day_of_week': day, 'title': title, 'is_rest_day': False, 'description': description, 'exercises': exercises}
+
+
+def generate_rule_plan(profile):
+    """Returns a 7-day plan for `profile` shaped like GeneratedPlanSchema."""
+    targets = energy_targets(profile)
+    options = meal_options(profile)
+    goal = profile.goal if profile.goal in GOAL_SESSIONS else 'maintenance'
+    training_days = TRAINING_DAYS.get(profile.activity_level, TRAINING_DAYS[DEFAULT_ACTIVITY])
+    sessions = GOAL_SESSIONS[goal]
+    low_impact = bool((profile.disabilities or '').strip()) or (profile.current_weight or 0) >= 110
+    notes = f"Aim for {targets['water_litres']} L of water through the day."
+
+    workout_days = []
+    for day in range(1, 8):
+        if day in training_days:
+            index = training_days.index(day)
+            workout_days.append(_workout_day(day, sessions[index], index, goal, low_impact))
+        else:
+            workout_days.append({'day_of_week': day, **REST_DAY, 'exercises': []})
+
+    fitted_days = _nutrition_days(
+        tuple((meal_type, tuple(choices)) for meal_type, choices in options.items() if choices),
+        (targets['calories'], targets['protein_grams'], targets['carbs_grams'], targets['fats_grams']),
+    )
+    nutrition_days = [
+        {
+            'day_of_week': day['day_of_week'],
+            **{field: day[field] for field in TARGET_FIELDS},
+            'target_water_litres': targets['water_litres'],
+            'notes': notes,
+            'meals': [dict(meal) for meal in day['meals']],
+        }
+        for day in fitted_days
+    ]
+    return {'workout_days': workout_days, 'nutrition_days': nutrition_days}
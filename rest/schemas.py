@@ -1,7 +1,7 @@
 # rest/schemas.py
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import date
 
 # --- Schemas for AI Generation ---
@@ -43,6 +43,89 @@ class GeneratedPlanSchema(BaseModel):
     workout_days: List[WorkoutDaySchema]
     nutrition_days: List[NutritionDaySchema]
 
+# --- Schemas for per-day (fan-out) generation ---
+
+class DaySkeletonSchema(BaseModel):
+    day_of_week: int = Field(..., ge=1, le=7, description="1 for Monday, 7 for Sunday.")
+    title: str = Field(..., description="e.g., 'Upper Body Strength' or 'Rest Day'")
+    is_rest_day: bool = False
+    focus: str = Field(..., description="What the day's workout and meals should focus on.")
+    target_calories: int
+    target_protein_grams: int
+    target_carbs_grams: int
+    target_fats_grams: int
+    target_water_litres: float = Field(..., description="Recommended water intake in liters.")
+
+class WeekSkeletonSchema(BaseModel):
+    days: List[DaySkeletonSchema]
+
+class DayPlanSchema(BaseModel):
+    workout_day: WorkoutDaySchema
+    nutrition_day: NutritionDaySchema
+
+# --- Compact wire schema for plan output (see rest/plan_wire.py) ---
+# Same content as GeneratedPlanSchema with short keys, one-letter meal type
+# codes and rest days reduced to their day number, so models emit fewer tokens.
+
+class CompactExerciseSchema(BaseModel):
+    n: str = Field(..., description="Exercise name.")
+    s: int = Field(..., description="Sets.")
+    r: str = Field(..., description="Reps, e.g. '10-12'.")
+    rp: int = Field(..., description="Rest period between sets in seconds.")
+    no: Optional[str] = Field(None, description="Notes.")
+
+class CompactWorkoutDaySchema(BaseModel):
+    d: int = Field(..., ge=1, le=7, description="Day of week, 1 for Monday, 7 for Sunday.")
+    rd: bool = Field(False, description="Rest day. A rest day needs only d and rd.")
+    t: Optional[str] = Field(None, description="Title, e.g. 'Upper Body Strength'. Omit on rest days.")
+    ds: Optional[str] = Field(None, description="Description of the day's workout.")
+    ex: List[CompactExerciseSchema] = Field([], description="Exercises. Omit on rest days.")
+
+class CompactMealSchema(BaseModel):
+    m: Literal['b', 'l', 'd', 's'] = Field(..., description="Meal type: b breakfast, l lunch, d dinner, s snack.")
+    ds: str = Field(..., description="Meal, e.g. 'Waakye with boiled egg and fish'.")
+    c: int = Field(..., description="Calories.")
+    p: float = Field(..., description="Protein in grams.")
+    cb: float = Field(..., description="Carbs in grams.")
+    f: float = Field(..., description="Fats in grams.")
+    ps: Optional[str] = Field(None, description="Portion size, e.g. '1 medium ladle'.")
+
+class CompactNutritionDaySchema(BaseModel):
+    d: int = Field(..., ge=1, le=7, description="Day of week, 1 for Monday, 7 for Sunday.")
+    c: Optional[int] = Field(None, description="Target calories.")
+    p: Optional[int] = Field(None, description="Target protein in grams.")
+    cb: Optional[int] = Field(None, description="Target carbs in grams.")
+    f: Optional[int] = Field(None, description="Target fats in grams.")
+    w: Optional[float] = Field(None, description="Target water in litres.")
+    no: Optional[str] = Field(None, description="Advice for the day.")
+    ml: List[CompactMealSchema] = Field(..., description="Meals.")
+
+class CompactPlanSchema(BaseModel):
+    w: List[CompactWorkoutDaySchema] = Field(..., description="Workout days.")
+    n: List[CompactNutritionDaySchema] = Field(..., description="Nutrition days.")
+
+# --- Catalog schema for plan output (see rest/food_catalog.py) ---
+# Meals are picked from the food catalog by ID; the server fills in the
+# descriptions, macros and day totals from the catalog.
+
+class CatalogFoodSchema(BaseModel):
+    id: int = Field(..., description="Food ID from the catalog.")
+    portions: float = Field(1, ge=0.25, le=4, description="Number of catalog portions, in steps of 0.25.")
+
+class CatalogMealSchema(BaseModel):
+    meal_type: Literal['breakfast', 'lunch', 'dinner', 'snack']
+    foods: List[CatalogFoodSchema]
+
+class CatalogNutritionDaySchema(BaseModel):
+    day_of_week: int = Field(..., ge=1, le=7, description="1 for Monday, 7 for Sunday.")
+    target_water_litres: Optional[float] = Field(None, description="Recommended water intake in liters.")
+    notes: Optional[str] = Field(None, description="General advice for the day.")
+    meals: List[CatalogMealSchema]
+
+class CatalogPlanSchema(BaseModel):
+    workout_days: List[WorkoutDaySchema]
+    nutrition_days: List[CatalogNutritionDaySchema]
+
 # --- Schemas for API Input/Output (Validation & Serialization) ---
 
 # --- User and Profile Schemas ---
@@ -11,7 +11,7 @@ from .models import (
     Meal, NutritionDay,
     Profile, WorkoutDay,
     WorkoutTracking, MealTracking,
-    WaterTracking,
+    WaterTracking, GenerationJob,
 )
 
 User = get_user_model()
@@ -218,4 +218,8 @@ class WaterTrackingSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-    
\ No newline at end of file
+class GenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationJob
+        fields = ['id', 'status', 'start_date', 'plan', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
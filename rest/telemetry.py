@@ -0,0 +1,219 @@
+# rest/telemetry.py
+import contextvars
+import time
+from collections import defaultdict
+from contextlib import contextmanager, asynccontextmanager
+from datetime import timedelta
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import GenerationTelemetry
+
+# The generation the current code is running on behalf of. Context variables
+# follow asyncio tasks by themselves; the local scheduler and the fan-out pool
+# copy the context into their threads so usage recorded there lands here too.
+_current = contextvars.ContextVar('generation_metrics', default=None)
+
+
+class GenerationMetrics:
+    """Counters for one generation attempt, filled in by the code that calls a model."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.model_version = ''
+        self.prompt_tokens = None
+        self.output_tokens = None
+        self.time_to_first_token = None
+        self.retries = 0
+        self.parse_failures = 0
+        self.used_fallback = backend == 'fallback'
+        self.started = time.perf_counter()
+        self._lock = Lock()
+
+    def add_usage(self, prompt_tokens=None, output_tokens=None, time_to_first_token=None):
+        with self._lock:
+            if prompt_tokens is not None:
+                self.prompt_tokens = (self.prompt_tokens or 0) + prompt_tokens
+            if output_tokens is not None:
+                self.output_tokens = (self.output_tokens or 0) + output_tokens
+            # The first token of the whole generation, not of every request it made
+            if time_to_first_token is not None and self.time_to_first_token is None:
+                self.time_to_first_token = time_to_first_token
+
+    def first_token(self):
+        """Marks now as the time the first token arrived, if none has yet."""
+        self.add_usage(time_to_first_token=time.perf_counter() - self.started)
+
+    def count(self, retries=0, parse_failures=0):
+        with self._lock:
+            self.retries += retries
+            self.parse_failures += parse_failures
+
+    def row(self, error=None):
+        return GenerationTelemetry(
+            backend=self.backend,
+            model_version=(self.model_version or '')[:100],
+            prompt_tokens=self.prompt_tokens,
+            output_tokens=self.output_tokens,
+            time_to_first_token_seconds=self.time_to_first_token,
+            latency_seconds=time.perf_counter() - self.started,
+            retries=self.retries,
+            parse_failures=self.parse_failures,
+            used_fallback=self.used_fallback or self.model_version == 'fallback',
+            succeeded=error is None,
+            error=error,
+        )
+
+
+def current_metrics():
+    """The metrics of the generation in progress, or None outside of one."""
+    return _current.get()
+
+
+def add_usage(prompt_tokens=None, output_tokens=None, time_to_first_token=None):
+    """Adds token counts (and the first token time) of one model request to the current generation."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_usage(prompt_tokens, output_tokens, time_to_first_token)
+
+
+def count(retries=0, parse_failures=0):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.count(retries, parse_failures)
+
+
+def first_token():
+    """Marks the first token of the current generation as having arrived now."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.first_token()
+
+
+@contextmanager
+def collect_usage():
+    """Collects usage recorded inside the block into a GenerationMetrics without saving it."""
+    metrics = GenerationMetrics('')
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def _save(row):
+    try:
+        row.save()
+    except Exception as e:
+        print(f"Error saving generation telemetry: {e}")
+
+
+@contextmanager
+def track_generation(backend):
+    """
+    Records one GenerationTelemetry row for the generation attempt run inside
+    the block. Set `model_version` on the yielded metrics once it is known.
+    """
+    metrics = GenerationMetrics(backend)
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    except Exception as e:
+        _save(metrics.row(error=str(e) or type(e).__name__))
+        raise
+    finally:
+        _current.reset(token)
+    _save(metrics.row())
+
+
+class TrackedStream:
+    """
+    Telemetry for a streamed generation. The response is iterated chunk by
+    chunk, possibly from different threads, so instead of a `with` block the
+    stream is opened and iterated inside one context that holds the metrics.
+    """
+    _END = object()
+
+    def __init__(self, backend):
+        self.metrics = GenerationMetrics(backend)
+        self.context = contextvars.copy_context()
+        self.context.run(_current.set, self.metrics)
+
+    def run(self, fn, *args, **kwargs):
+        return self.context.run(fn, *args, **kwargs)
+
+    def iterate(self, chunks):
+        iterator = self.run(iter, chunks)
+        while True:
+            chunk = self.run(next, iterator, self._END)
+            if chunk is self._END:
+                return
+            self.metrics.first_token()
+            yield chunk
+
+    def finish(self, model_version='', error=None):
+        self.metrics.model_version = model_version
+        _save(self.metrics.row(error=error))
+
+
+@asynccontextmanager
+async def atrack_generation(backend):
+    """Async version of track_generation."""
+    metrics = GenerationMetrics(backend)
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    except Exception as e:
+        await sync_to_async(_save)(metrics.row(error=str(e) or type(e).__name__))
+        raise
+    finally:
+        _current.reset(token)
+    await sync_to_async(_save)(metrics.row())
+
+
+def _percentiles(values):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None}
+    return {
+        f'p{pct}': round(values[min(len(values) - 1, int(len(values) * pct / 100))], 3)
+        for pct in (50, 95, 99)
+    }
+
+
+def telemetry_summary(days=7):
+    """
+    Latency, time to first token and tokens per generation for the last
+    `days` days, grouped by day and backend.
+    """
+    since = timezone.now() - timedelta(days=days)
+    rows = GenerationTelemetry.objects.filter(created_at__gte=since).values_list(
+        'created_at', 'backend', 'latency_seconds', 'time_to_first_token_seconds',
+        'prompt_tokens', 'output_tokens', 'retries', 'parse_failures', 'used_fallback', 'succeeded',
+    )
+
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(timezone.localdate(row[0]), row[1])].append(row)
+
+    summary = []
+    for (day, backend), group in sorted(groups.items(), reverse=True):
+        summary.append({
+            'date': day,
+            'backend': backend,
+            'generations': len(group),
+            'failed': sum(1 for row in group if not row[9]),
+            'fallbacks': sum(1 for row in group if row[8]),
+            'retries': sum(row[6] for row in group),
+            'parse_failures': sum(row[7] for row in group),
+            'latency_seconds': _percentiles(row[2] for row in group),
+            'time_to_first_token_seconds': _percentiles(row[3] for row in group),
+            'prompt_tokens': _percentiles(row[4] for row in group),
+            'output_tokens': _percentiles(row[5] for row in group),
+            'total_tokens': _percentiles(
+                (row[4] or 0) + (row[5] or 0) if row[4] is not None or row[5] is not None else None for row in group
+            ),
+        })
+    return summary
@@ -1,3 +1,349 @@
-from django.test import TestCase
+import json
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .ai_router import BACKENDS, BackendRouter
+from .jobs import active_jobs, claim_job, enqueue_generation_job, fail_stale_jobs, run_generation_job
+from .models import FitnessPlan, GenerationJob, Meal, NutritionDay, Profile
+from .plan_adapt import ADAPT_TOLERANCE, adapt_plan
+from .plan_persistence import save_generated_plan
+from .plan_recovery import PlanRecoveryError, load_plan_text
+from .plan_wire import compact_plan, expand_compact_plan
+from .macro_balance import MAX_SCALE, MEAL_FIELDS, MIN_SCALE, TARGET_FIELDS, balance_plan
+from .rule_engine import CALORIE_TOLERANCE, energy_targets, generate_rule_plan
+from .schemas import GeneratedPlanSchema
+
+
+def make_profile(**fields):
+    """An unsaved profile with complete details, overridden by `fields`."""
+    values = dict(age=30, gender='male', current_weight=80, height=180,
+                  goal='weight_loss', activity_level='moderately_active')
+    values.update(fields)
+    return Profile(**values)
+
+
+class PlanWireTests(SimpleTestCase):
+    def test_compact_round_trip(self):
+        plan = GeneratedPlanSchema.model_validate(generate_rule_plan(make_profile())).model_dump()
+        self.assertEqual(expand_compact_plan(compact_plan(plan)), plan)
+
+    def test_rest_day_round_trip(self):
+        plan = GeneratedPlanSchema.model_validate(generate_rule_plan(make_profile(goal='muscle_gain'))).model_dump()
+        self.assertTrue(any(day['is_rest_day'] for day in plan['workout_days']))
+        self.assertEqual(expand_compact_plan(compact_plan(plan)), plan)
+
+    def test_unknown_meal_type_is_rejected(self):
+        plan = GeneratedPlanSchema.model_validate(generate_rule_plan(make_profile())).model_dump()
+        plan['nutrition_days'][0]['meals'][0]['meal_type'] = 'pre-workout'
+        with self.assertRaises(ValueError):
+            compact_plan(plan)
+
+
+def create_profile(username='runner', **fields):
+    """A saved user and profile with complete details."""
+    user = User.objects.create_user(username, f'{username}@example.com', 'password')
+    profile = make_profile(**fields)
+    profile.user = user
+    profile.save()
+    return profile
+
+
+@override_settings(PLAN_JOB_BACKEND='worker', PLAN_JOB_TIMEOUT_SECONDS=900)
+class GenerationJobTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile()
+
+    def client_for(self, profile):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=profile.user)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.key}')
+        return client
+
+    def test_job_is_claimed_once(self):
+        job = enqueue_generation_job(self.profile, date.today())
+        self.assertTrue(claim_job(job.pk))
+        self.assertFalse(claim_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_RUNNING)
+        self.assertIsNotNone(job.started_at)
+
+    @override_settings(PLAN_JOB_BACKEND='thread')
+    def test_thread_backend_submits_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            enqueue_generation_job(self.profile, date.today())
+        self.assertEqual(len(callbacks), 1)
+
+    def test_stale_running_jobs_are_not_active(self):
+        pending = enqueue_generation_job(self.profile, date.today())
+        running = GenerationJob.objects.create(profile=self.profile, start_date=date.today(),
+                                               status=GenerationJob.STATUS_RUNNING, started_at=timezone.now())
+        stale = GenerationJob.objects.create(profile=self.profile, start_date=date.today(),
+                                             status=GenerationJob.STATUS_RUNNING,
+                                             started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(set(active_jobs()), {pending, running})
+
+        self.assertEqual(fail_stale_jobs(), 1)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, GenerationJob.STATUS_FAILED)
+        self.assertIsNotNone(stale.finished_at)
+
+    def test_run_records_the_outcome(self):
+        job = enqueue_generation_job(self.profile, date.today())
+        with mock.patch('rest.jobs.generate_and_save_plan_for_user', return_value=None):
+            run_generation_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_FAILED)
+        self.assertTrue(job.error)
+
+    def test_second_request_for_the_same_date_is_rejected(self):
+        client = self.client_for(self.profile)
+        start_date = date.today().isoformat()
+        first = client.post('/api/users/me/plans/', {'start_date': start_date}, format='json')
+        second = client.post('/api/users/me/plans/', {'start_date': start_date}, format='json')
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 400)
+        self.assertEqual(GenerationJob.objects.filter(profile=self.profile).count(), 1)
+
+    def test_stale_job_does_not_block_a_new_request(self):
+        GenerationJob.objects.create(profile=self.profile, start_date=date.today(),
+                                     status=GenerationJob.STATUS_RUNNING,
+                                     started_at=timezone.now() - timedelta(hours=1))
+        client = self.client_for(self.profile)
+        response = client.post('/api/users/me/plans/', {'start_date': date.today().isoformat()}, format='json')
+        self.assertEqual(response.status_code, 202)
+
+
+def backend(result=None, delay=0, error=None):
+    """A router backend that answers `result` after `delay` seconds, or raises `error`."""
+    def generate(user_profile, start_date):
+        time.sleep(delay)
+        if error:
+            raise error
+        return '', result, result
+    return generate
+
+
+class BackendRouterTests(TransactionTestCase):
+    def route(self, primary, secondary, fallback=backend('fallback'), deadline=1.0, hedge=0.1):
+        with mock.patch.dict(BACKENDS, {'primary': primary, 'secondary': secondary, 'fallback': fallback}):
+            router = BackendRouter('primary', 'secondary', 'fallback', deadline_seconds=deadline,
+                                   hedge_percentile=95, hedge_min_samples=20, default_hedge_seconds=hedge)
+            backend_name, _, plan_data, _ = router.generate(make_profile(), date.today())
+        return backend_name, plan_data, router.stats()['decisions']
+
+    def test_primary_answers(self):
+        self.assertEqual(self.route(backend('primary'), backend('secondary'))[:2], ('primary', 'primary'))
+
+    def test_failed_primary_hedges_straight_away(self):
+        started = time.monotonic()
+        name, _, decisions = self.route(backend(error=RuntimeError('down')), backend('secondary'), hedge=5)
+        self.assertEqual(name, 'secondary')
+        self.assertEqual(decisions, {'hedge': 1})
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_slow_primary_is_hedged(self):
+        name, _, decisions = self.route(backend('primary', delay=0.5), backend('secondary'), hedge=0.05)
+        self.assertEqual(name, 'secondary')
+        self.assertEqual(decisions, {'hedge': 1})
+
+    def test_deadline_falls_back(self):
+        started = time.monotonic()
+        name, plan_data, decisions = self.route(backend('primary', delay=1), backend('secondary', delay=1),
+                                                deadline=0.2, hedge=0.05)
+        self.assertEqual((name, plan_data), ('fallback', 'fallback'))
+        self.assertEqual(decisions, {'deadline_fallback': 1})
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    def test_errors_fall_back(self):
+        name, _, decisions = self.route(backend(error=RuntimeError('down')), backend(error=RuntimeError('down')))
+        self.assertEqual(name, 'fallback')
+        self.assertEqual(decisions, {'error_fallback': 1})
+
+
+class PlanRecoveryTests(SimpleTestCase):
+    def setUp(self):
+        self.plan = GeneratedPlanSchema.model_validate(generate_rule_plan(make_profile())).model_dump()
+        self.prompts = []
+
+    def answer(self, plan):
+        """A generate_json that records its prompts and answers with `plan`."""
+        def generate_json(prompt, schema):
+            self.prompts.append(prompt)
+            return json.dumps(plan)
+        return generate_json
+
+    def test_cut_off_plan_keeps_its_complete_days(self):
+        text = json.dumps(self.plan)
+        # The continuation gets Monday wrong on purpose: days already complete must not change
+        continuation = json.loads(text)
+        continuation['workout_days'][0]['title'] = 'Changed'
+        plan_data = load_plan_text('BASE', text[:len(text) * 3 // 4], self.answer(continuation))
+        self.assertEqual(plan_data, self.plan)
+        self.assertEqual(len(self.prompts), 1)
+        self.assertIn('Continue the plan', self.prompts[0])
+
+    def test_invalid_day_is_requested_again(self):
+        broken = json.loads(json.dumps(self.plan))
+        broken['nutrition_days'][2]['meals'][0]['calories'] = 'plenty'
+        plan_data = load_plan_text('BASE', json.dumps(broken), self.answer(self.plan))
+        self.assertEqual(plan_data, self.plan)
+        self.assertIn('day_of_week = 3', self.prompts[0])
+
+    def test_nothing_valid_requests_the_whole_plan(self):
+        plan_data = load_plan_text('BASE', '{"workout_days": [', self.answer(self.plan))
+        self.assertEqual(plan_data, self.plan)
+        self.assertEqual(self.prompts, ['BASE'])
+
+    @override_settings(PLAN_RECOVERY_ATTEMPTS=2)
+    def test_gives_up_after_the_attempts(self):
+        text = json.dumps(self.plan)
+        with self.assertRaises(PlanRecoveryError):
+            load_plan_text('BASE', text[:len(text) // 2], lambda prompt, schema: text[:len(text) // 2])
+
+
+class RulePlanTests(SimpleTestCase):
+    GOALS = ('weight_loss', 'maintenance', 'muscle_gain', 'endurance')
+    ACTIVITY_LEVELS = ('sedentary', 'moderately_active', 'athlete')
+
+    def profiles(self):
+        for goal in self.GOALS:
+            for activity_level in self.ACTIVITY_LEVELS:
+                for gender, weight in (('male', 80), ('female', 60)):
+                    yield make_profile(goal=goal, activity_level=activity_level, gender=gender, current_weight=weight)
+
+    def test_meals_meet_the_day_targets(self):
+        for profile in self.profiles():
+            plan = generate_rule_plan(profile)
+            calories = energy_targets(profile)['calories']
+            for day in plan['nutrition_days']:
+                with self.subTest(goal=profile.goal, activity_level=profile.activity_level,
+                                  gender=profile.gender, day=day['day_of_week']):
+                    totals = [sum(meal[field] for meal in day['meals']) for field in MEAL_FIELDS]
+                    self.assertEqual(day['target_calories'], calories)
+                    self.assertLessEqual(abs(totals[0] - calories), CALORIE_TOLERANCE * calories + 1)
+                    for total, field in zip(totals[1:], TARGET_FIELDS[1:]):
+                        self.assertAlmostEqual(total, day[field], delta=1)
+
+    def test_portion_scales_stay_within_bounds(self):
+        for profile in self.profiles():
+            profile.dietary_preferences = 'vegan'
+            for day in generate_rule_plan(profile)['nutrition_days']:
+                for meal in day['meals']:
+                    self.assertTrue(MIN_SCALE <= meal['portion_scale'] <= MAX_SCALE, meal)
+
+
+def meal(calories, protein, carbs, fats, meal_type='lunch', **fields):
+    return dict(meal_type=meal_type, description='Meal', calories=calories, protein_grams=protein,
+                carbs_grams=carbs, fats_grams=fats, **fields)
+
+
+def nutrition_day(targets, meals, day_of_week=1):
+    return dict(zip(TARGET_FIELDS, targets), day_of_week=day_of_week, meals=meals)
+
+
+class MacroBalanceTests(SimpleTestCase):
+    MEALS = [meal(500, 40, 50, 15), meal(600, 20, 80, 20), meal(400, 10, 40, 22)]
+
+    def totals(self, day):
+        return [sum(m[field] for m in day['meals']) for field in MEAL_FIELDS]
+
+    def test_balanced_day_is_left_alone(self):
+        totals = self.totals({'meals': self.MEALS})
+        plan, report = balance_plan({'nutrition_days': [nutrition_day(totals, self.MEALS)]}, 0.05)
+        self.assertEqual([m['calories'] for m in plan['nutrition_days'][0]['meals']], [500, 600, 400])
+        self.assertTrue(report[0]['within_tolerance'])
+
+    def test_macros_are_fitted_at_the_same_calories(self):
+        targets = [1500, 95, 150, 48]
+        plan, report = balance_plan({'nutrition_days': [nutrition_day(targets, self.MEALS)]}, 0.05)
+        totals = self.totals(plan['nutrition_days'][0])
+        self.assertLess(report[0]['error_after'], report[0]['error_before'])
+        self.assertLessEqual(abs(totals[0] - targets[0]), 0.05 * targets[0])
+
+    def test_unreachable_calories_keep_the_meals(self):
+        targets = [6000, 300, 700, 200]
+        plan, report = balance_plan({'nutrition_days': [nutrition_day(targets, self.MEALS)]}, 0.05)
+        self.assertEqual(plan['nutrition_days'][0]['meals'], [{**m, 'portion_scale': 1.0} for m in self.MEALS])
+        self.assertFalse(report[0]['within_tolerance'])
+
+    def test_combined_scale_stays_within_bounds(self):
+        meals = [meal(850, 68, 85, 25.5, portion_scale=1.7), meal(300, 10, 40, 11, portion_scale=0.6),
+                 meal(400, 10, 40, 22)]
+        plan, _ = balance_plan({'nutrition_days': [nutrition_day([2400, 120, 240, 70], meals)]}, 0.05)
+        for balanced in plan['nutrition_days'][0]['meals']:
+            self.assertTrue(MIN_SCALE <= balanced['portion_scale'] <= MAX_SCALE, balanced)
+
+
+class PlanAdaptTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile()
+        self.plan = save_generated_plan(self.profile, generate_rule_plan(self.profile),
+                                        start_date=date.today(), end_date=date.today() + timedelta(days=6))
+        # Targets that the meals meet exactly, so only the change made by each test matters
+        self.days = list(NutritionDay.objects.filter(plan=self.plan).order_by('day_of_week'))
+        for day in self.days:
+            for field, total in zip(TARGET_FIELDS, self.totals(day)):
+                setattr(day, field, round(total))
+        NutritionDay.objects.bulk_update(self.days, list(TARGET_FIELDS))
+
+    def totals(self, day):
+        meals = Meal.objects.filter(nutrition_day=day)
+        return [sum(getattr(meal, field) for meal in meals) for field in MEAL_FIELDS]
+
+    def adapt(self, factor):
+        """Adapts the plan to targets `factor` times the current ones."""
+        targets = {
+            key: factor * sum(getattr(day, field) for day in self.days) / len(self.days)
+            for key, field in zip(('calories', 'protein_grams', 'carbs_grams', 'fats_grams'), TARGET_FIELDS)
+        }
+        targets['water_litres'] = 3.0
+        with mock.patch('rest.plan_adapt.energy_targets', return_value=targets):
+            return adapt_plan(self.plan, self.profile)
+
+    def meal_values(self):
+        return list(Meal.objects.filter(nutrition_day__plan=self.plan).order_by('pk').values_list(*MEAL_FIELDS))
+
+    def test_days_within_tolerance_keep_their_meals(self):
+        meals = self.meal_values()
+        self.assertEqual(self.adapt(1), (7, 0))
+        self.assertEqual(self.meal_values(), meals)
+
+    def test_small_changes_past_the_tolerance_rescale_the_meals(self):
+        # Within one SCALE_STEP of the current portions, but past ADAPT_TOLERANCE
+        days, meals = self.adapt(1.04)
+        self.assertGreater(meals, 0)
+        for day in NutritionDay.objects.filter(plan=self.plan):
+            with self.subTest(day=day.day_of_week):
+                calories = self.totals(day)[0]
+                self.assertLessEqual(abs(calories - day.target_calories), ADAPT_TOLERANCE * day.target_calories)
+
+    def test_unreachable_targets_keep_the_meals(self):
+        meals = self.meal_values()
+        self.assertEqual(self.adapt(3)[1], 0)
+        self.assertEqual(self.meal_values(), meals)
+
+    def test_portion_scales_stay_within_bounds(self):
+        self.adapt(1.3)
+        for scale in Meal.objects.filter(nutrition_day__plan=self.plan).values_list('portion_scale', flat=True):
+            self.assertTrue(MIN_SCALE <= scale <= MAX_SCALE, scale)
+
+    def test_replacement_plan_replaces_overlapping_plans(self):
+        later = save_generated_plan(self.profile, generate_rule_plan(self.profile),
+                                    start_date=date.today() + timedelta(days=7), end_date=date.today() + timedelta(days=13))
+        self.plan.start_date = date.today() - timedelta(days=3)
+        self.plan.end_date = date.today() + timedelta(days=3)
+        self.plan.save()
+        new_plan = save_generated_plan(self.profile, generate_rule_plan(self.profile),
+                                       start_date=date.today() + timedelta(days=1),
+                                       end_date=date.today() + timedelta(days=7), replaces=self.plan)
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.end_date, date.today())
+        self.assertFalse(FitnessPlan.objects.filter(pk=later.pk).exists())
+        self.assertEqual(set(self.profile.fitness_plans.all()), {self.plan, new_plan})
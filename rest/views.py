@@ -1,23 +1,33 @@
 # rest/views.py
 import calendar
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from rest_framework import permissions, viewsets, authentication
 from rest_framework.decorators import action, authentication_classes
 from rest_framework.response import Response
-
-from .ai_service import generate_and_save_plan_for_user
+from rest_framework.reverse import reverse
+
+from .ai_router import router_stats
+from .ai_service import gemini_usage_stats
+from .jobs import active_jobs, enqueue_generation_job
+from .plan_adapt import TARGET_PROFILE_FIELDS, adapt_active_plan
+from .plan_cache import plan_cache_stats
+from .plan_stream import open_plan_text_stream, plan_event_stream
+from .telemetry import TrackedStream, telemetry_summary
 # from ai_local.services import generate_and_save_local_plan_for_user as generate_and_save_plan_for_user
 from .serializers import (
     FitnessPlanSerializer, UserSerializer, ProfileSerializer, EmailAuthTokenSerializer,
-    WorkoutTrackingSerializer, MealTrackingSerializer, WaterTrackingSerializer
+    WorkoutTrackingSerializer, MealTrackingSerializer, WaterTrackingSerializer,
+    GenerationJobSerializer,
 )
 from .models import (
  Profile, WorkoutTracking, MealTracking, 
  Exercise, Meal, FitnessPlan, WorkoutDay, NutritionDay,
- WaterTracking,
+ WaterTracking, GenerationJob,
 )
 from django.db.models import Count, Q, Sum
+from django.http import StreamingHttpResponse
 from datetime import datetime, date, timedelta
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
@@ -163,9 +173,94 @@ class UserViewSet(viewsets.ModelViewSet):
             # partial=True allows for partial updates with PATCH
             serializer = ProfileSerializer(profile, data=request.data, partial=request.method == 'PATCH')
             serializer.is_valid(raise_exception=True)
+            previous = {field: getattr(profile, field) for field in TARGET_PROFILE_FIELDS}
             serializer.save()
+
+            # Keep the active plan's numbers in step with the profile. A new goal needs a new
+            # plan, which is only generated here with PLAN_AUTO_REGENERATE; otherwise the
+            # client confirms it with POST me/plans/adapt.
+            if settings.PLAN_AUTO_ADAPT and any(getattr(profile, field) != value for field, value in previous.items()):
+                try:
+                    adapt_active_plan(profile, regenerate=settings.PLAN_AUTO_REGENERATE)
+                except Exception as e:
+                    print(f"Error adapting the active plan: {e}")
             return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='me/plans/adapt')
+    def me_plans_adapt(self, request):
+        """
+        Recomputes the active plan's daily targets from the current profile and
+        rescales its meals to them, without generating a new plan. When the goal
+        has changed since the plan was created, a new plan is generated instead.
+        """
+        try:
+            profile = request.user.profile
+        except Profile.DoesNotExist:
+            return Response({"detail": "Profile not found. Please create a profile first."}, status=status.HTTP_404_NOT_FOUND)
+
+        result = adapt_active_plan(profile)
+        if result['plan'] is None:
+            return Response({"detail": "No active fitness plan found."}, status=status.HTTP_404_NOT_FOUND)
+
+        if result.get('goal_changed'):
+            job = result['job']
+            return Response({
+                "message": "Your goal has changed, so a new fitness plan is being generated.",
+                "job": GenerationJobSerializer(job).data,
+                "job_url": reverse('user-me-plan-job', kwargs={'job_id': job.pk}, request=request),
+            }, status=status.HTTP_202_ACCEPTED)
+
+        plan = FitnessPlan.objects.prefetch_related('workout_days__exercises', 'nutrition_days__meals').get(pk=result['plan'].pk)
+        return Response({
+            "message": f"Updated the targets of {result['days']} days and the portions of {result['meals']} meals.",
+            "plan": FitnessPlanSerializer(plan).data,
+        })
+
+    def _get_plan_start_date(self, request, profile):
+        """
+        Parses and validates the start_date of a plan generation request.
+        Returns (start_date, None) or (None, error_response).
+        """
+        start_date_str = request.data.get('start_date')
+        print(f'Start date: {start_date_str}')
+
+        if not start_date_str:
+            return None, Response({"detail": "start_date is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # Use dateutil.parser for robust ISO 8601 parsing
+            from dateutil.parser import isoparse
+            start_date = isoparse(start_date_str).date()
+        except (ValueError, ImportError):
+            # Fallback or error for invalid format
+            return None, Response({"detail": "Invalid date format. Use ISO 8601 format."}, status=status.HTTP_400_BAD_REQUEST)
+        
+
+        # check if start_date is 7 days less than today
+        if (date.today() - start_date).days > 6:
+            return None, Response({"detail": "Cannot create plan for a past date."}, status=status.HTTP_400_BAD_REQUEST)
+
+
+        # Check for overlapping plans
+        overlapping_plans = FitnessPlan.objects.filter(
+            profile=profile,
+            start_date__lte=start_date,
+            end_date__gte=start_date
+        )
+        if overlapping_plans.exists():
+            return None, Response({"detail": "A plan already exists for the selected date range."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return start_date, None
+
+    def _check_no_queued_generation(self, profile, start_date):
+        """
+        Don't start a second generation for a date that is already being generated.
+        Returns an error response, or None.
+        """
+        if active_jobs().filter(profile=profile, start_date=start_date).exists():
+            return Response({"detail": "A plan is already being generated for the selected date."}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+
     @action(detail=False, methods=['get', 'post', 'delete'], url_path='me/plans')
     def me_plans(self, request):
         """
@@ -195,47 +290,30 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
         
         if request.method == 'POST':
-            start_date_str = request.data.get('start_date')
-            print(f'Start date: {start_date_str}')
-
-            if not start_date_str:
-                return Response({"detail": "start_date is required."}, status=status.HTTP_400_BAD_REQUEST)
-
-            try:
-                # Use dateutil.parser for robust ISO 8601 parsing
-                from dateutil.parser import isoparse
-                start_date = isoparse(start_date_str).date()
-            except (ValueError, ImportError):
-                # Fallback or error for invalid format
-                return Response({"detail": "Invalid date format. Use ISO 8601 format."}, status=status.HTTP_400_BAD_REQUEST)
-            
-
-            # check if start_date is 7 days less than today
-            if (date.today() - start_date).days > 6:
-                return Response({"detail": "Cannot create plan for a past date."}, status=status.HTTP_400_BAD_REQUEST)
-
-
-            # Check for overlapping plans
-            overlapping_plans = FitnessPlan.objects.filter(
-                profile=profile,
-                start_date__lte=start_date,
-                end_date__gte=start_date
-            )
-            if overlapping_plans.exists():
-                return Response({"detail": "A plan already exists for the selected date range."}, status=status.HTTP_400_BAD_REQUEST)
-            
-
-            # IMPORTANT: This is a long-running task.
-            # In production, this should be offloaded to a background worker (e.g., Celery).
-            plan = generate_and_save_plan_for_user(profile, start_date)
-            if plan:
-                serializer = FitnessPlanSerializer(plan)
-                return Response({
-                    "message": "Fitness plan generated successfully.",
-                    "plan": serializer.data
-                }, status=status.HTTP_201_CREATED)
-            else:
-                return Response({"detail": "Failed to generate fitness plan."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            start_date, error_response = self._get_plan_start_date(request, profile)
+            if error_response:
+                return error_response
+
+            error_response = self._check_no_queued_generation(profile, start_date)
+            if error_response:
+                return error_response
+
+            # Fail fast when plans come from the local model and its queue is already full
+            if settings.AI_PRIMARY_BACKEND == 'local':
+                from ai_local.services import get_inference_scheduler
+                scheduler = get_inference_scheduler()
+                if scheduler.is_full():
+                    return Response({"detail": "The local model is busy. Please try again shortly."},
+                                    status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(scheduler.retry_after())})
+
+            # Generation is a long-running task, so it is handed to a background worker
+            # and the client polls the job until the plan is ready.
+            job = enqueue_generation_job(profile, start_date)
+            return Response({
+                "message": "Fitness plan generation started.",
+                "job": GenerationJobSerializer(job).data,
+                "job_url": reverse('user-me-plan-job', kwargs={'job_id': job.pk}, request=request),
+            }, status=status.HTTP_202_ACCEPTED)
             
         if request.method == 'DELETE':
             # This action is not typically used for listing endpoints, but if needed:
@@ -252,6 +330,63 @@ class UserViewSet(viewsets.ModelViewSet):
             except Exception as e:
                 return Response({'detail': "Internal Server Error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
+    @action(detail=False, methods=['post'], url_path='me/plans/stream')
+    def me_plans_stream(self, request):
+        """
+        POST: Generate a new fitness plan and stream it back as Server-Sent Events.
+        A `workout_day` or `nutrition_day` event is sent as soon as each day has been
+        generated, followed by a final `plan` event once the plan has been saved.
+        """
+        try:
+            profile = request.user.profile
+        except Profile.DoesNotExist:
+            return Response({"detail": "Profile not found. Please create a profile first."}, status=status.HTTP_404_NOT_FOUND)
+
+        start_date, error_response = self._get_plan_start_date(request, profile)
+        if error_response:
+            return error_response
+        error_response = self._check_no_queued_generation(profile, start_date)
+        if error_response:
+            return error_response
+
+        stream = TrackedStream(settings.PLAN_STREAM_BACKEND)
+        try:
+            prompt, chunks, model_version = stream.run(open_plan_text_stream, profile, start_date)
+        except Exception as e:
+            if settings.PLAN_STREAM_BACKEND == 'local':
+                # ai_local is optional, so it is only imported when plans are streamed from it
+                from ai_local.scheduler import InferenceQueueFull
+                if isinstance(e, InferenceQueueFull):
+                    return Response({"detail": "The local model is busy. Please try again shortly."},
+                                    status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(e.retry_after)})
+            print(f"Error starting plan stream: {e}")
+            return Response({"detail": "Failed to generate fitness plan."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        response = StreamingHttpResponse(
+            plan_event_stream(profile, start_date, prompt, chunks, lambda plan: FitnessPlanSerializer(plan).data,
+                              model_version=model_version, telemetry=stream),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the events
+        return response
+
+    @action(detail=False, methods=['get'], url_path=r'me/plans/jobs/(?P<job_id>\d+)', url_name='me-plan-job')
+    def me_plan_job(self, request, job_id=None):
+        """
+        GET: Report the state of a plan generation job and, once it has
+        succeeded, the generated fitness plan.
+        """
+        try:
+            job = GenerationJob.objects.select_related('plan').get(pk=job_id, profile__user=request.user)
+        except GenerationJob.DoesNotExist:
+            return Response({"detail": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        data = GenerationJobSerializer(job).data
+        if job.status == GenerationJob.STATUS_SUCCEEDED and job.plan:
+            data['plan'] = FitnessPlanSerializer(job.plan).data
+        return Response(data)
+
     @action(detail=False, methods=['get', 'post', 'delete'], url_path='me/workout-tracking')
     def workout_tracking(self, request):
         """
@@ -513,6 +648,55 @@ class StatusView(APIView):
         return Response({"status": "ok"}, status=status.HTTP_200_OK)
 
 
+class AiStatsView(APIView):
+    """
+    Admin-only view reporting how the AI plan generation pipeline is performing.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        """
+        Returns the plan template cache, backend routing and Gemini usage
+        statistics, and per day and backend generation latency and token
+        percentiles for the last `days` days (default 7).
+        """
+        try:
+            days = int(request.query_params.get('days', 7))
+        except ValueError:
+            return Response({"detail": "days must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "plan_cache": plan_cache_stats(),
+            "router": router_stats(),
+            "gemini": gemini_usage_stats(),
+            "generations": telemetry_summary(days),
+        }, status=status.HTTP_200_OK)
+
+
+class ReloadLocalModelView(APIView):
+    """
+    Admin-only view that hot-swaps the local model without a restart.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        """
+        Starts loading the model file again (or `model_path`, the name of a
+        .gguf file in LOCAL_MODELS_DIR, if given) in the background.
+        Generations already running finish on the old model.
+        """
+        from ai_local.services import reload_local_models, current_local_model_version
+
+        try:
+            started = reload_local_models(request.data.get('model_path') or None)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "reload_started": started,
+            "detail": "Reloading the local model." if started else "A reload is already in progress or the local model is unavailable.",
+            "current_model_version": current_local_model_version(),
+        }, status=status.HTTP_202_ACCEPTED if started else status.HTTP_409_CONFLICT)
+
+
 class GoogleLogin(SocialLoginView):
     adapter_class = GoogleOAuth2Adapter
     # callback_url = 'http://localhost:3000' # frontend url